@@ -3,7 +3,7 @@ Incremental file assignment against an existing faiss cluster index.
 
 Pipeline per new file:
   1. Extract identity string via ExtractorRouter
-  2. Embed via EmbeddingAgent (model stays resident — don't reload)
+  2. Embed via EmbeddingAgent (shared registry encoder — never a second load)
   3. L2-normalise → query faiss IndexFlatIP for k=5 nearest neighbours
   4. Gate on top-1 cosine similarity vs threshold
   5. Majority-vote the k neighbours' cluster labels
@@ -26,7 +26,28 @@ from ..core.constants import FILE_TYPE_MAP
 from ..core.models import FileMeta
 from ..agents.extractor_router import ExtractorRouter
 from ..agents.embedding_agent import EmbeddingAgent
-from ..agents.index_manager import load_index, append_to_index, index_exists, normalize, SMARTSORT_DIR
+from ..agents.model_registry import DEFAULT_MODEL
+from ..agents.index_manager import (
+    build_index, load_index, append_to_index, index_exists, normalize, SMARTSORT_DIR,
+)
+
+_QUERY_CHUNK = 4096   # rows per faiss search in _query_index_batch
+
+
+def file_meta(p: Path) -> FileMeta:
+    """FileMeta for a single file on disk, as the daemon sees it."""
+    ext = p.suffix.lower()
+    stat = p.stat()
+    return FileMeta(
+        file_path=str(p),
+        file_name=p.name,
+        extension=ext,
+        detected_type=FILE_TYPE_MAP.get(ext, "unknown"),
+        size_kb=round(stat.st_size / 1024, 2),
+        created_at=datetime.fromtimestamp(stat.st_ctime).isoformat(),
+        modified_at=datetime.fromtimestamp(stat.st_mtime).isoformat(),
+        status="pending",
+    )
 
 
 @dataclass
@@ -45,7 +66,7 @@ class AssignmentAgent:
 
     def __init__(
         self,
-        model_name: str = "all-MiniLM-L6-v2",
+        model_name: str = DEFAULT_MODEL,
         threshold: float = 0.65,
         k_neighbours: int = 5,
         index_dir: Optional[Path] = None,
@@ -66,6 +87,32 @@ class AssignmentAgent:
 
         self._load_index()
 
+    @classmethod
+    def from_clusters(
+        cls,
+        embeddings: np.ndarray,
+        labels: np.ndarray,
+        file_paths: List[str],
+        cluster_folders: Dict[int, str],
+        threshold: float = 0.65,
+        k_neighbours: int = 5,
+    ) -> "AssignmentAgent":
+        """
+        Agent over an in-memory index built from a fresh clustering run.
+
+        Nothing is read from or written to disk and no model is loaded — callers
+        that already hold embeddings use _query_index_batch() directly.
+        """
+        agent = cls.__new__(cls)
+        agent.threshold = threshold
+        agent.k = k_neighbours
+        agent.index_dir = None
+        agent.extractor = None
+        agent.embedder = None
+        agent.index, agent.index_meta, agent.centroids = build_index(embeddings, labels, file_paths)
+        agent.cluster_folders = dict(cluster_folders)
+        return agent
+
     # ── Public API ────────────────────────────────────────────────────────────
 
     def assign(self, file_path: str) -> Optional[AssignmentResult]:
@@ -81,19 +128,7 @@ class AssignmentAgent:
         if not p.exists():
             return None
 
-        ext = p.suffix.lower()
-        fmeta = FileMeta(
-            file_path=str(p),
-            file_name=p.name,
-            extension=ext,
-            detected_type=FILE_TYPE_MAP.get(ext, "unknown"),
-            size_kb=round(p.stat().st_size / 1024, 2),
-            created_at=datetime.fromtimestamp(p.stat().st_ctime).isoformat(),
-            modified_at=datetime.fromtimestamp(p.stat().st_mtime).isoformat(),
-            status="pending",
-        )
-
-        content = self.extractor.route(fmeta)
+        content = self.extractor.route(file_meta(p))
         if content.status != "success":
             return None
 
@@ -114,7 +149,7 @@ class AssignmentAgent:
         return result
 
     def reload_index(self) -> None:
-        """Reload from disk — call this after a full re-cluster."""
+        """Reload from disk — call this after a re-cluster rewrote the index."""
         self._load_index()
 
     # ── Index query (also used directly in tests) ─────────────────────────────
@@ -124,42 +159,60 @@ class AssignmentAgent:
         Query the faiss index with a pre-normalised (1, D) float32 vector.
         Returns AssignmentResult or None.
         """
+        return self._query_index_batch(normed_vec)[0]
+
+    def _query_index_batch(self, normed: np.ndarray) -> List[Optional[AssignmentResult]]:
+        """
+        _query_index() for every row of a pre-normalised (M, D) float32 matrix.
+
+        One faiss search per chunk of rows; the k-neighbour vote is vectorised
+        across the chunk.
+        """
+        normed = np.ascontiguousarray(normed, dtype=np.float32).reshape(-1, normed.shape[-1])
         if self.index is None:
-            return None
+            return [None] * len(normed)
         k = min(self.k, self.index.ntotal)
         if k == 0:
-            return None
-
-        similarities, faiss_indices = self.index.search(normed_vec, k)
-        top_sim = float(similarities[0][0])
-
-        if top_sim < self.threshold:
-            return None
-
-        # Majority vote: group k neighbours by cluster_id
-        votes: Dict[int, List[float]] = {}
-        for sim, idx in zip(similarities[0], faiss_indices[0]):
-            if idx == -1:
-                continue
-            cid = self.index_meta[idx]["cluster_id"]
-            if cid == -1:   # noise label — skip
+            return [None] * len(normed)
+
+        meta_labels = np.array([m["cluster_id"] for m in self.index_meta] + [-1], dtype=np.int64)
+        results: List[Optional[AssignmentResult]] = []
+        for start in range(0, len(normed), _QUERY_CHUNK):
+            similarities, faiss_indices = self.index.search(normed[start:start + _QUERY_CHUNK], k)
+            # faiss pads missing neighbours with -1, which lands on the trailing noise label
+            neighbour_cids = meta_labels[faiss_indices]
+            results.extend(self._vote(similarities, neighbour_cids))
+        return results
+
+    def _vote(self, similarities: np.ndarray, neighbour_cids: np.ndarray) -> List[Optional[AssignmentResult]]:
+        """Majority vote per row over (M, k) neighbour similarities and cluster ids."""
+        k = neighbour_cids.shape[1]
+        # Each neighbour scores its own cluster: how many of the k share it, and their total sim
+        same = neighbour_cids[:, :, None] == neighbour_cids[:, None, :]
+        votes = same.sum(axis=2)
+        sim_sums = (same * similarities[:, None, :]).sum(axis=2)
+        votes = np.where(neighbour_cids == -1, 0, votes)   # noise label — skip
+
+        # Winning cluster: most votes, ties broken by total similarity (∈ [-k, k])
+        key = votes + (sim_sums + k) / (2 * k + 1)
+        best = np.argmax(key, axis=1)
+        rows = np.arange(len(best))
+        best_votes = votes[rows, best]
+        ok = (similarities[:, 0] >= self.threshold) & (best_votes > 0)
+
+        out: List[Optional[AssignmentResult]] = []
+        for i in range(len(best)):
+            if not ok[i]:
+                out.append(None)
                 continue
-            votes.setdefault(cid, []).append(float(sim))
-
-        if not votes:
-            return None
-
-        # Winning cluster: most votes, ties broken by total similarity
-        winning_cid = max(votes, key=lambda c: (len(votes[c]), sum(votes[c])))
-        mean_sim = sum(votes[winning_cid]) / len(votes[winning_cid])
-        folder_path = self.cluster_folders.get(winning_cid, "")
-
-        return AssignmentResult(
-            cluster_id=winning_cid,
-            folder_path=folder_path,
-            similarity=mean_sim,
-            neighbor_votes=len(votes[winning_cid]),
-        )
+            cid = int(neighbour_cids[i, best[i]])
+            out.append(AssignmentResult(
+                cluster_id=cid,
+                folder_path=self.cluster_folders.get(cid, ""),
+                similarity=float(sim_sums[i, best[i]] / best_votes[i]),
+                neighbor_votes=int(best_votes[i]),
+            ))
+        return out
 
     # ── Internals ─────────────────────────────────────────────────────────────
 
@@ -0,0 +1,95 @@
+"""
+Stable cluster IDs across re-sorts.
+
+ClusteringAgent numbers clusters 0..C-1 on every run, so a folder whose
+members barely changed would otherwise come back with a new ID and a new
+name. Here each new cluster is matched to at most one cluster of the previous
+sort (read back from the persistent index, see index_manager) by optimal
+bipartite assignment on the cosine similarity of their centroids.
+
+Matching is by centroid only. Ingestion is non-recursive, so a re-sort only
+sees the loose files in the folder, never the ones an earlier sort moved
+into cluster folders; the two sides never share a member to compare. A pair
+is eligible only if its centroids are at least min_similarity cosine-similar,
+the same bar merge_similar_clusters uses for "one cluster". A matched
+cluster takes the old ID and with it the folder; every other cluster gets a
+fresh ID above all IDs the index has used, so it can never be mistaken for a
+cluster of some other folder.
+"""
+
+from __future__ import annotations
+
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from .index_manager import index_exists, load_index, normalize
+
+MIN_CENTROID_SIMILARITY = 0.85
+
+
+@dataclass
+class PreviousClusters:
+    centroids: Dict[int, np.ndarray] = field(default_factory=dict)
+    folders: Dict[int, str] = field(default_factory=dict)
+    next_id: int = 0
+
+
+def previous_clusters(root: Path, index_dir: Optional[Path] = None) -> PreviousClusters:
+    """The last sort's clusters whose folders live under root (empty without an index)."""
+    if not index_exists(index_dir):
+        return PreviousClusters()
+    try:
+        _, _, centroids, folders = load_index(index_dir)
+    except Exception as e:
+        print(f"[ClusterIdentity] Could not read the previous index: {e}", file=sys.stderr)
+        return PreviousClusters()
+
+    root = Path(root).resolve()
+    previous = PreviousClusters(next_id=max([*folders, *centroids, -1]) + 1)
+    for cid, folder in folders.items():
+        if cid in centroids and Path(folder).resolve().parent == root:
+            previous.folders[cid] = folder
+            previous.centroids[cid] = np.asarray(centroids[cid], dtype=np.float32)
+    return previous
+
+
+def match_clusters(
+    centroids: Dict[int, np.ndarray],
+    previous: PreviousClusters,
+    min_similarity: float = MIN_CENTROID_SIMILARITY,
+) -> Dict[int, int]:
+    """{new cluster ID: stable ID} for every cluster in centroids (noise excluded).
+
+    centroids describe the new clusters and need not be normalised.
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    new_ids = sorted(cid for cid in centroids if cid != -1)
+    old_ids = sorted(previous.folders)
+    mapping: Dict[int, int] = {}
+
+    if new_ids and old_ids:
+        new_c = normalize(np.array([centroids[cid] for cid in new_ids], dtype=np.float32))
+        old_c = normalize(np.array([previous.centroids[cid] for cid in old_ids], dtype=np.float32))
+        similarity = new_c @ old_c.T
+
+        eligible = similarity >= min_similarity
+        rows, cols = linear_sum_assignment(np.where(eligible, -similarity, 1e6))
+        for i, j in zip(rows, cols):
+            if eligible[i, j]:
+                mapping[new_ids[i]] = old_ids[j]
+
+    next_id = max(previous.next_id, 0)
+    for cid in new_ids:
+        if cid not in mapping:
+            mapping[cid] = next_id
+            next_id += 1
+
+    matched = len(new_ids) - (next_id - max(previous.next_id, 0))
+    print(f"[ClusterIdentity] {matched} of {len(new_ids)} clusters kept their ID "
+          f"({len(old_ids)} in the previous sort)", file=sys.stderr)
+    return mapping
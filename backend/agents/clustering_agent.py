@@ -1,197 +1,541 @@
 import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
-from sklearn.cluster import AgglomerativeClustering
-from sklearn.metrics import calinski_harabasz_score
-from sklearn.metrics.pairwise import cosine_distances
+from scipy.cluster.hierarchy import linkage
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 
+from ..core.file_table import FileTable
 from ..core.models import EmbeddedFile, ClusteredFile
 from ..core.utils import log_error
 from .identity_utils import extract_prefixed_doctype
+from .distance_tiles import DISTANCE_BUDGET_MB, CosineDistances, prim_mst
+from .index_manager import normalize
+from .reducer import EmbeddingReducer
+
+# Up to this many points HDBSCAN runs over a blocked float32 cosine matrix
+# (distance_tiles), kept in RAM within distance_budget_mb and spilled to a
+# memory-mapped scratch file beyond it; above it, on unit vectors with a
+# Euclidean ball tree. The matrix path is far faster (20k points: ~8 s against
+# ~220 s) and at 20k its scratch file is 1.6 GB of disk, not RAM.
+PRECOMPUTED_MAX_N = 20000
+
+# The agglomerative fallback's linkage holds N·(N−1)/2 float64 distances;
+# above this many points it is built on a sample.
+FALLBACK_MAX_N = 5000
+
+# Above this many points cluster() first compresses the matrix into
+# MICRO_CLUSTERS mini-batch k-means centres, clusters those, and hands each
+# file its centre's label.
+SUMMARIZE_ABOVE_N = 50000
+MICRO_CLUSTERS = 2000
+
+# Doctype partitioning: partitions are clustered in worker processes once the
+# run is big enough to pay for starting them, and an untyped cluster joins
+# the typed cluster whose centroid is at least this cosine-similar.
+PARALLEL_MIN_N = 2000
+UNTYPED_MERGE_SIMILARITY = 0.8
+
+
+# "hdbscan": exact density clustering (with the large-N paths above)
+# "knn":     HDBSCAN over a faiss approximate kNN graph (agents/knn_graph.py)
+BACKENDS = ("hdbscan", "knn")
+
 
 class SemanticClusterer:
-    def __init__(self, fallback_k_range=(2, 10), min_cluster_size=2):
+    def __init__(self, fallback_k_range=(2, 10), min_cluster_size=2,
+                 precomputed_max_n=PRECOMPUTED_MAX_N, fallback_max_n=FALLBACK_MAX_N,
+                 summarize_above_n=SUMMARIZE_ABOVE_N, micro_clusters=MICRO_CLUSTERS,
+                 backend="hdbscan", knn_k=15,
+                 distance_budget_mb=DISTANCE_BUDGET_MB, scratch_dir=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown clustering backend {backend!r} (expected one of {BACKENDS})")
+        self.backend = backend
+        self.knn_k = knn_k
         self.fallback_k_range = fallback_k_range
         self.min_cluster_size = min_cluster_size
+        self.precomputed_max_n = precomputed_max_n
+        self.fallback_max_n = fallback_max_n
+        self.summarize_above_n = summarize_above_n
+        self.micro_clusters = micro_clusters
+        self.distance_budget_mb = distance_budget_mb
+        self.scratch_dir = scratch_dir
+
+    def _hdbscan(self, X: np.ndarray) -> np.ndarray:
+        from .knn_graph import mst_labels, mst_labels_available
+        if len(X) <= self.precomputed_max_n:
+            if mst_labels_available():
+                # Same result as HDBSCAN(metric='precomputed') on cosine distances,
+                # but the matrix is float32 tiles, in RAM or on disk per the budget,
+                # and Prim's reads it one row at a time.
+                with CosineDistances(X, self.distance_budget_mb, self.scratch_dir) as dist:
+                    if dist.spilled:
+                        print(f"  {len(X)} points: distance matrix spilled to {dist.path}", file=sys.stderr)
+                    edges = prim_mst(dist)
+                return mst_labels(edges, self.min_cluster_size)
+            print("  hdbscan's tree internals are missing from this release; "
+                  "using the ball-tree path", file=sys.stderr)
+
+        return _balltree_hdbscan(X, self.min_cluster_size)
 
     def cluster(self, X: np.ndarray) -> np.ndarray:
-        print("Trying HDBSCAN clustering...", file=sys.stderr)
+        if self.backend == "knn":
+            return self._cluster(X)
+        if len(X) > self.summarize_above_n and self.micro_clusters < len(X):
+            return self._summarize_then_cluster(X)
+        return self._cluster(X)
+
+    def _summarize_then_cluster(self, X: np.ndarray) -> np.ndarray:
+        """Cluster mini-batch k-means centres instead of every point.
+
+        Memory beyond X is O(micro_clusters · D) and the k-means pass is linear
+        in N, so whole-drive sorts stay bounded. The centres are clustered as
+        usual; since each one stands for many files, a cluster whose centres
+        carry fewer than min_cluster_size files in total becomes noise. Members
+        of a noise centre are noise.
+        """
+        from sklearn.cluster import MiniBatchKMeans
+
+        unit = normalize(np.asarray(X, dtype=np.float32))
+        print(f"  {len(X)} points: summarizing into {self.micro_clusters} micro-clusters", file=sys.stderr)
+        km = MiniBatchKMeans(
+            n_clusters=self.micro_clusters, batch_size=4096, n_init=1, random_state=0,
+        ).fit(unit)
+        micro = km.labels_
+        weights = np.bincount(micro, minlength=self.micro_clusters)
+        used = np.flatnonzero(weights)  # mini-batch k-means can leave centres empty
+
+        centre_labels = self._cluster(normalize(km.cluster_centers_[used]))
+        kept = centre_labels >= 0
+        sizes = np.bincount(centre_labels[kept], weights=weights[used][kept])
+        centre_labels[np.isin(centre_labels, np.flatnonzero(sizes < self.min_cluster_size))] = -1
+
+        lookup = np.full(self.micro_clusters, -1, dtype=np.int64)
+        lookup[used] = centre_labels
+        return lookup[micro]
+
+    def _knn(self, X: np.ndarray) -> np.ndarray:
+        from .knn_graph import knn_hdbscan
+        return knn_hdbscan(X, k=self.knn_k, min_cluster_size=self.min_cluster_size)
+
+    def _cluster(self, X: np.ndarray) -> np.ndarray:
+        name, method = ("kNN graph", self._knn) if self.backend == "knn" else ("HDBSCAN", self._hdbscan)
+        print(f"Trying {name} clustering...", file=sys.stderr)
         try:
-            # Precompute cosine distance matrix
-            distance_matrix = cosine_distances(X)
-
-            import hdbscan
-            hdb = hdbscan.HDBSCAN(metric='precomputed', min_cluster_size=self.min_cluster_size, min_samples=1)
-            labels = hdb.fit_predict(distance_matrix)
+            labels = method(X)
 
             n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
-            print(f"  HDBSCAN found {n_clusters} clusters", file=sys.stderr)
+            print(f"  {name} found {n_clusters} clusters", file=sys.stderr)
 
             if n_clusters >= 2:
                 return labels
             else:
-                print("  HDBSCAN found fewer than 2 clusters. Falling back to Agglomerative clustering.", file=sys.stderr)
+                print(f"  {name} found fewer than 2 clusters. Falling back to Agglomerative clustering.", file=sys.stderr)
         except Exception as e:
-            print(f"  HDBSCAN failed: {e}", file=sys.stderr)
-            log_error(f"[SemanticClusterer] HDBSCAN failed: {e}")
+            print(f"  {name} failed: {e}", file=sys.stderr)
+            log_error(f"[SemanticClusterer] {name} failed: {e}")
 
         return self._fallback_agglomerative(X)
 
 
     def _fallback_agglomerative(self, X: np.ndarray) -> np.ndarray:
-        best_score = -1
-        best_k = None
-        best_labels = None
-
-        print(f"Testing fallback cluster counts from {self.fallback_k_range[0]} to {min(self.fallback_k_range[1], len(X))}", file=sys.stderr)
-
-        for k in range(self.fallback_k_range[0], min(self.fallback_k_range[1], len(X)) + 1):
-            try:
-                model = AgglomerativeClustering(n_clusters=k, metric='cosine', linkage='average')
-                labels = model.fit_predict(X)
-
-                if len(set(labels)) == 1:
-                    print(f"  Skipped k={k} (only one cluster)", file=sys.stderr)
-                    continue
+        """Average-linkage cosine clustering at the k with the best Calinski-Harabasz score.
+
+        The dendrogram is built once and every candidate k is a cut of it, so
+        the whole k range costs one linkage plus one pass over its merges.
+        Above fallback_max_n points the tree is built on a random sample and
+        the remaining points join the cluster with the nearest centroid.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        sample = None
+        if len(X) > self.fallback_max_n:
+            sample = np.sort(np.random.default_rng(0).choice(len(X), self.fallback_max_n, replace=False))
+            print(f"  Building the fallback tree on {len(sample)} of {len(X)} points", file=sys.stderr)
+        Xs = X if sample is None else X[sample]
+
+        # k = n (every point alone) has no within-cluster scatter to score
+        k_lo, k_hi = self.fallback_k_range[0], min(self.fallback_k_range[1], len(Xs) - 1)
+        print(f"Testing fallback cluster counts from {k_lo} to {k_hi}", file=sys.stderr)
+        ks = np.arange(k_lo, k_hi + 1)
+        if not len(ks):
+            raise ValueError("Could not determine optimal clustering with fallback.")
 
-                score = calinski_harabasz_score(X, labels)
+        Z = linkage(Xs, method='average', metric='cosine')
+        scores = _linkage_ch_scores(Xs, Z, ks)
+        for k, score in zip(ks, scores):
+            if np.isnan(score):
+                print(f"  Skipped k={k} (no within-cluster scatter)", file=sys.stderr)
+            else:
                 print(f"  k={k} → Calinski-Harabasz Score: {score:.2f}", file=sys.stderr)
-
-                if score > best_score:
-                    best_score = score
-                    best_k = k
-                    best_labels = labels
-            except Exception as e:
-                print(f"  Error for k={k}: {e}", file=sys.stderr)
-                log_error(f"[SemanticClusterer] Agglomerative error for k={k}: {e}")
-
-        if best_labels is None:
+        if not np.isfinite(scores).any():
             raise ValueError("Could not determine optimal clustering with fallback.")
 
+        best = int(np.nanargmax(scores))
+        best_k, best_score = int(ks[best]), float(scores[best])
+        labels = _cut_linkage(Z, best_k)
         print(f"Best k selected: {best_k} with Calinski-Harabasz score {best_score:.2f}", file=sys.stderr)
-        return best_labels
+
+        if sample is None:
+            return labels
+        # Everyone outside the sample joins the nearest sample-cluster centroid
+        centroids = np.zeros((best_k, X.shape[1]))
+        np.add.at(centroids, labels, Xs)
+        rest = np.setdiff1d(np.arange(len(X)), sample)
+        full = np.empty(len(X), dtype=labels.dtype)
+        full[sample] = labels
+        full[rest] = np.argmax(normalize(X[rest]) @ normalize(centroids).T, axis=1)
+        return full
+
+
+def _balltree_hdbscan(X: np.ndarray, min_cluster_size: int, min_samples: int = 1) -> np.ndarray:
+    """HDBSCAN on cosine distances through hdbscan's public API only."""
+    import hdbscan
+
+    # On the unit sphere ||a - b||² = 2·(1 - cos(a, b)), so Euclidean distance
+    # orders neighbours exactly as cosine distance does — and a ball tree
+    # can answer it without ever materialising the pairwise matrix.
+    # Prim's over the ball tree beat Boruvka ~2x on 384-d sentence embeddings.
+    print(f"  {len(X)} points: Euclidean HDBSCAN on normalized vectors (ball tree)", file=sys.stderr)
+    unit = normalize(np.asarray(X, dtype=np.float64))
+    hdb = hdbscan.HDBSCAN(
+        metric='euclidean', algorithm='prims_balltree',
+        min_cluster_size=min_cluster_size, min_samples=min_samples,
+    )
+    return hdb.fit_predict(unit)
+
+
+def _linkage_ch_scores(X: np.ndarray, Z: np.ndarray, ks: np.ndarray) -> np.ndarray:
+    """Calinski-Harabasz score of every cut of linkage Z with k clusters, for each k in ks.
+
+    Within-cluster scatter only grows as the tree merges: joining nodes a and b
+    (n points, coordinate sum S each) adds ‖S_a‖²/n_a + ‖S_b‖²/n_b − ‖S_ab‖²/n_ab.
+    One walk up the merges gives W after every merge, the cut with k clusters
+    is the one after n − k merges, and B = T − W. A cut with no within-cluster
+    scatter (k = n, or duplicate points) has no score and comes back NaN.
+    """
+    n = len(X)
+    sums = np.empty((2 * n - 1, X.shape[1]))
+    sums[:n] = X
+    sizes = np.ones(2 * n - 1)
+    left, right = Z[:, 0].astype(np.intp), Z[:, 1].astype(np.intp)
+    for m in range(n - 1):
+        sums[n + m] = sums[left[m]] + sums[right[m]]
+        sizes[n + m] = sizes[left[m]] + sizes[right[m]]
+    q = np.einsum('ij,ij->i', sums, sums) / sizes      # ‖S‖²/n per node
+    within = np.concatenate(([0.0], np.cumsum(q[left] + q[right] - q[n:])))  # W after m merges
+    total = float(np.einsum('ij,ij->', X, X) - q[-1])
+
+    W = within[n - ks]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = (total - W) * (n - ks) / (W * (ks - 1))
+    return np.where(W > 0, scores, np.nan)
+
+
+def _cut_linkage(Z: np.ndarray, k: int) -> np.ndarray:
+    """Flat labels 0..k-1 of linkage Z after its first n − k merges."""
+    n = len(Z) + 1
+    parent = np.arange(2 * n - 1)
+    merges = n - k
+    parent[Z[:merges, 0].astype(np.intp)] = n + np.arange(merges)
+    parent[Z[:merges, 1].astype(np.intp)] = n + np.arange(merges)
+    while True:  # pointer jumping to each leaf's root
+        jumped = parent[parent]
+        if np.array_equal(jumped, parent):
+            break
+        parent = jumped
+    return np.unique(parent[:n], return_inverse=True)[1]
+
+
+def _cluster_partition(clusterer: SemanticClusterer, X: np.ndarray) -> np.ndarray:
+    """One doctype partition — module-level so a process pool can run it."""
+    if len(X) < 2:
+        return np.full(len(X), -1, dtype=np.int64)
+    try:
+        return np.asarray(clusterer.cluster(X), dtype=np.int64)
+    except Exception as e:
+        log_error(f"[ClusteringAgent] Partition of {len(X)} files failed: {e}")
+        return np.full(len(X), -1, dtype=np.int64)
+
+
+def _merge_untyped(X: np.ndarray, labels: np.ndarray, untyped: np.ndarray, threshold: float) -> np.ndarray:
+    """Fold each untyped cluster into the most similar typed cluster above threshold.
+
+    Typed clusters never merge with each other: their partitions are already
+    the doctype split. Untyped noise stays noise.
+    """
+    labels = labels.copy()
+    typed_ids = np.unique(labels[~untyped & (labels != -1)])
+    untyped_ids = np.unique(labels[untyped & (labels != -1)])
+    if not len(typed_ids) or not len(untyped_ids):
+        return labels
+
+    def centroids(ids):
+        rows = np.isin(labels, ids)
+        out = np.zeros((len(ids), X.shape[1]))
+        np.add.at(out, np.searchsorted(ids, labels[rows]), X[rows])
+        return normalize(out)
+
+    sims = centroids(untyped_ids) @ centroids(typed_ids).T
+    best = sims.argmax(axis=1)
+    for uid, j, sim in zip(untyped_ids, best, sims[np.arange(len(best)), best]):
+        if sim >= threshold:
+            labels[labels == uid] = typed_ids[j]
+    return labels
+
+
+def _split_by_doctype(doctypes: list, labels: np.ndarray) -> np.ndarray:
+    """Split clusters whose members carry more than one identity doctype prefix.
+
+    Members without a prefix follow the cluster's dominant doctype. The
+    alphabetically first doctype keeps the original label; each other doctype
+    gets a fresh one.
+    """
+    labels = np.asarray(labels)
+    refined = labels.copy()
+    if not len(labels):
+        return refined
+
+    vocab = sorted({d for d in doctypes if d})
+    if len(vocab) <= 1:
+        return refined
+    code_of = {d: c for c, d in enumerate(vocab)}
+    # -1 = no prefix; codes ascend alphabetically so sort order matches the old loop
+    codes = np.array([code_of.get(d, -1) if d else -1 for d in doctypes], dtype=np.int32)
+
+    next_label = int(labels.max()) + 1
+    cluster_ids = np.unique(labels[labels != -1])
+    typed = codes >= 0
+    # (cluster, doctype) member counts in one pass
+    cidx = np.searchsorted(cluster_ids, labels[typed & (labels != -1)])
+    counts = np.zeros((len(cluster_ids), len(vocab)), dtype=np.int64)
+    np.add.at(counts, (cidx, codes[typed & (labels != -1)]), 1)
+
+    for ci in np.flatnonzero((counts > 0).sum(axis=1) > 1):
+        cluster_id = cluster_ids[ci]
+        members = np.flatnonzero(labels == cluster_id)
+        member_codes = codes[members]
+        tied = np.flatnonzero(counts[ci] == counts[ci].max())
+        # ties go to the doctype seen first among the members
+        dominant = int(tied[np.argmin([np.argmax(member_codes == c) for c in tied])])
+        member_codes = np.where(member_codes == -1, dominant, member_codes)
+
+        present = np.flatnonzero(counts[ci])
+        for code in present[1:]:
+            refined[members[member_codes == code]] = next_label
+            next_label += 1
+
+    return refined
 
 
 class ClusteringAgent:
-    def __init__(self, fallback_k_range=(2, 10), min_cluster_size=2):
-        from sentence_transformers import SentenceTransformer
-        self.name_embedder = SentenceTransformer("all-MiniLM-L6-v2")
+    def __init__(self, fallback_k_range=(2, 10), min_cluster_size=2,
+                 precomputed_max_n=PRECOMPUTED_MAX_N, fallback_max_n=FALLBACK_MAX_N,
+                 summarize_above_n=SUMMARIZE_ABOVE_N, micro_clusters=MICRO_CLUSTERS,
+                 reducer: EmbeddingReducer | None = None,
+                 partition_by_doctype: bool = False, max_workers: int | None = None,
+                 backend: str = "hdbscan",
+                 distance_budget_mb: float = DISTANCE_BUDGET_MB, scratch_dir=None):
         self.clusterer = SemanticClusterer(
             fallback_k_range=fallback_k_range,
-            min_cluster_size=min_cluster_size
+            min_cluster_size=min_cluster_size,
+            precomputed_max_n=precomputed_max_n,
+            fallback_max_n=fallback_max_n,
+            summarize_above_n=summarize_above_n,
+            micro_clusters=micro_clusters,
+            backend=backend,
+            distance_budget_mb=distance_budget_mb,
+            scratch_dir=scratch_dir,
         )
+        # Fitted on each cluster_table() call; persist it with the index
+        self.reducer = reducer
+        self.partition_by_doctype = partition_by_doctype
+        self.max_workers = max_workers
 
     def cluster(self, embedded_files: list[EmbeddedFile]) -> list[ClusteredFile]:
         valid_files = [f for f in embedded_files if f.status == "embedded" and f.embedding]
+        table = FileTable.from_embedded(valid_files)
+        if not self.cluster_table(table):
+            return []
+        return table.clustered_files()
+
+    def cluster_table(self, table: FileTable, rows: np.ndarray | None = None) -> bool:
+        """Cluster the embedded rows of a FileTable in place.
+
+        Writes table.labels and marks those rows "clustered". With rows, only
+        those (embedded) rows are clustered and the rest stay "embedded".
+        Returns False when there is nothing to cluster or clustering failed.
+        """
+        if rows is None:
+            rows = table.indices("embedded")
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[table.status_mask("embedded")[rows] & (table.embedding_rows[rows] >= 0)]
 
-        if len(valid_files) < 2:
+        if len(rows) < 2:
             log_error("[ClusteringAgent] Not enough embeddings to cluster.")
-            return []
+            return False
 
-        X = np.array([f.embedding for f in valid_files])
+        X = table.embedding_matrix(rows)
         try:
-            labels = self.clusterer.cluster(X)
-            labels = self._split_mixed_doctype_clusters(valid_files, labels)
+            if self.reducer is not None:
+                X = self.reducer.fit_transform(X)
+                print(f"  Reduced embeddings: {self.reducer.describe()}", file=sys.stderr)
+            doctypes = [extract_prefixed_doctype(t) for t in table.texts(rows)]
+            if self.partition_by_doctype:
+                labels = self._cluster_by_doctype(X, doctypes)
+            else:
+                labels = self.clusterer.cluster(X)
+                labels = _split_by_doctype(doctypes, labels)
         except Exception as e:
             log_error(f"[ClusteringAgent] Clustering failed: {e}")
-            return []
-
-        clustered = []
-        for file, label in zip(valid_files, labels):
-            clustered.append(ClusteredFile(
-                file_meta=file.file_meta,
-                embedding=file.embedding,
-                raw_text=file.raw_text,
-                cluster_id=int(label),
-                status="clustered"
-            ))
-
-        return clustered
+            return False
+
+        table.labels[rows] = labels
+        table.set_status(rows, "clustered")
+        return True
+
+    def _cluster_by_doctype(self, X: np.ndarray, doctypes: list) -> np.ndarray:
+        """Cluster each doctype prefix (and the untyped rest) on its own.
+
+        Several small problems instead of one big one, run in a process pool
+        for large inputs. No cluster can mix doctypes, so there is nothing to
+        split afterwards; untyped clusters then join a close typed cluster.
+        """
+        keys = np.array([d or "" for d in doctypes])
+        parts = [np.flatnonzero(keys == k) for k in np.unique(keys)]
+        print(f"  Clustering {len(parts)} doctype partitions: "
+              + ", ".join(f"{keys[p[0]] or 'untyped'}={len(p)}" for p in parts), file=sys.stderr)
+
+        parallel = len(X) >= PARALLEL_MIN_N and sum(len(p) >= 2 for p in parts) > 1
+        if parallel:
+            import multiprocessing
+            # spawn, not fork: the parent may hold torch / faiss threads
+            with ProcessPoolExecutor(max_workers=self.max_workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                results = list(pool.map(_cluster_partition, [self.clusterer] * len(parts), [X[p] for p in parts]))
+        else:
+            results = [_cluster_partition(self.clusterer, X[p]) for p in parts]
+
+        labels = np.full(len(X), -1, dtype=np.int64)
+        next_label = 0
+        for part, part_labels in zip(parts, results):
+            found = part_labels != -1
+            if found.any():
+                _, dense = np.unique(part_labels[found], return_inverse=True)
+                labels[part[found]] = dense + next_label
+                next_label += int(dense.max()) + 1
+
+        return _merge_untyped(X, labels, keys == "", UNTYPED_MERGE_SIMILARITY)
 
     def _split_mixed_doctype_clusters(
         self,
         embedded_files: list[EmbeddedFile],
         labels: np.ndarray
     ) -> np.ndarray:
-        next_label = int(labels.max()) + 1 if len(labels) else 0
-        refined = labels.copy()
-
-        for cluster_id in sorted(set(int(label) for label in labels if int(label) != -1)):
-            indices = [i for i, label in enumerate(labels) if int(label) == cluster_id]
-            doctypes = [extract_prefixed_doctype(embedded_files[i].raw_text) for i in indices]
-            typed_groups: dict[str, list[int]] = defaultdict(list)
-            unknown_indices: list[int] = []
-
-            for idx, doctype in zip(indices, doctypes):
-                if doctype:
-                    typed_groups[doctype].append(idx)
-                else:
-                    unknown_indices.append(idx)
-
-            if len(typed_groups) <= 1:
-                continue
-
-            dominant_doctype = max(typed_groups.items(), key=lambda item: len(item[1]))[0]
-            for idx in unknown_indices:
-                typed_groups[dominant_doctype].append(idx)
-
-            first = True
-            for _, group_indices in sorted(typed_groups.items(), key=lambda item: item[0]):
-                if first:
-                    for idx in group_indices:
-                        refined[idx] = cluster_id
-                    first = False
-                else:
-                    for idx in group_indices:
-                        refined[idx] = next_label
-                    next_label += 1
-
-        return refined
+        doctypes = [extract_prefixed_doctype(f.raw_text) for f in embedded_files]
+        return _split_by_doctype(doctypes, labels)
 
     def merge_similar_clusters(
         self,
         cluster_map: dict[int, list[ClusteredFile]],
         cluster_names: dict[int, str],
-        similarity_threshold: float = 0.75
+        similarity_threshold: float = 0.85,
+        name_weight: float = 0.0,
         ) -> dict[int, list[ClusteredFile]]:
-        sorted_ids = sorted(cluster_names.keys())
-        folder_names = [cluster_names[i] for i in sorted_ids]
-        embeddings = self.name_embedder.encode(folder_names, convert_to_tensor=True)
-
-        from sentence_transformers import util
-        similarity_matrix = util.pytorch_cos_sim(embeddings, embeddings).cpu().numpy()
-
-        parent = {i: i for i in range(len(sorted_ids))}
-
-        def find(i):
-            while parent[i] != i:
-                parent[i] = parent[parent[i]]
-                i = parent[i]
-            return i
-
-        def union(i, j):
-            pi, pj = find(i), find(j)
-            if pi != pj:
-                parent[pj] = pi
-
-        for i in range(len(sorted_ids)):
-            for j in range(i + 1, len(sorted_ids)):
-                if similarity_matrix[i][j] >= similarity_threshold:
-                    union(i, j)
-
-        group_to_cluster_ids = defaultdict(list)
-        for i, cluster_id in enumerate(sorted_ids):
-            group_id = find(i)
-            group_to_cluster_ids[group_id].append(cluster_id)
-
-        merged_cluster_map = {}
-        new_cluster_id = 0
-        for cluster_ids in group_to_cluster_ids.values():
-            merged_files = []
-            for cid in cluster_ids:
-                merged_files.extend(cluster_map.get(cid, []))
-            merged_cluster_map[new_cluster_id] = merged_files
-            new_cluster_id += 1
-
-        return merged_cluster_map
+        """Merge clusters whose centroids are at least similarity_threshold cosine-similar.
+
+        Works on the members' embeddings, so no model is called. With
+        name_weight > 0 the score blends in a character n-gram TF-IDF
+        similarity of the folder names. Pairs above the threshold become edges
+        of a sparse graph and each connected component is one merged cluster,
+        keyed by its smallest member ID. Unmerged clusters keep their IDs, so
+        their names stay valid. Clusters whose dominant doctypes differ never
+        merge, and noise (-1) is left alone.
+        """
+        ids = np.array(sorted(cid for cid in cluster_map if cid != -1), dtype=np.int64)
+        merged = {cid: list(files) for cid, files in cluster_map.items()}
+        if len(ids) < 2:
+            return merged
+
+        centroids = normalize(np.array([_centroid(cluster_map[cid]) for cid in ids]))
+        names = None
+        if name_weight > 0:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            names = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 4)).fit_transform(
+                [cluster_names.get(int(cid), "") for cid in ids])
+        doctypes = [_dominant_doctype(cluster_map[cid]) for cid in ids]
+
+        graph, dt = _similarity_graph(centroids, names, name_weight, similarity_threshold, doctypes)
+        n_groups, group = connected_components(graph, directed=False)
+        n_groups, group = _split_doctype_bridges(graph, dt, centroids, n_groups, group)
+        if n_groups == len(ids):
+            return merged
+
+        for g in np.flatnonzero(np.bincount(group) > 1):
+            members = ids[group == g]
+            keep = int(members[0])
+            for cid in members[1:]:
+                merged[keep].extend(merged.pop(int(cid)))
+        print(f"  Merged {len(ids)} clusters into {n_groups}", file=sys.stderr)
+        return merged
+
+
+def _centroid(files: list[ClusteredFile]) -> np.ndarray:
+    vectors = np.array([f.embedding for f in files if f.embedding], dtype=np.float32)
+    if not len(vectors):
+        return np.zeros(0, dtype=np.float32)
+    return normalize(vectors).mean(axis=0)
+
+
+def _dominant_doctype(files: list[ClusteredFile]) -> str | None:
+    counts = defaultdict(int)
+    for f in files:
+        doctype = extract_prefixed_doctype(f.raw_text or "")
+        if doctype:
+            counts[doctype] += 1
+    return max(counts, key=counts.get) if counts else None
+
+
+def _similarity_graph(centroids, names, name_weight, threshold, doctypes, block=1024):
+    """Sparse upper-triangular adjacency of cluster pairs scoring >= threshold.
+
+    Scores are computed a block of rows at a time, so thousands of clusters
+    never need the full K×K matrix in memory at once.
+    """
+    k = len(centroids)
+    codes = {d: c for c, d in enumerate(sorted({d for d in doctypes if d}))}
+    dt = np.array([codes[d] if d else -1 for d in doctypes])
+    rows, cols = [], []
+    for start in range(0, k, block):
+        stop = min(start + block, k)
+        sim = centroids[start:stop] @ centroids.T
+        if names is not None:
+            sim = (1 - name_weight) * sim + name_weight * (names[start:stop] @ names.T).toarray()
+        i, j = np.nonzero(sim >= threshold)
+        i += start
+        ok = (j > i) & ((dt[i] == dt[j]) | (dt[i] == -1) | (dt[j] == -1))
+        rows.append(i[ok])
+        cols.append(j[ok])
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    return csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(k, k)), dt
+
+
+def _split_doctype_bridges(graph, dt, centroids, n_groups, group):
+    """Split components that chain two doctypes together through untyped clusters.
+
+    In such a component the typed clusters regroup over their own (same-doctype)
+    edges, and each untyped cluster follows its most similar typed cluster.
+    """
+    for g in range(n_groups):
+        members = np.flatnonzero(group == g)
+        if len(np.unique(dt[members][dt[members] >= 0])) < 2:
+            continue
+        typed, untyped = members[dt[members] >= 0], members[dt[members] < 0]
+        n_sub, sub = connected_components(graph[typed][:, typed], directed=False)
+        group[typed] = np.where(sub == 0, g, n_groups + sub - 1)
+        if len(untyped):
+            nearest = np.argmax(centroids[untyped] @ centroids[typed].T, axis=1)
+            group[untyped] = group[typed][nearest]
+        n_groups += n_sub - 1
+    return n_groups, group
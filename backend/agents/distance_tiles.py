@@ -0,0 +1,141 @@
+"""
+Blocked cosine-distance engine with a memory budget.
+
+cosine_distances(X) builds the whole N×N float64 matrix in RAM, and
+hdbscan's precomputed path then makes more N×N copies (mutual reachability,
+its own Prim's over the full matrix). That is where big sorts met the OOM
+killer.
+
+CosineDistances instead computes float32 tiles of TILE_ROWS rows with one
+BLAS call each and writes them into either an in-RAM array (when N²·4 bytes
+fits the budget) or an np.memmap scratch file under SCRATCH_DIR. The file
+is page-cache backed: under memory pressure the kernel writes pages out
+instead of killing the process, so a large run slows down to disk speed
+rather than dying. The scratch file is deleted on close().
+
+prim_mst() consumes the matrix one row at a time — Prim's algorithm reads
+each row exactly once — so the working set beyond the matrix is O(N).
+Together with knn_graph.mst_labels() that is HDBSCAN with exactly the
+precomputed path's result, at O(N) resident memory.
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from .index_manager import SMARTSORT_DIR, normalize
+
+DISTANCE_BUDGET_MB = 512
+TILE_ROWS = 2048
+SCRATCH_DIR = SMARTSORT_DIR / "scratch"   # not /tmp: that can be RAM-backed tmpfs
+
+
+class CosineDistances:
+    """N×N float32 cosine distances of X's rows, in RAM or spilled to a memmap."""
+
+    def __init__(
+        self,
+        X: np.ndarray,
+        budget_mb: float = DISTANCE_BUDGET_MB,
+        scratch_dir: Optional[Path] = None,
+        tile_rows: int = TILE_ROWS,
+    ):
+        unit = normalize(np.asarray(X, dtype=np.float32))
+        n = len(unit)
+        budget = int(budget_mb * (1 << 20))
+        self.path: Optional[Path] = None
+
+        if n * n * 4 <= budget:
+            self.matrix = np.empty((n, n), dtype=np.float32)
+        else:
+            d = Path(scratch_dir or SCRATCH_DIR)
+            d.mkdir(parents=True, exist_ok=True)
+            fd, name = tempfile.mkstemp(prefix="distances_", suffix=".f32", dir=d)
+            os.close(fd)
+            self.path = Path(name)
+            self.matrix = np.memmap(self.path, dtype=np.float32, mode="w+", shape=(n, n))
+
+        # Keep each tile to a quarter of the budget as well
+        tile_rows = max(1, min(tile_rows, budget // max(4 * 4 * n, 1)))
+        for start in range(0, n, tile_rows):
+            stop = min(start + tile_rows, n)
+            tile = unit[start:stop] @ unit.T
+            np.subtract(1.0, tile, out=tile)
+            np.clip(tile, 0.0, 2.0, out=tile)
+            tile[np.arange(stop - start), np.arange(start, stop)] = 0.0
+            self.matrix[start:stop] = tile
+        if self.path is not None:
+            self.matrix.flush()
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    def __enter__(self) -> "CosineDistances":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def spilled(self) -> bool:
+        return self.path is not None
+
+    def row(self, i: int) -> np.ndarray:
+        return self.matrix[i]
+
+    def core_distances(self, min_samples: int, tile_rows: int = TILE_ROWS) -> np.ndarray:
+        """Distance to each row's min_samples-th nearest other point (hdbscan's convention)."""
+        n = len(self)
+        kth = min(min_samples, n - 1)   # column 0 of a sorted row is the point itself
+        core = np.empty(n)
+        for start in range(0, n, tile_rows):
+            tile = np.asarray(self.matrix[start:start + tile_rows])
+            core[start:start + len(tile)] = np.partition(tile, kth, axis=1)[:, kth]
+        return core
+
+    def close(self) -> None:
+        if self.path is None:
+            return
+        matrix, self.matrix = self.matrix, None
+        if hasattr(matrix, "_mmap") and matrix._mmap is not None:
+            matrix._mmap.close()
+        del matrix
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+        self.path = None
+
+
+def prim_mst(dist: CosineDistances, min_samples: int = 1) -> np.ndarray:
+    """Minimum spanning tree over mutual-reachability distances, as (N−1, 3) edges.
+
+    Dense Prim's: each step reads one row of the matrix (the vertex just
+    added), so the whole matrix is read once, front to back in tree order.
+    """
+    n = len(dist)
+    core = dist.core_distances(min_samples) if n > 1 else np.zeros(n)
+    in_tree = np.zeros(n, dtype=bool)
+    best = np.full(n, np.inf)
+    best_from = np.zeros(n, dtype=np.int64)
+    edges = np.empty((max(n - 1, 0), 3))
+
+    current = 0
+    in_tree[0] = True
+    best[0] = np.inf
+    for step in range(n - 1):
+        row = np.maximum(np.asarray(dist.row(current), dtype=np.float64), np.maximum(core, core[current]))
+        closer = (row < best) & ~in_tree
+        best[closer] = row[closer]
+        best_from[closer] = current
+
+        current = int(np.argmin(best))
+        edges[step] = (best_from[current], current, best[current])
+        in_tree[current] = True
+        best[current] = np.inf
+    return edges
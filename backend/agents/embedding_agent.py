@@ -1,115 +1,37 @@
-import pickle
-import time
-from pathlib import Path
+import numpy as np
 
+from ..core.file_table import FileTable
 from ..core.models import FileContent, EmbeddedFile
 from ..core.utils import log_error
 from ..core.constants import SKIP_EMBEDDING_TYPES, MIN_TOKENS_TO_EMBED
+from .embedding_cache import shared_cache
 from .identity_utils import build_identity_text
+from .model_registry import DEFAULT_MODEL, get_encoder
 
 _MAX_CHARS = 2000  # ~256 tokens for all-MiniLM-L6-v2; avoids tokenizing huge strings
 _PHOTO_PREFIX      = "__PHOTO__"
 _SCREENSHOT_PREFIX = "__SCREENSHOT__"
 
-_CACHE_PATH = Path.home() / ".smartsort" / "embedding_cache.pkl"
-_PID_FILE   = Path.home() / ".smartsort" / "daemon.pid"
-
-try:
-    from ..daemon.model_server import MODEL_SERVER_URL
-except ImportError:
-    MODEL_SERVER_URL = "http://127.0.0.1:7234"
-
-
-def _server_healthy() -> bool:
-    try:
-        import urllib.request
-        with urllib.request.urlopen(f"{MODEL_SERVER_URL}/health", timeout=1) as r:
-            return r.status == 200
-    except Exception:
-        return False
-
-
-def _wait_for_server(timeout: float = 10.0) -> bool:
-    """Return True if server becomes healthy within timeout.
-
-    Only waits if a daemon PID file exists; otherwise falls through immediately
-    so cold starts with no daemon don't add latency.
-    """
-    if _server_healthy():
-        return True
-    if not _PID_FILE.exists():
-        return False
-    deadline = time.monotonic() + timeout
-    while time.monotonic() < deadline:
-        time.sleep(0.5)
-        if _server_healthy():
-            return True
-    return False
-
-
-def _load_cache() -> dict:
-    try:
-        if _CACHE_PATH.exists():
-            with open(_CACHE_PATH, "rb") as f:
-                return pickle.load(f)
-    except Exception:
-        pass
-    return {}
-
-
-def _save_cache(cache: dict) -> None:
-    try:
-        _CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
-        with open(_CACHE_PATH, "wb") as f:
-            pickle.dump(cache, f, protocol=4)
-    except Exception:
-        pass
-
-
 class EmbeddingAgent:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
+    def __init__(self, model_name=DEFAULT_MODEL):
         self._model_name = model_name
-        self._use_server = _wait_for_server()
-        if self._use_server:
-            self.model = None
-        else:
-            from sentence_transformers import SentenceTransformer
-            self.model = SentenceTransformer(model_name)
-        self._cache = _load_cache()
+        self._encoder = get_encoder(model_name)
+        self._cache = shared_cache()
 
     # ── single-file encode (kept for daemon/assignment use) ──────────────────
 
     def _encode(self, text: str) -> list:
-        if self._use_server:
-            import json, urllib.request
-            body = json.dumps({"text": text}).encode()
-            req = urllib.request.Request(
-                f"{MODEL_SERVER_URL}/embed",
-                data=body,
-                headers={"Content-Type": "application/json"},
-                method="POST",
-            )
-            with urllib.request.urlopen(req, timeout=30) as r:
-                return json.loads(r.read())["embedding"]
-        return self.model.encode(text, convert_to_numpy=True).tolist()
+        return self._encoder.encode_one(text).tolist()
 
     # ── batch encode ──────────────────────────────────────────────────────────
 
-    def _encode_batch(self, texts: list) -> list:
-        """Encode a list of texts in one model call. Returns list-of-lists."""
-        if self._use_server:
-            import json, urllib.request
-            body = json.dumps({"texts": texts}).encode()
-            req = urllib.request.Request(
-                f"{MODEL_SERVER_URL}/embed_batch",
-                data=body,
-                headers={"Content-Type": "application/json"},
-                method="POST",
-            )
-            with urllib.request.urlopen(req, timeout=60) as r:
-                return json.loads(r.read())["embeddings"]
-        vecs = self.model.encode(texts, convert_to_numpy=True)
-        return vecs.tolist()
+    def _encode_batch(self, texts: list) -> np.ndarray:
+        """Encode a list of texts in one model call. Returns an (N, D) float32 array.
+
+        Stays an ndarray end to end: the binary / shared-memory transport
+        hands back the buffer, and embed_table stores it as the table's column.
+        """
+        return np.asarray(self._encoder.encode(texts), dtype=np.float32)
 
     # ── public API ────────────────────────────────────────────────────────────
 
@@ -140,15 +62,19 @@ class EmbeddingAgent:
             return EmbeddedFile(file_meta=file.file_meta, embedding=None, raw_text=raw, status="too_short")
 
         cache_key = (file.file_meta.file_path, file.file_meta.modified_at)
-        if cache_key in self._cache:
+        cached = self._cache.get(cache_key)
+        if cached is None:
+            # another process (pipeline / daemon) may have embedded it already
+            self._cache.refresh()
+            cached = self._cache.get(cache_key)
+        if cached is not None:
             return EmbeddedFile(
-                file_meta=file.file_meta, embedding=self._cache[cache_key], raw_text=text, status="embedded"
+                file_meta=file.file_meta, embedding=cached.tolist(), raw_text=text, status="embedded"
             )
 
         try:
             vector = self._encode(text)
-            self._cache[cache_key] = vector
-            _save_cache(self._cache)
+            self._cache.put(cache_key, vector)
             return EmbeddedFile(file_meta=file.file_meta, embedding=vector, raw_text=text, status="embedded")
         except Exception as e:
             log_error(f"[EmbeddingAgent] Failed to embed {file.file_meta.file_name}: {e}")
@@ -157,69 +83,86 @@ class EmbeddingAgent:
     def embed_many(self, files: list) -> list:
         """Batch-embed a list of FileContent objects.
 
+        Thin wrapper over embed_table() for callers that still work with the
+        per-file dataclasses.
+        """
+        table = FileTable.from_contents(files)
+        self.embed_table(table)
+        return table.embedded_files()
+
+    def embed_table(self, table: FileTable) -> FileTable:
+        """Embed every row of a FileTable in place.
+
         Pre-routes photos/screenshots/skips without touching the model, then
         encodes all remaining texts in a single model.encode() call (or one
         HTTP round-trip to the model server). Cache hits are resolved before
         the batch so repeat sorts are nearly instant.
-        """
-        results = [None] * len(files)
-        to_encode = []  # (index, text, file, cache_key)
 
-        for i, file in enumerate(files):
-            if file.status != "success":
-                results[i] = EmbeddedFile(file_meta=file.file_meta, embedding=None, raw_text="", status="error")
+        On return each row's status is one of embedded / photo / screenshot /
+        skipped / too_short / error, its text column holds the identity text
+        (or date bucket), and embedded rows have a vector in table.embeddings.
+        """
+        n = len(table)
+        self._cache.refresh()
+        texts = table.texts()
+        statuses = ["error"] * n
+        cached_idx, cached_vecs = [], []
+        to_encode = []  # (index, cache_key)
+
+        success = table.status_mask("success")
+        for i in range(n):
+            if not success[i]:
+                texts[i] = ""
                 continue
 
-            if file.file_meta.detected_type in SKIP_EMBEDDING_TYPES:
-                results[i] = EmbeddedFile(file_meta=file.file_meta, embedding=None, raw_text="", status="skipped")
+            if table.detected_type(i) in SKIP_EMBEDDING_TYPES:
+                texts[i] = ""
+                statuses[i] = "skipped"
                 continue
 
-            raw = file.raw_text.strip()
+            raw = texts[i].strip()
 
             if raw.startswith(_SCREENSHOT_PREFIX):
-                results[i] = EmbeddedFile(
-                    file_meta=file.file_meta, embedding=None, raw_text="screenshot", status="screenshot"
-                )
+                texts[i] = "screenshot"
+                statuses[i] = "screenshot"
                 continue
 
             if raw.startswith(_PHOTO_PREFIX):
-                date_bucket = raw[len(_PHOTO_PREFIX):]
-                results[i] = EmbeddedFile(
-                    file_meta=file.file_meta, embedding=None, raw_text=date_bucket, status="photo"
-                )
+                texts[i] = raw[len(_PHOTO_PREFIX):]
+                statuses[i] = "photo"
                 continue
 
-            text = build_identity_text(file.file_meta.file_name, raw)[:_MAX_CHARS]
+            text = build_identity_text(table.names[i], raw)[:_MAX_CHARS]
 
             if len(text.split()) < MIN_TOKENS_TO_EMBED:
-                results[i] = EmbeddedFile(file_meta=file.file_meta, embedding=None, raw_text=raw, status="too_short")
+                texts[i] = raw
+                statuses[i] = "too_short"
                 continue
 
-            cache_key = (file.file_meta.file_path, file.file_meta.modified_at)
-            if cache_key in self._cache:
-                results[i] = EmbeddedFile(
-                    file_meta=file.file_meta, embedding=self._cache[cache_key], raw_text=text, status="embedded"
-                )
+            texts[i] = text
+            statuses[i] = "embedded"
+            cache_key = (table.paths[i], table.modified_at(i))
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                cached_idx.append(i)
+                cached_vecs.append(cached)
                 continue
 
-            to_encode.append((i, text, file, cache_key))
+            to_encode.append((i, cache_key))
+
+        if cached_idx:
+            table.set_embeddings(np.asarray(cached_idx), np.asarray(cached_vecs, dtype=np.float32))
 
         if to_encode:
-            texts = [t for _, t, _, _ in to_encode]
             try:
-                vectors = self._encode_batch(texts)
-                for j, (i, text, file, cache_key) in enumerate(to_encode):
-                    vec = vectors[j]
-                    self._cache[cache_key] = vec
-                    results[i] = EmbeddedFile(
-                        file_meta=file.file_meta, embedding=vec, raw_text=text, status="embedded"
-                    )
+                vectors = self._encode_batch([texts[i] for i, _ in to_encode])
+                self._cache.put_many(zip((key for _, key in to_encode), vectors))
+                table.set_embeddings(np.asarray([i for i, _ in to_encode]), vectors)
             except Exception as e:
-                for i, text, file, cache_key in to_encode:
-                    log_error(f"[EmbeddingAgent] Failed to embed {file.file_meta.file_name}: {e}")
-                    results[i] = EmbeddedFile(
-                        file_meta=file.file_meta, embedding=None, raw_text=text, status="error"
-                    )
-            _save_cache(self._cache)
-
-        return results
+                for i, _ in to_encode:
+                    log_error(f"[EmbeddingAgent] Failed to embed {table.names[i]}: {e}")
+                    statuses[i] = "error"
+
+        table.set_texts(texts)
+        table.set_statuses(statuses)
+        return table
@@ -0,0 +1,244 @@
+"""
+Embedding cache shared by every SmartSort process (daemon, pipeline, CLI).
+
+Files under ~/.smartsort/embedding_cache/:
+  cache.log   -- a header (magic + random generation number), then an
+                 append-only log of length-prefixed pickled batches
+                 [((file_path, modified_at), float32 vector), ...]
+  cache.lock  -- flock target guarding appends and compaction
+
+Nobody rewrites the whole cache any more: put_many() appends one record under
+an exclusive flock after replaying whatever other processes appended since
+this process last looked, and refresh() replays new records under a shared
+flock.  Once superseded entries make up most of the log (it holds more than
+_COMPACT_DEAD_RATIO times the live entries) it is compacted into a single
+record via an atomic os.replace() under a new generation number; readers
+notice the generation change and reload from the top into a fresh dict that
+is swapped in once complete.  Inodes are not used for this: they are reused
+after a replace, and a reader fooled by one would resume mid-record.  Inside a
+process one RLock serialises writers, and lookups are plain dict reads.
+
+The legacy embedding_cache.pkl is imported once as the log's first record.
+"""
+
+from __future__ import annotations
+
+import os
+import pickle
+import struct
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
+_CACHE_DIR = Path.home() / ".smartsort" / "embedding_cache"
+_LEGACY_PATH = Path.home() / ".smartsort" / "embedding_cache.pkl"
+
+_HEADER = struct.Struct("<I")
+_FILE_HEADER = struct.Struct("<8sQ")   # magic, generation
+_MAGIC = b"SSEMBLOG"
+_COMPACT_DEAD_RATIO = 2       # compact once the log holds this many times the live entries
+_COMPACT_MIN_ENTRIES = 1024   # ...and at least this many, so small logs are left alone
+
+CacheKey = Tuple[str, str]
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: Optional[Path] = None, legacy_path: Optional[Path] = _LEGACY_PATH):
+        self.dir = Path(cache_dir) if cache_dir else _CACHE_DIR
+        self._log_path = self.dir / "cache.log"
+        self._lock_path = self.dir / "cache.lock"
+        self._entries: Dict[CacheKey, np.ndarray] = {}
+        self._mutex = threading.RLock()
+        self._generation: Optional[int] = None
+        self._offset = 0
+        self._logged = 0   # entries in the log, superseded ones included
+
+        if legacy_path is not None:
+            self._import_legacy(Path(legacy_path))
+        self.refresh()
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: CacheKey) -> bool:
+        return key in self._entries
+
+    def get(self, key: CacheKey) -> Optional[np.ndarray]:
+        return self._entries.get(key)
+
+    def get_many(self, keys: Iterable[CacheKey]) -> List[Optional[np.ndarray]]:
+        entries = self._entries
+        return [entries.get(k) for k in keys]
+
+    def put(self, key: CacheKey, vector) -> None:
+        self.put_many([(key, vector)])
+
+    def put_many(self, items: Iterable[Tuple[CacheKey, object]]) -> None:
+        """Add entries in memory and append them to the shared log as one record."""
+        items = [(k, np.asarray(v, dtype=np.float32)) for k, v in items]
+        if not items:
+            return
+        payload = pickle.dumps(items, protocol=4)
+        with self._mutex:
+            try:
+                with self._flock(exclusive=True):
+                    self._read_new()
+                    self._entries.update(items)
+                    self._append(payload, len(items))
+                    if self._logged > max(_COMPACT_DEAD_RATIO * len(self._entries), _COMPACT_MIN_ENTRIES):
+                        self._compact()
+            except OSError:
+                self._entries.update(items)
+
+    def refresh(self) -> None:
+        """Replay records appended by other processes since the last look."""
+        with self._mutex:
+            try:
+                with self._flock(exclusive=False):
+                    self._read_new()
+            except OSError:
+                pass
+
+    # ── Internals (callers hold self._mutex) ──────────────────────────────────
+
+    @contextmanager
+    def _flock(self, exclusive: bool):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)  # closing the descriptor drops the flock
+
+    def _read_new(self) -> None:
+        try:
+            f = open(self._log_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            generation = _generation(f.read(_FILE_HEADER.size))
+            if generation is None:
+                return  # not a log this version wrote; the next writer replaces it
+            size = f.seek(0, os.SEEK_END)
+            # Compacted (or first look): replay from the top into a fresh dict and
+            # publish it only when complete, so lock-free readers never see a
+            # half-filled cache. New records otherwise just extend the live dict.
+            fresh = generation != self._generation or size < self._offset
+            offset = _FILE_HEADER.size if fresh else self._offset
+            if size == offset and not fresh:
+                return
+            f.seek(offset)
+            data = f.read()
+
+        entries = {} if fresh else self._entries
+        logged = 0 if fresh else self._logged
+        pos = 0
+        while pos + _HEADER.size <= len(data):
+            (n,) = _HEADER.unpack_from(data, pos)
+            end = pos + _HEADER.size + n
+            if end > len(data):
+                break  # torn tail left by a crashed writer; trimmed on next append
+            try:
+                items = pickle.loads(data[pos + _HEADER.size:end])
+                entries.update(items)
+                logged += len(items)
+            except Exception:
+                pass
+            pos = end
+
+        self._entries = entries
+        self._generation, self._offset, self._logged = generation, offset + pos, logged
+
+    def _append(self, payload: bytes, n_items: int) -> None:
+        """Append one record (caller holds the exclusive flock and has just run _read_new)."""
+        fd = os.open(self._log_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            generation = _generation(os.pread(fd, _FILE_HEADER.size, 0))
+            if size == 0 or generation is None:
+                # new log, or one this version can't read: start a generation
+                os.ftruncate(fd, 0)
+                generation = _new_generation()
+                os.write(fd, _FILE_HEADER.pack(_MAGIC, generation))
+                self._generation, self._offset, self._logged = generation, _FILE_HEADER.size, 0
+            elif generation != self._generation or size < self._offset:
+                raise OSError("cache log changed since it was read")
+            elif size > self._offset:
+                # Same generation and _read_new stopped at self._offset, so
+                # what follows is a torn record left by a crashed writer.
+                os.ftruncate(fd, self._offset)
+            record = _HEADER.pack(len(payload)) + payload
+            os.write(fd, record)
+            self._offset += len(record)
+            self._logged += n_items
+        finally:
+            os.close(fd)
+
+    def _compact(self) -> None:
+        tmp = self._log_path.with_suffix(".tmp")
+        payload = pickle.dumps(list(self._entries.items()), protocol=4)
+        record = _HEADER.pack(len(payload)) + payload
+        generation = _new_generation()
+        with open(tmp, "wb") as f:
+            f.write(_FILE_HEADER.pack(_MAGIC, generation))
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._log_path)
+        self._generation = generation
+        self._offset = _FILE_HEADER.size + len(record)
+        self._logged = len(self._entries)
+
+    def _import_legacy(self, legacy_path: Path) -> None:
+        if self._log_path.exists() or not legacy_path.exists():
+            return
+        with self._mutex:
+            try:
+                with self._flock(exclusive=True):
+                    if self._log_path.exists():
+                        return
+                    with open(legacy_path, "rb") as f:
+                        legacy = pickle.load(f)
+                    items = [(k, np.asarray(v, dtype=np.float32)) for k, v in legacy.items()]
+                    if items:
+                        self._entries.update(items)
+                        self._append(pickle.dumps(items, protocol=4), len(items))
+            except Exception:
+                pass
+
+
+def _generation(header: bytes) -> Optional[int]:
+    """The generation number in a log header, or None if it isn't one."""
+    if len(header) < _FILE_HEADER.size:
+        return None
+    magic, generation = _FILE_HEADER.unpack_from(header)
+    return generation if magic == _MAGIC else None
+
+
+def _new_generation() -> int:
+    return int.from_bytes(os.urandom(8), "little")
+
+
+_shared: Optional[EmbeddingCache] = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache() -> EmbeddingCache:
+    """The process-wide cache instance every EmbeddingAgent uses."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = EmbeddingCache()
+        return _shared
@@ -1,6 +1,6 @@
 import os
 import shutil
-from typing import Dict, List
+from typing import Dict, List, Optional
 from ..core.models import ClusteredFile
 from ..core.utils import log_error
 from .folder_naming_agent import FolderNamingAgent
@@ -18,23 +18,30 @@ class FileRelocationAgent:
         self.dry_run = dry_run
         self.folder_namer = FolderNamingAgent()
         
-    def relocate_files(self, cluster_map: Dict[int, List[ClusteredFile]]) -> Dict[str, List[str]]:
+    def relocate_files(
+        self,
+        cluster_map: Dict[int, List[ClusteredFile]],
+        folder_names: Optional[Dict[int, str]] = None,
+    ) -> Dict[str, List[str]]:
         """
         Relocate files into their respective cluster folders.
         
         Args:
             cluster_map: Dictionary mapping cluster IDs to lists of ClusteredFile objects
+            folder_names: Folder name per cluster ID; named here if not given
             
         Returns:
-            Dictionary containing success and error messages
+            Dictionary containing success, unchanged and error messages
         """
         results = {
             "success": [],
+            "unchanged": [],
             "errors": []
         }
         
         # Get folder names for each cluster
-        folder_names = self.folder_namer.name_clusters(cluster_map)
+        if folder_names is None:
+            folder_names = self.folder_namer.name_clusters(cluster_map)
         
         # Process each cluster
         for cluster_id, files in cluster_map.items():
@@ -61,6 +68,10 @@ class FileRelocationAgent:
                     continue
                 
                 dest_path = os.path.join(destination_dir, os.path.basename(source_path))
+                if os.path.abspath(source_path) == dest_path:
+                    # Already in its cluster's folder (a kept cluster on a re-sort)
+                    results["unchanged"].append(source_path)
+                    continue
                 
                 try:
                     if not self.dry_run:
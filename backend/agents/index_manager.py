@@ -6,10 +6,15 @@ Files written to SMARTSORT_DIR (default ~/.smartsort/):
   index_meta.json      -- [{cluster_id, file_path}, ...] indexed by faiss row
   centroids.pkl        -- {cluster_id: np.ndarray} normalised mean per cluster
   cluster_folders.json -- {cluster_id: abs_folder_path}
+  reducer.npz          -- optional EmbeddingReducer the clusters were found with
+
+save_index() writes all of it from one run; update_index() replaces only the
+rows of the files a re-sort touched and leaves every other folder alone.
 """
 
 import json
 import pickle
+import sys
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
@@ -31,12 +36,53 @@ def normalize(vectors: np.ndarray) -> np.ndarray:
     return vectors / norms
 
 
+def build_index(
+    embeddings: np.ndarray,
+    labels: np.ndarray,
+    file_paths: List[str],
+) -> Tuple:
+    """
+    Build the in-memory index save_index() persists.
+
+    Returns:
+        (faiss_index, index_meta, centroids) — same shapes as load_index()
+    """
+    import faiss
+
+    X = np.asarray(embeddings, dtype=np.float32)
+    labels = np.asarray(labels)
+    normed = normalize(X)
+
+    # faiss index
+    index = faiss.IndexFlatIP(normed.shape[1])
+    index.add(normed)
+
+    # per-row metadata
+    meta = [
+        {"cluster_id": int(labels[i]), "file_path": file_paths[i]}
+        for i in range(len(labels))
+    ]
+
+    # per-cluster normalised centroids
+    centroids: Dict[int, List[float]] = {}
+    for cid in set(int(l) for l in labels):
+        if cid == -1:
+            continue
+        mask = labels == cid
+        centroid = normed[mask].mean(axis=0)
+        norm = float(np.linalg.norm(centroid))
+        centroids[cid] = (centroid / norm if norm > 0 else centroid).tolist()
+
+    return index, meta, centroids
+
+
 def save_index(
     embeddings: np.ndarray,
     labels: np.ndarray,
     file_paths: List[str],
     cluster_folders: Dict[int, str],
     output_dir: Optional[Path] = None,
+    reducer=None,
 ) -> None:
     """
     Persist a faiss index + metadata from a completed clustering run.
@@ -47,48 +93,135 @@ def save_index(
         file_paths:      list of absolute file paths, one per row
         cluster_folders: {cluster_id: absolute folder path}
         output_dir:      override for ~/.smartsort/ (useful in tests)
+        reducer:         fitted EmbeddingReducer used for clustering, if any
     """
     try:
         import faiss
     except ImportError:
-        print("[IndexManager] faiss-cpu not installed — skipping index persistence.")
+        print("[IndexManager] faiss-cpu not installed — skipping index persistence.", file=sys.stderr)
         return
 
     d = _dir(output_dir)
-    X = embeddings.astype(np.float32)
-    normed = normalize(X.copy())
+    index, meta, centroids = build_index(embeddings, labels, file_paths)
+    _write_index(d, index, meta, centroids, cluster_folders, reducer)
 
-    # faiss index
-    index = faiss.IndexFlatIP(normed.shape[1])
-    index.add(normed)
-    faiss.write_index(index, str(d / "index.faiss"))
+    n_clusters = len(centroids)
+    print(f"[IndexManager] Saved {index.ntotal} vectors, {n_clusters} clusters → {d}", file=sys.stderr)
 
-    # per-row metadata
-    meta = [
-        {"cluster_id": int(labels[i]), "file_path": file_paths[i]}
-        for i in range(len(labels))
-    ]
-    with open(d / "index_meta.json", "w") as f:
-        json.dump(meta, f, indent=2)
 
-    # per-cluster normalised centroids
-    centroids: Dict[int, List[float]] = {}
-    for cid in set(int(l) for l in labels):
-        if cid == -1:
+def update_index(
+    embeddings: np.ndarray,
+    labels: np.ndarray,
+    file_paths: List[str],
+    cluster_folders: Dict[int, str],
+    replaced_paths=(),
+    scope: Optional[Path] = None,
+    output_dir: Optional[Path] = None,
+    reducer=None,
+) -> None:
+    """
+    Fold a re-sort into the existing index instead of rebuilding it.
+
+    Rows whose file_path is in file_paths or replaced_paths (the files'
+    paths before they were moved) are dropped and the new rows appended.
+    With scope (the sorted folder), rows under it whose file no longer
+    exists are dropped as well: those files were deleted or moved away and
+    would keep voting for stale clusters. Files an earlier sort moved into
+    cluster folders are not re-ingested by a (non-recursive) re-sort, so
+    their rows stay, as do rows, clusters and folders outside scope. Only
+    clusters that gained or lost rows get a new centroid, and a cluster left
+    without rows is removed. Falls back to save_index() when there is no
+    index yet or the embedding dimension changed. A run with no rows only
+    prunes. Other arguments as for save_index().
+    """
+    try:
+        import faiss
+    except ImportError:
+        print("[IndexManager] faiss-cpu not installed — skipping index persistence.", file=sys.stderr)
+        return
+
+    d = _dir(output_dir)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    try:
+        index, meta, centroids, folders = load_index(d)
+    except (FileNotFoundError, OSError, RuntimeError, ValueError):
+        index = None
+    if index is None or index.ntotal != len(meta) or (len(embeddings) and index.d != embeddings.shape[1]):
+        if len(embeddings):
+            save_index(embeddings, labels, file_paths, cluster_folders, output_dir, reducer)
+        return
+
+    replaced = set(file_paths) | set(replaced_paths)
+    root = Path(scope).resolve() if scope is not None else None
+    drop = np.array([
+        i for i, m in enumerate(meta)
+        if m["file_path"] in replaced
+        or (root is not None and Path(m["file_path"]).resolve().is_relative_to(root)
+            and not Path(m["file_path"]).exists())
+    ], dtype=np.int64)
+    touched = {int(l) for l in labels} | {meta[i]["cluster_id"] for i in drop}
+    if len(drop):
+        index.remove_ids(drop)   # IndexFlat compacts in order, like the list below
+        dropped = set(drop.tolist())
+        meta = [m for i, m in enumerate(meta) if i not in dropped]
+    if len(embeddings):
+        index.add(normalize(embeddings))
+    meta += [{"cluster_id": int(l), "file_path": p} for l, p in zip(labels, file_paths)]
+
+    row_labels = np.array([m["cluster_id"] for m in meta], dtype=np.int64)
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else None
+    folders.update(cluster_folders)
+    for cid in touched - {-1}:
+        mask = row_labels == cid
+        if not mask.any():
+            centroids.pop(cid, None)
+            folders.pop(cid, None)
             continue
-        mask = labels == cid
-        centroid = normed[mask].mean(axis=0)
+        centroid = vectors[mask].mean(axis=0)
         norm = float(np.linalg.norm(centroid))
         centroids[cid] = (centroid / norm if norm > 0 else centroid).tolist()
-    with open(d / "centroids.pkl", "wb") as f:
+
+    _write_index(d, index, meta, centroids, folders, reducer)
+    print(f"[IndexManager] Updated {len(drop)} → {len(file_paths)} rows "
+          f"({index.ntotal} vectors, {len(centroids)} clusters) → {d}", file=sys.stderr)
+
+
+def _write_index(d: Path, index, meta, centroids, cluster_folders, reducer) -> None:
+    """Write every index file to a temporary name first, then swap them all in.
+
+    A crash while writing leaves the previous index intact; only one during
+    the final renames could leave old and new files side by side.
+    """
+    import os
+
+    import faiss
+
+    staged = []
+
+    def stage(name: str) -> Path:
+        tmp = d / f".{name}.tmp{os.getpid()}"
+        staged.append((tmp, d / name))
+        return tmp
+
+    faiss.write_index(index, str(stage("index.faiss")))
+    with open(stage("index_meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    with open(stage("centroids.pkl"), "wb") as f:
         pickle.dump(centroids, f)
 
     # cluster folder map (string keys for JSON)
-    with open(d / "cluster_folders.json", "w") as f:
+    with open(stage("cluster_folders.json"), "w") as f:
         json.dump({str(k): v for k, v in cluster_folders.items()}, f, indent=2)
 
-    n_clusters = len(centroids)
-    print(f"[IndexManager] Saved {len(X)} vectors, {n_clusters} clusters → {d}")
+    for tmp, path in staged:
+        os.replace(tmp, path)
+
+    # dimensionality reduction used for this run (a stale one would mislead)
+    reducer_path = d / "reducer.npz"
+    if reducer is not None and reducer.fitted:
+        reducer.save(reducer_path)
+    elif reducer_path.exists():
+        reducer_path.unlink()
 
 
 def load_index(
@@ -125,6 +258,19 @@ def load_index(
     return index, index_meta, centroids, cluster_folders
 
 
+def load_reducer(index_dir: Optional[Path] = None):
+    """EmbeddingReducer saved with the index, or None if the run didn't use one."""
+    path = (index_dir or SMARTSORT_DIR) / "reducer.npz"
+    if not path.exists():
+        return None
+    from .reducer import EmbeddingReducer
+    try:
+        return EmbeddingReducer.load(path)
+    except Exception as e:
+        print(f"[IndexManager] Ignoring unreadable {path.name}: {e}", file=sys.stderr)
+        return None
+
+
 def append_to_index(
     embedding: np.ndarray,
     cluster_id: int,
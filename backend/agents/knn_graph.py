@@ -0,0 +1,149 @@
+"""
+Approximate k-nearest-neighbour graph clustering backed by faiss.
+
+Exact HDBSCAN needs every pairwise distance. This backend instead asks a
+faiss index for each file's k nearest neighbours — HNSW for large inputs,
+exact IndexFlatIP for small ones, both on inner product over L2-normalised
+vectors, i.e. cosine — so time is roughly N·log N and memory N·k.
+
+On that sparse graph it runs HDBSCAN's own recipe:
+
+  1. edge weights are mutual-reachability distances max(core_i, core_j, d_ij),
+     with d the Euclidean distance on the unit sphere (as SemanticClusterer's
+     large-N path uses) and core the distance to the min_samples-th nearest
+     other point, as hdbscan defines it
+  2. a minimum spanning tree of the kNN graph; if the graph falls apart into
+     several components they are joined by edges heavier than any real one
+  3. hdbscan's condensed-tree / excess-of-mass selection over that tree
+
+Step 3 calls hdbscan internals (pinned in requirements.txt). If a release
+moves them, mst_labels_available() turns false and callers fall back to
+exact ball-tree HDBSCAN through the public API.
+
+The only approximation is that the spanning tree can use kNN edges only, so
+points are never linked through an edge longer than their k-th neighbour.
+Shared-nearest-neighbour edges were tried first: on large, isotropic blobs
+the neighbour lists barely overlap and every cluster shreds into noise.
+Labels follow SemanticClusterer.cluster: 0..C-1 per cluster, -1 for noise.
+"""
+
+from __future__ import annotations
+
+import sys
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, minimum_spanning_tree
+
+from .index_manager import normalize
+
+HNSW_MIN_N = 20000      # below this an exact flat index is fast enough
+HNSW_M = 32
+
+
+def knn_graph(X: np.ndarray, k: int, hnsw_min_n: int = HNSW_MIN_N):
+    """(similarities, neighbours) of shape (N, k): each row's k nearest others by cosine.
+
+    Rows are sorted by decreasing similarity; HNSW may pad a row with -1.
+    """
+    import faiss
+
+    unit = np.ascontiguousarray(normalize(np.asarray(X, dtype=np.float32)))
+    n, d = unit.shape
+    k = min(k, n - 1)
+    if n >= hnsw_min_n:
+        index = faiss.IndexHNSWFlat(d, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 64
+        index.hnsw.efSearch = max(64, 2 * k)
+    else:
+        index = faiss.IndexFlatIP(d)
+    index.add(unit)
+    sims, idx = index.search(unit, k + 1)
+
+    # Drop each row's own entry (usually, but with duplicates not always, column 0)
+    own = idx == np.arange(n)[:, None]
+    own[~own.any(axis=1), -1] = True
+    keep = ~own
+    return sims[keep].reshape(n, k), idx[keep].reshape(n, k)
+
+
+def knn_hdbscan(
+    X: np.ndarray,
+    k: int = 15,
+    min_cluster_size: int = 2,
+    min_samples: int = 1,
+    hnsw_min_n: int = HNSW_MIN_N,
+) -> np.ndarray:
+    n = len(X)
+    if n < 2:
+        return np.full(n, -1, dtype=np.int64)
+    if not mst_labels_available():
+        from .clustering_agent import _balltree_hdbscan
+        print("  hdbscan's tree internals are missing from this release; "
+              "using exact ball-tree HDBSCAN", file=sys.stderr)
+        return _balltree_hdbscan(X, min_cluster_size, min_samples)
+    sims, nbrs = knn_graph(X, k, hnsw_min_n)
+    k = nbrs.shape[1]
+
+    dist = np.sqrt(np.clip(2.0 - 2.0 * sims.astype(np.float64), 0.0, None))
+    core = dist[:, min(max(min_samples, 1), k) - 1]
+
+    valid = nbrs >= 0
+    rows = np.repeat(np.arange(n), k)[valid.ravel()]
+    cols = nbrs[valid]
+    weight = np.maximum(dist[valid], np.maximum(core[rows], core[cols]))
+
+    # One undirected edge per pair (i→j and j→i carry the same weight)
+    a, b = np.minimum(rows, cols), np.maximum(rows, cols)
+    order = np.lexsort((b, a))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (a[order][1:] != a[order][:-1]) | (b[order][1:] != b[order][:-1])
+    a, b, weight = a[order][first], b[order][first], weight[order][first]
+    # csgraph reads 0 as "no edge", and duplicate files sit at distance 0
+    graph = csr_matrix((weight + 1e-12, (a, b)), shape=(n, n))
+
+    mst = minimum_spanning_tree(graph).tocoo()
+    edges = np.column_stack([mst.row, mst.col, mst.data]).astype(np.float64)
+
+    n_comp, comp = connected_components(mst, directed=False)
+    if n_comp > 1:
+        # Chain the components together above every real distance
+        heavy = (edges[:, 2].max() if len(edges) else 1.0) * 2 + 1
+        reps = np.unique(comp, return_index=True)[1]
+        bridges = np.column_stack([reps[:-1], reps[1:], np.full(n_comp - 1, heavy)])
+        edges = np.vstack([edges, bridges])
+
+    labels = mst_labels(edges, min_cluster_size)
+    print(f"  kNN graph: {n} points, k={k}, {len(mst.data)} tree edges, "
+          f"{n_comp} component(s) → {labels.max() + 1} clusters", file=sys.stderr)
+    return labels
+
+
+def _hdbscan_internals():
+    """hdbscan's private (label, _tree_to_labels), or None if this release moved them."""
+    try:
+        from hdbscan._hdbscan_linkage import label
+        from hdbscan.hdbscan_ import _tree_to_labels
+    except (ImportError, AttributeError):
+        return None
+    return label, _tree_to_labels
+
+
+def mst_labels_available() -> bool:
+    return _hdbscan_internals() is not None
+
+
+def mst_labels(edges: np.ndarray, min_cluster_size: int) -> np.ndarray:
+    """HDBSCAN labels from a spanning tree's (N−1, 3) [from, to, distance] edges.
+
+    Raises ImportError when mst_labels_available() is false.
+    """
+    internals = _hdbscan_internals()
+    if internals is None:
+        raise ImportError("hdbscan no longer has _hdbscan_linkage.label / hdbscan_._tree_to_labels")
+    label, _tree_to_labels = internals
+
+    edges = np.asarray(edges, dtype=np.float64)
+    edges = edges[np.argsort(edges[:, 2], kind="stable")]
+    labels = _tree_to_labels(None, label(np.ascontiguousarray(edges)), min_cluster_size)[0]
+    return labels.astype(np.int64)
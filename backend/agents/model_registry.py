@@ -0,0 +1,403 @@
+"""
+Process-wide registry of sentence-transformer encoders.
+
+get_encoder(model_name, backend) hands out one shared encoder per
+(model, backend) pair, so EmbeddingAgent, AssignmentAgent and the daemon's
+ModelServer never hold more than one copy of the same weights:
+
+  "local"   -- SentenceTransformer loaded lazily on first use, encode() serialised
+               by a per-encoder lock; the weights are memory-mapped from the
+               prepared file in model_weights, so every process shares them
+  "server"  -- thin client for the daemon's ModelServer (no weights in-process),
+               over a pooled keep-alive connection on the Unix socket when present;
+               big batches go through shared memory (SMARTSORT_SHM=0 turns that off)
+  "auto"    -- an already-loaded local copy if this process has one (the daemon),
+               else the model server if it is up, else a lazy local load; a
+               live daemon whose server is still starting is raced against a
+               local warm-up in the background (see _RacingEncoder)
+
+Every encoder exposes the same two calls:
+  encode(texts, priority=None)     -> (N, D) float32 ndarray
+  encode_one(text, priority=None)  -> (D,)   float32 ndarray
+
+priority picks the model server's scheduling lane (interactive, daemon or
+background); None means the process default set with set_priority(). Inside
+the daemon the resident local copy is routed through the server's batcher
+(route_local), so its own assignments queue in the same lanes.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import model_weights
+from ..daemon import shm, wire
+from ..daemon.model_client import ModelServerClient, ModelServerError
+from ..daemon.model_server import DEFAULT_LANE, LANE_WEIGHTS, MAX_TEXTS, MODEL_SERVER_SOCKET, MODEL_SERVER_URL
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+_PID_FILE = Path.home() / ".smartsort" / "daemon.pid"
+
+_priority = DEFAULT_LANE
+
+
+def set_priority(lane: str) -> None:
+    """Set this process's default scheduling lane for model-server work."""
+    global _priority
+    if lane not in LANE_WEIGHTS:
+        raise ValueError(f"Unknown priority lane: {lane}")
+    _priority = lane
+
+
+# ── Model server discovery ────────────────────────────────────────────────────
+
+_PROBE_TIMEOUT = 0.25     # a healthy local server answers in well under this
+_SERVER_WAIT = 10.0       # how long a live-but-starting daemon gets to come up
+_SHM_MIN_TEXTS = 32       # below this a socket round trip is already cheap
+
+
+def _server_healthy(timeout: float = 1.0) -> bool:
+    client = ModelServerClient(MODEL_SERVER_URL, MODEL_SERVER_SOCKET)
+    try:
+        status, _, _ = client.request("GET", "/health", timeout=timeout)
+        return status == 200
+    except Exception:
+        return False
+    finally:
+        client.close()
+
+
+def _daemon_alive() -> bool:
+    """True if daemon.pid names a running process (stale files after a crash don't count)."""
+    try:
+        pid = int(_PID_FILE.read_text().strip())
+    except (OSError, ValueError):
+        return False
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+# ── Encoders ──────────────────────────────────────────────────────────────────
+
+class _LocalEncoder:
+    backend = "local"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.prepared = model_weights.enabled()   # map the shared prepared weights
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self):
+        """The underlying SentenceTransformer, loaded on first access."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    if self.prepared:
+                        self._model = model_weights.load_model(self.model_name)
+                    else:
+                        from sentence_transformers import SentenceTransformer
+                        self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def unload(self) -> None:
+        """Drop the weights; the next encode() loads them again."""
+        with self._lock:
+            self._model = None
+
+    def encode(self, texts: List[str], priority: Optional[str] = None) -> np.ndarray:
+        model = self.model
+        with self._lock:
+            vecs = model.encode(list(texts), convert_to_numpy=True)
+        return np.asarray(vecs, dtype=np.float32).reshape(len(texts), -1)
+
+    def encode_one(self, text: str, priority: Optional[str] = None) -> np.ndarray:
+        return self.encode([text])[0]
+
+
+class _ScheduledEncoder:
+    """The daemon's resident local copy, with calls queued in the server's lanes."""
+
+    backend = "local"
+
+    def __init__(self, local: _LocalEncoder, submit: Callable[[List[str], str], np.ndarray]):
+        self.local = local
+        self.model_name = local.model_name
+        self._submit = submit
+
+    @property
+    def loaded(self) -> bool:
+        return self.local.loaded
+
+    @property
+    def model(self):
+        return self.local.model
+
+    def encode(self, texts: List[str], priority: Optional[str] = None) -> np.ndarray:
+        return self._submit(list(texts), priority or _priority)
+
+    def encode_one(self, text: str, priority: Optional[str] = None) -> np.ndarray:
+        return self.encode([text], priority)[0]
+
+
+class _ServerEncoder:
+    """Model-server client using the binary wire format (float32 both ways)."""
+
+    backend = "server"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._client = ModelServerClient(MODEL_SERVER_URL, MODEL_SERVER_SOCKET)
+        self._use_shm = shm.available()
+
+    def _post(self, path: str, texts: List[str], timeout: float, priority: Optional[str]) -> np.ndarray:
+        _, body = self._client.call(
+            "POST", path,
+            body=wire.pack_texts(texts),
+            headers={
+                "Content-Type": wire.TEXTS_CONTENT_TYPE,
+                "Accept": wire.VECTORS_CONTENT_TYPE,
+                wire.PRIORITY_HEADER: priority or _priority,
+                wire.MODEL_HEADER: self.model_name,
+            },
+            timeout=timeout,
+        )
+        return wire.unpack_vectors(body)
+
+    def encode(self, texts: List[str], priority: Optional[str] = None) -> np.ndarray:
+        texts = list(texts)
+        if len(texts) > MAX_TEXTS:  # the server refuses bigger requests
+            return np.vstack([
+                self.encode(texts[i:i + MAX_TEXTS], priority) for i in range(0, len(texts), MAX_TEXTS)
+            ])
+        if self._use_shm and len(texts) >= _SHM_MIN_TEXTS:
+            try:
+                return self._client.embed_shm(
+                    texts, timeout=60,
+                    headers={wire.PRIORITY_HEADER: priority or _priority, wire.MODEL_HEADER: self.model_name},
+                )
+            except ModelServerError as e:
+                if not _shm_refused(e):
+                    raise  # the model's answer (unknown model, failed encode, busy), not the transport's
+                self._disable_shm(e)
+            except ConnectionError:
+                pass  # retry once over the socket; it raises if the server is really gone
+            except TimeoutError:
+                raise
+            except OSError as e:  # /dev/shm unavailable or full
+                self._disable_shm(e)
+        return self._post("/embed_batch", texts, timeout=60, priority=priority)
+
+    def encode_one(self, text: str, priority: Optional[str] = None) -> np.ndarray:
+        return self._post("/embed", [text], timeout=30, priority=priority)[0]
+
+    def _disable_shm(self, error: Exception) -> None:
+        print(f"[ModelRegistry] Shared-memory transport unavailable ({error}); using socket.", file=sys.stderr)
+        self._use_shm = False
+
+
+def _shm_refused(error: ModelServerError) -> bool:
+    """True if the server rejected the /embed_shm exchange itself, not the texts."""
+    if error.status == 404:  # a daemon from before /embed_shm
+        return True
+    if error.status == 507:  # still no room after growing the segment once
+        return True
+    return error.status == 400 and error.reply.get("error") == shm.DESCRIPTOR_ERROR
+
+
+class _RacingEncoder:
+    """Resolves "auto" in the background while the caller gets on with work.
+
+    Used only when the daemon is alive but its server didn't answer the first
+    probe (it is probably still loading). One thread polls /health, another
+    warms up a local copy; the first to be ready wins and later calls go
+    straight to it. A local copy that loses is unloaded again, and none is
+    loaded at all if the server has already won.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._ready = threading.Event()
+        self._winner = None
+        self._errors: List[Exception] = []
+        self._lock = threading.Lock()
+        self._pending = 2
+        threading.Thread(target=self._probe_server, daemon=True, name="encoder-probe").start()
+        threading.Thread(target=self._warm_local, daemon=True, name="encoder-warmup").start()
+
+    @property
+    def backend(self) -> str:
+        return self._winner.backend if self._winner is not None else "pending"
+
+    def _finish(self, encoder=None, error: Exception = None) -> bool:
+        """Record one side's result; True if encoder became the winner."""
+        with self._lock:
+            self._pending -= 1
+            if error is not None:
+                self._errors.append(error)
+            won = encoder is not None and self._winner is None
+            if won:
+                self._winner = encoder
+                _resolved(self.model_name, encoder)
+            if self._winner is not None or self._pending == 0:
+                self._ready.set()
+            return won
+
+    def _probe_server(self) -> None:
+        deadline = time.monotonic() + _SERVER_WAIT
+        while time.monotonic() < deadline and not self._ready.is_set():
+            if _server_healthy(timeout=_PROBE_TIMEOUT):
+                self._finish(_ServerEncoder(self.model_name))
+                return
+            time.sleep(0.1)
+        self._finish(error=TimeoutError("model server did not become healthy"))
+
+    def _warm_local(self) -> None:
+        if self._winner is not None:  # the server answered before this thread ran
+            self._finish()
+            return
+        enc = _LocalEncoder(self.model_name)
+        try:
+            enc.model
+        except Exception as e:
+            self._finish(error=e)
+            return
+        if not self._finish(enc):
+            enc.unload()  # the server won while we were loading; don't keep a second copy
+
+    def wait(self):
+        self._ready.wait()
+        if self._winner is None:
+            raise RuntimeError(f"No encoder backend available for {self.model_name}: {self._errors}")
+        return self._winner
+
+    def encode(self, texts: List[str], priority: Optional[str] = None) -> np.ndarray:
+        return self.wait().encode(texts, priority)
+
+    def encode_one(self, text: str, priority: Optional[str] = None) -> np.ndarray:
+        return self.wait().encode_one(text, priority)
+
+
+# ── Registry ──────────────────────────────────────────────────────────────────
+
+_lock = threading.Lock()
+_encoders: Dict[Tuple[str, str], object] = {}
+_auto: Dict[str, str] = {}
+_racing: Dict[str, _RacingEncoder] = {}
+
+
+def _get(model_name: str, backend: str):
+    key = (model_name, backend)
+    enc = _encoders.get(key)
+    if enc is None:
+        enc = _LocalEncoder(model_name) if backend == "local" else _ServerEncoder(model_name)
+        _encoders[key] = enc
+    return enc
+
+
+def _resolved(model_name: str, encoder) -> None:
+    """Record the winner of an "auto" race (called from the racer's threads)."""
+    with _lock:
+        key = (model_name, encoder.backend)
+        existing = _encoders.get(key)
+        if existing is None or (encoder.backend == "local" and not existing.loaded):
+            _encoders[key] = encoder
+        _auto[model_name] = encoder.backend
+        _racing.pop(model_name, None)
+
+
+def get_encoder(model_name: str = DEFAULT_MODEL, backend: str = "auto"):
+    """Return the shared encoder for (model_name, backend).
+
+    "auto" never blocks on discovery: a resident local copy or an instantly
+    healthy server is used directly, a missing or stale daemon.pid means a lazy
+    local load, and a live-but-silent daemon starts a background race whose
+    winner is remembered for the process lifetime.
+    """
+    if backend not in ("auto", "local", "server"):
+        raise ValueError(f"Unknown encoder backend: {backend}")
+    with _lock:
+        if backend != "auto":
+            return _get(model_name, backend)
+        if model_name in _auto:
+            return _get(model_name, _auto[model_name])
+        if model_name in _racing:
+            return _racing[model_name]
+        local = _encoders.get((model_name, "local"))
+        if local is not None and local.loaded:
+            backend = "local"
+        elif _server_healthy(timeout=_PROBE_TIMEOUT):
+            backend = "server"
+        elif not _daemon_alive():
+            backend = "local"
+        else:
+            racer = _RacingEncoder(model_name)
+            _racing[model_name] = racer
+            return racer
+        _auto[model_name] = backend
+        return _get(model_name, backend)
+
+
+def load_local(model_name: str = DEFAULT_MODEL):
+    """Eagerly load the local encoder for model_name and return it.
+
+    Used by the daemon's ModelServer so in-process agents resolve "auto" to
+    the same resident copy instead of looping back over HTTP.
+    """
+    with _lock:
+        enc = _get(model_name, "local")
+        _auto[model_name] = "local"
+    if isinstance(enc, _ScheduledEncoder):
+        enc = enc.local  # callers get the direct copy, never one routed back into a batcher
+    enc.model
+    return enc
+
+
+def route_local(model_name: str, submit: Optional[Callable[[List[str], str], np.ndarray]]) -> None:
+    """Queue in-process calls on model_name's local copy through submit(texts, lane).
+
+    The daemon's ModelServer passes its batcher so in-daemon agents share the
+    HTTP clients' priority lanes; passing None restores direct calls.
+    """
+    with _lock:
+        key = (model_name, "local")
+        enc = _encoders.get(key)
+        if isinstance(enc, _ScheduledEncoder):
+            enc = enc.local
+        if not isinstance(enc, _LocalEncoder):
+            return
+        _encoders[key] = enc if submit is None else _ScheduledEncoder(enc, submit)
+
+
+def unload_local(model_name: str) -> None:
+    """Forget model_name's local copy so its weights can be freed.
+
+    Used by the ModelServer when it evicts a model; the next local use loads
+    it again from scratch.
+    """
+    with _lock:
+        _encoders.pop((model_name, "local"), None)
+        if _auto.get(model_name) == "local":
+            del _auto[model_name]
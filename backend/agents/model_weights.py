@@ -0,0 +1,141 @@
+"""
+Prepared, memory-mapped sentence-transformer weights shared by every process.
+
+SentenceTransformer(name) re-reads the Hugging Face cache, rebuilds every
+module from its config and copies the weights into fresh private tensors —
+seconds of work, and one more full copy of the weights per process. Instead,
+prepare() writes each model once with torch.save() and load_model() opens it
+with torch.load(mmap=True): the tensors are mapped straight from that file,
+copy-on-write, and inference never writes to them. The daemon's ModelServer,
+a standalone pipeline and reassign_cli therefore share one set of physical
+pages through the page cache and each add only activation memory. It also
+makes reloading after the daemon's idle unload cheap.
+
+Snapshots live under ~/.smartsort/models/, one per (model, sentence-
+transformers version, torch version), so an upgrade never unpickles a stale
+object graph. Preparing happens under an exclusive flock on a sibling .lock
+file and lands with os.replace(), so concurrent first runs build it once and
+nobody maps a half-written file. A snapshot that will not load (truncated by
+a full disk, say) is replaced under the same lock and loaded again.
+SMARTSORT_MMAP_WEIGHTS=0 turns the whole path off; any other failure falls
+back to the regular SentenceTransformer load.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: os.replace() alone keeps readers safe
+    fcntl = None
+
+SNAPSHOT_DIR = Path.home() / ".smartsort" / "models"
+
+
+def enabled() -> bool:
+    return os.environ.get("SMARTSORT_MMAP_WEIGHTS") != "0"
+
+
+def snapshot_path(model_name: str, snapshot_dir: Optional[Path] = None) -> Path:
+    import sentence_transformers
+    import torch
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+    tag = f"st{sentence_transformers.__version__}-torch{torch.__version__}"
+    return Path(snapshot_dir or SNAPSHOT_DIR) / f"{safe}-{tag}.pt"
+
+
+def load_snapshot(path: Path):
+    """Load a snapshot with memory-mapped tensors, or None if there is no usable one."""
+    if not path.exists():
+        return None
+    import torch
+    try:
+        try:
+            model = torch.load(path, map_location="cpu", mmap=True, weights_only=False)
+        except TypeError:  # torch < 2.1: no mmap
+            model = torch.load(path, map_location="cpu")
+        model.eval()
+        return model
+    except Exception as e:
+        print(f"[ModelWeights] Ignoring unreadable snapshot {path.name}: {e}", file=sys.stderr)
+        return None
+
+
+def save_snapshot(model, path: Path) -> None:
+    import torch
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".tmp{os.getpid()}")
+        torch.save(model, tmp)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[ModelWeights] Could not write snapshot {path.name}: {e}", file=sys.stderr)
+
+
+@contextmanager
+def _flock(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # closing the descriptor drops the flock
+
+
+def _stat(path: Path) -> Optional[os.stat_result]:
+    try:
+        return path.stat()
+    except OSError:
+        return None
+
+
+def prepare(
+    model_name: str,
+    snapshot_dir: Optional[Path] = None,
+    unreadable: Optional[os.stat_result] = None,
+) -> Path:
+    """Make sure model_name's snapshot exists; returns its path.
+
+    unreadable is the stat of a snapshot the caller failed to load: it is
+    rebuilt unless another process has already replaced it.
+    """
+    path = snapshot_path(model_name, snapshot_dir)
+    if unreadable is None and path.exists():
+        return path
+    with _flock(path.with_suffix(".lock")):
+        current = _stat(path)
+        if (unreadable is not None and current is not None
+                and (current.st_ino, current.st_mtime_ns) == (unreadable.st_ino, unreadable.st_mtime_ns)):
+            path.unlink()
+        if not path.exists():  # another process may have finished while we waited
+            from sentence_transformers import SentenceTransformer
+            print(f"[ModelWeights] Preparing {path.name}…", file=sys.stderr)
+            save_snapshot(SentenceTransformer(model_name), path)
+    return path
+
+
+def load_model(model_name: str, snapshot_dir: Optional[Path] = None):
+    """SentenceTransformer for model_name, mapped from its prepared snapshot.
+
+    The process that prepares the snapshot maps it too, rather than keeping
+    the private copy it built, so every process ends up on the same pages.
+    """
+    from sentence_transformers import SentenceTransformer
+    if not enabled():
+        return SentenceTransformer(model_name)
+    path = prepare(model_name, snapshot_dir)
+    seen = _stat(path)
+    model = load_snapshot(path)
+    if model is None and seen is not None:
+        model = load_snapshot(prepare(model_name, snapshot_dir, unreadable=seen))
+    if model is not None:
+        return model
+    return SentenceTransformer(model_name)
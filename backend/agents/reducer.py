@@ -0,0 +1,134 @@
+"""
+Optional dimensionality reduction in front of clustering.
+
+Sentence embeddings are 384-dimensional, and in that many dimensions pairwise
+distances concentrate: HDBSCAN's core distances flatten out and every distance
+costs 384 multiply-adds. A linear map down to a few dozen dimensions keeps the
+cluster structure and makes both clustering paths several times faster.
+
+  pca     -- principal components (centred), reports explained variance
+  random  -- Gaussian random projection (Johnson-Lindenstrauss), no fit cost
+
+Either way the fit is just a mean and a (k, D) matrix, so it is saved next to
+the faiss index (reducer.npz, see index_manager) and later runs can project
+new embeddings into the same space. Turn it on with SMARTSORT_REDUCE=pca or
+SMARTSORT_REDUCE=random; SMARTSORT_REDUCE_DIM sets the target dimensionality.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+METHODS = ("pca", "random")
+DEFAULT_DIM = 64
+
+
+class EmbeddingReducer:
+    def __init__(self, method: str = "pca", n_components: int = DEFAULT_DIM, seed: int = 0):
+        if method not in METHODS:
+            raise ValueError(f"unknown reduction method {method!r} (expected one of {METHODS})")
+        self.method = method
+        self.n_components = n_components
+        self.seed = seed
+        self.mean_: Optional[np.ndarray] = None
+        self.components_: Optional[np.ndarray] = None
+        self.explained_variance_ratio_: Optional[float] = None
+
+    @property
+    def fitted(self) -> bool:
+        return self.components_ is not None
+
+    @property
+    def input_dim(self) -> Optional[int]:
+        return None if self.components_ is None else self.components_.shape[1]
+
+    @property
+    def output_dim(self) -> Optional[int]:
+        return None if self.components_ is None else self.components_.shape[0]
+
+    def fit(self, X: np.ndarray) -> "EmbeddingReducer":
+        X = np.asarray(X, dtype=np.float32)
+        n, d = X.shape
+        k = min(self.n_components, d, max(n - 1, 1))
+        if self.method == "pca":
+            from sklearn.decomposition import PCA
+            pca = PCA(n_components=k, svd_solver="randomized" if k < 0.8 * min(n, d) else "full",
+                      random_state=self.seed).fit(X)
+            self.mean_ = pca.mean_.astype(np.float32)
+            self.components_ = pca.components_.astype(np.float32)
+            self.explained_variance_ratio_ = float(pca.explained_variance_ratio_.sum())
+        else:
+            from sklearn.random_projection import GaussianRandomProjection
+            rp = GaussianRandomProjection(n_components=k, random_state=self.seed).fit(X)
+            self.mean_ = np.zeros(d, dtype=np.float32)
+            self.components_ = np.asarray(rp.components_, dtype=np.float32)
+            self.explained_variance_ratio_ = None
+        return self
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        if not self.fitted:
+            raise RuntimeError("EmbeddingReducer.transform() called before fit()")
+        X = np.asarray(X, dtype=np.float32)
+        return (X - self.mean_) @ self.components_.T
+
+    def fit_transform(self, X: np.ndarray) -> np.ndarray:
+        return self.fit(X).transform(X)
+
+    def report(self) -> dict:
+        return {
+            "method": self.method,
+            "input_dim": self.input_dim,
+            "output_dim": self.output_dim,
+            "explained_variance": self.explained_variance_ratio_,
+        }
+
+    def describe(self) -> str:
+        text = f"{self.method} {self.input_dim} → {self.output_dim} dims"
+        if self.explained_variance_ratio_ is not None:
+            text += f", {self.explained_variance_ratio_:.1%} variance explained"
+        return text
+
+    # ── Persistence ───────────────────────────────────────────────────────────
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        tmp = path.with_name(f"{path.stem}.tmp{os.getpid()}.npz")
+        np.savez(
+            tmp,
+            method=np.array(self.method),
+            seed=np.array(self.seed),
+            mean=self.mean_,
+            components=self.components_,
+            explained=np.array(np.nan if self.explained_variance_ratio_ is None
+                               else self.explained_variance_ratio_),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "EmbeddingReducer":
+        with np.load(Path(path)) as data:
+            components = data["components"]
+            reducer = cls(str(data["method"]), components.shape[0], int(data["seed"]))
+            reducer.mean_ = data["mean"]
+            reducer.components_ = components
+            explained = float(data["explained"])
+        reducer.explained_variance_ratio_ = None if np.isnan(explained) else explained
+        return reducer
+
+
+def reducer_from_env() -> Optional[EmbeddingReducer]:
+    """EmbeddingReducer configured by SMARTSORT_REDUCE / SMARTSORT_REDUCE_DIM, or None."""
+    method = os.environ.get("SMARTSORT_REDUCE", "").strip().lower()
+    if not method or method in ("0", "off", "none"):
+        return None
+    try:
+        dim = int(os.environ.get("SMARTSORT_REDUCE_DIM", DEFAULT_DIM))
+        return EmbeddingReducer(method, dim)
+    except ValueError as e:
+        print(f"[Reducer] Ignoring SMARTSORT_REDUCE: {e}", file=sys.stderr)
+        return None
@@ -0,0 +1,229 @@
+"""
+Columnar per-run file table.
+
+A sort used to copy every file through FileMeta → FileContent → EmbeddedFile
+→ ClusteredFile, one Python object (plus ISO strings and a raw_text copy) per
+stage.  FileTable keeps the same information as parallel arrays:
+
+  paths / names        -- list[str], shared by every stage
+  ext_codes/type_codes -- int16 / int8 codes into per-table vocabularies
+  sizes_kb             -- float32
+  ctimes / mtimes      -- float64 POSIX seconds
+  status_codes         -- int8 code into the status vocabulary
+  text + text_offsets  -- one str + int64 offsets (current identity text per row)
+  embedding_rows       -- int32 row into `embeddings` (-1 = no vector)
+  embeddings           -- (M, D) float32, one row per embedded file
+  labels               -- int32 cluster label (-1 = noise / unclustered)
+
+Agents work on the column views; meta(i), content(i), embedded(i) and
+clustered(i) rebuild the core.models dataclasses for code that still wants them.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .models import ClusteredFile, EmbeddedFile, FileContent, FileMeta
+
+# Seed order keeps status codes stable across tables.
+STATUSES = (
+    "pending", "success", "error", "embedded", "skipped",
+    "screenshot", "photo", "too_short", "clustered",
+)
+
+
+class _Vocab:
+    """String ↔ small-int code mapping for low-cardinality columns."""
+
+    __slots__ = ("values", "_codes")
+
+    def __init__(self, seed: Iterable[str] = ()):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+        for v in seed:
+            self.code(v)
+
+    def code(self, value: str) -> int:
+        c = self._codes.get(value)
+        if c is None:
+            c = len(self.values)
+            self._codes[value] = c
+            self.values.append(value)
+        return c
+
+    def lookup(self, value: str) -> int:
+        return self._codes.get(value, -1)
+
+
+def _iso_to_ts(value: str) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _ts_to_iso(ts: float) -> str:
+    return "" if np.isnan(ts) else datetime.fromtimestamp(float(ts)).isoformat()
+
+
+class FileTable:
+    """Column store for one sort run. Row i is the i-th ingested file."""
+
+    def __init__(self, metas: Sequence[FileMeta]):
+        n = len(metas)
+        self._exts = _Vocab()
+        self._types = _Vocab()
+        self._statuses = _Vocab(STATUSES)
+
+        self.paths: List[str] = [m.file_path for m in metas]
+        self.names: List[str] = [m.file_name for m in metas]
+        self.ext_codes = np.fromiter((self._exts.code(m.extension) for m in metas), dtype=np.int16, count=n)
+        self.type_codes = np.fromiter((self._types.code(m.detected_type) for m in metas), dtype=np.int8, count=n)
+        self.sizes_kb = np.fromiter((m.size_kb for m in metas), dtype=np.float32, count=n)
+        self.ctimes = np.fromiter((_iso_to_ts(m.created_at) for m in metas), dtype=np.float64, count=n)
+        self.mtimes = np.fromiter((_iso_to_ts(m.modified_at) for m in metas), dtype=np.float64, count=n)
+        self.meta_status_codes = np.fromiter((self._statuses.code(m.status) for m in metas), dtype=np.int8, count=n)
+
+        self.status_codes = np.full(n, self._statuses.lookup("pending"), dtype=np.int8)
+        self._text = ""
+        self.text_offsets = np.zeros(n + 1, dtype=np.int64)
+        self.embedding_rows = np.full(n, -1, dtype=np.int32)
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        self.labels = np.full(n, -1, dtype=np.int32)
+
+    # ── Construction from the legacy dataclasses ──────────────────────────────
+
+    @classmethod
+    def from_metas(cls, metas: Sequence[FileMeta]) -> "FileTable":
+        return cls(metas)
+
+    @classmethod
+    def from_contents(cls, contents: Sequence[FileContent]) -> "FileTable":
+        table = cls([c.file_meta for c in contents])
+        table.set_texts([c.raw_text or "" for c in contents])
+        table.set_statuses([c.status for c in contents])
+        return table
+
+    @classmethod
+    def from_embedded(cls, files: Sequence[EmbeddedFile]) -> "FileTable":
+        table = cls([f.file_meta for f in files])
+        table.set_texts([f.raw_text or "" for f in files])
+        table.set_statuses([f.status for f in files])
+        with_vec = [i for i, f in enumerate(files) if f.embedding is not None and len(f.embedding)]
+        if with_vec:
+            table.set_embeddings(
+                np.asarray(with_vec),
+                np.asarray([files[i].embedding for i in with_vec], dtype=np.float32),
+            )
+        return table
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    # ── Status column ─────────────────────────────────────────────────────────
+
+    def status(self, i: int) -> str:
+        return self._statuses.values[self.status_codes[i]]
+
+    def status_mask(self, *statuses: str) -> np.ndarray:
+        codes = [self._statuses.lookup(s) for s in statuses]
+        return np.isin(self.status_codes, codes)
+
+    def indices(self, *statuses: str) -> np.ndarray:
+        return np.flatnonzero(self.status_mask(*statuses))
+
+    def set_status(self, indices, status: str) -> None:
+        self.status_codes[indices] = self._statuses.code(status)
+
+    def set_statuses(self, statuses: Sequence[str]) -> None:
+        """Replace the whole status column, one status string per row."""
+        self.status_codes[:] = [self._statuses.code(s) for s in statuses]
+
+    def detected_type(self, i: int) -> str:
+        return self._types.values[self.type_codes[i]]
+
+    def modified_at(self, i: int) -> str:
+        return _ts_to_iso(self.mtimes[i])
+
+    # ── Text column ───────────────────────────────────────────────────────────
+
+    def set_texts(self, texts: Sequence[str]) -> None:
+        """Replace the text column wholesale (one join, no per-row strings kept)."""
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+        self.text_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        self._text = "".join(texts)
+
+    def text(self, i: int) -> str:
+        return self._text[self.text_offsets[i]:self.text_offsets[i + 1]]
+
+    def texts(self, indices: Optional[Iterable[int]] = None) -> List[str]:
+        rows = range(len(self)) if indices is None else indices
+        return [self.text(i) for i in rows]
+
+    # ── Embedding column ──────────────────────────────────────────────────────
+
+    def set_embeddings(self, indices: np.ndarray, vectors: np.ndarray) -> None:
+        """Store one vector per row in `indices`; rows are appended to the matrix."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(indices) == 0:
+            return
+        start = len(self.embeddings)
+        if start == 0:
+            self.embeddings = np.ascontiguousarray(vectors)
+        else:
+            self.embeddings = np.vstack([self.embeddings, vectors])
+        self.embedding_rows[indices] = np.arange(start, start + len(vectors), dtype=np.int32)
+
+    def embedding(self, i: int) -> Optional[np.ndarray]:
+        row = self.embedding_rows[i]
+        return None if row < 0 else self.embeddings[row]
+
+    def embedding_matrix(self, indices: np.ndarray) -> np.ndarray:
+        """(len(indices), D) float32 view-gather of the given rows' vectors."""
+        return self.embeddings[self.embedding_rows[indices]]
+
+    # ── Compatibility accessors ───────────────────────────────────────────────
+
+    def meta(self, i: int) -> FileMeta:
+        return FileMeta(
+            file_path=self.paths[i],
+            file_name=self.names[i],
+            extension=self._exts.values[self.ext_codes[i]],
+            detected_type=self._types.values[self.type_codes[i]],
+            size_kb=float(self.sizes_kb[i]),
+            created_at=_ts_to_iso(self.ctimes[i]),
+            modified_at=self.modified_at(i),
+            status=self._statuses.values[self.meta_status_codes[i]],
+        )
+
+    def content(self, i: int) -> FileContent:
+        return FileContent(file_meta=self.meta(i), raw_text=self.text(i), status=self.status(i))
+
+    def embedded(self, i: int) -> EmbeddedFile:
+        vec = self.embedding(i)
+        return EmbeddedFile(
+            file_meta=self.meta(i),
+            embedding=None if vec is None else vec.tolist(),
+            raw_text=self.text(i),
+            status=self.status(i),
+        )
+
+    def clustered(self, i: int) -> ClusteredFile:
+        vec = self.embedding(i)
+        return ClusteredFile(
+            file_meta=self.meta(i),
+            embedding=None if vec is None else vec.tolist(),
+            raw_text=self.text(i),
+            cluster_id=int(self.labels[i]),
+            status=self.status(i),
+        )
+
+    def embedded_files(self, *statuses: str) -> List[EmbeddedFile]:
+        rows = range(len(self)) if not statuses else self.indices(*statuses)
+        return [self.embedded(i) for i in rows]
+
+    def clustered_files(self) -> List[ClusteredFile]:
+        return [self.clustered(i) for i in self.indices("clustered")]
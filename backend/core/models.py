@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 
-@dataclass
+@dataclass(slots=True)
 class FileMeta:
     file_path: str
     file_name: str
@@ -11,20 +11,20 @@ class FileMeta:
     modified_at: str
     status: str = "pending"
 
-@dataclass
+@dataclass(slots=True)
 class FileContent:
     file_meta: FileMeta
     raw_text: str
     status: str = "success"
 
-@dataclass
+@dataclass(slots=True)
 class EmbeddedFile:
     file_meta: FileMeta
     embedding: list
     raw_text: str
     status: str = "embedded"
 
-@dataclass
+@dataclass(slots=True)
 class ClusteredFile:
     file_meta: FileMeta
     embedding: list[float]
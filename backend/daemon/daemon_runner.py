@@ -38,6 +38,8 @@ _DEFAULT_CONFIG: dict = {
     "similarity_threshold": 0.65,
     "recluster_queue_size": 20,
     "recluster_interval_days": 7,
+    "model_idle_timeout_minutes": 15,   # 0 keeps the model resident
+    "models": None,                     # model names the server may load; None = KNOWN_MODELS
 }
 
 
@@ -89,7 +91,12 @@ def run() -> None:
 
     # Start model server first so the pipeline subprocess can share it.
     # EmbeddingAgent will detect the server via /health and skip loading locally.
-    model_server = ModelServer()
+    idle_minutes = config.get("model_idle_timeout_minutes", 15)
+    model_server = ModelServer(
+        cache_path=SMARTSORT_DIR / "model_result_cache.pkl",
+        idle_timeout_s=idle_minutes * 60 if idle_minutes else None,
+        models=config.get("models"),
+    )
     model_server.start()
 
     agent = AssignmentAgent(threshold=config.get("similarity_threshold", 0.65))
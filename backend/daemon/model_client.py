@@ -0,0 +1,182 @@
+"""
+Pooled keep-alive client for the local model server.
+
+Each thread keeps one persistent HTTP/1.1 connection, preferring the Unix
+socket at MODEL_SERVER_SOCKET and falling back to TCP on MODEL_SERVER_URL.
+A connection the server has closed (idle reaping, daemon restart) is
+re-opened once transparently.
+
+embed_shm() is the bulk path: each thread also keeps a shared-memory arena
+(daemon/shm.py) and only a descriptor goes over the connection.
+
+call() follows the server's admission rules: it tells the server how long
+the caller will wait (X-SmartSort-Deadline), waits out a 503's Retry-After
+while that budget lasts, and raises ModelServerError for anything but 200.
+"""
+
+from __future__ import annotations
+
+import http.client
+import json
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from . import shm, wire
+from .model_server import MODEL_SERVER_SOCKET, MODEL_SERVER_URL
+
+_RETRYABLE = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+              BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+_DEADLINE_SLACK = 1.0   # socket timeout beyond the deadline, so the server's 504 arrives first
+
+
+class ModelServerError(RuntimeError):
+    def __init__(self, status: int, body: bytes):
+        try:
+            self.reply = json.loads(body)
+        except ValueError:
+            self.reply = {"error": body[:200].decode("utf-8", "replace")}
+        super().__init__(f"model server returned {status}: {self.reply.get('error', self.reply)}")
+        self.status = status
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self._path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class ModelServerClient:
+    def __init__(self, url: str = MODEL_SERVER_URL, socket_path: Optional[Path] = MODEL_SERVER_SOCKET):
+        parts = urlsplit(url)
+        self._host = parts.hostname or "127.0.0.1"
+        self._port = parts.port or 80
+        self._socket_path = str(socket_path) if socket_path and hasattr(socket, "AF_UNIX") else None
+        self._local = threading.local()
+
+    def _new_connection(self, timeout: float) -> http.client.HTTPConnection:
+        if self._socket_path and Path(self._socket_path).exists():
+            conn = _UnixHTTPConnection(self._socket_path, timeout)
+            try:
+                conn.connect()
+                return conn
+            except OSError:
+                pass  # stale socket file — fall back to TCP
+        return http.client.HTTPConnection(self._host, self._port, timeout=timeout)
+
+    def _connection(self, timeout: float) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._new_connection(timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            try:
+                conn.sock.settimeout(timeout)
+            except OSError:
+                conn.close()  # socket already torn down; reconnects on next request
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 30.0,
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Send one request on this thread's pooled connection; returns (status, headers, body)."""
+        for attempt in (0, 1):
+            conn = self._connection(timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+                if resp.will_close:
+                    self.close()
+                return resp.status, dict(resp.getheaders()), data
+            except _RETRYABLE:
+                self.close()
+                if attempt:
+                    raise
+            except Exception:
+                self.close()
+                raise
+        raise RuntimeError("unreachable")
+
+    def call(
+        self,
+        method: str,
+        path: str,
+        body: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 30.0,
+    ) -> Tuple[Dict[str, str], bytes]:
+        """request() under a deadline of timeout seconds; returns (headers, body) of a 200."""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = max(deadline - time.monotonic(), 0.001)
+            status, resp_headers, data = self.request(
+                method, path, body,
+                {**(headers or {}), wire.DEADLINE_HEADER: f"{remaining:.3f}"},
+                remaining + _DEADLINE_SLACK,
+            )
+            if status == 200:
+                return resp_headers, data
+            if status == 503:
+                try:
+                    wait = float(resp_headers.get("Retry-After", 1))
+                except ValueError:
+                    wait = 1.0
+                if time.monotonic() + wait < deadline:
+                    time.sleep(wait)
+                    continue
+            raise ModelServerError(status, data)
+
+    def embed_shm(self, texts: List[str], timeout: float = 60.0, headers: Optional[Dict[str, str]] = None) -> np.ndarray:
+        """Encode texts through this thread's shared-memory arena; returns (N, D) float32."""
+        arena = getattr(self._local, "arena", None)
+        if arena is None:
+            arena = self._local.arena = shm.ShmArena()
+        frame = wire.pack_texts(texts)
+        offset = shm.vectors_offset(len(frame))
+        needed = offset + len(texts) * getattr(self._local, "dim", 1024) * 4
+
+        for attempt in (0, 1):
+            arena.ensure(needed)
+            arena.write(0, frame)
+            desc = {"segment": arena.name, "texts_len": len(frame), "vectors_offset": offset}
+            try:
+                _, body = self.call(
+                    "POST", "/embed_shm", json.dumps(desc).encode(),
+                    {"Content-Type": "application/json", **(headers or {})}, timeout,
+                )
+            except ModelServerError as e:
+                if e.status != 507 or attempt:
+                    raise
+                needed = int(e.reply["needed"])
+                continue
+            reply = json.loads(body)
+            self._local.dim = reply["dim"]
+            return arena.read_vectors(offset, reply["rows"], reply["dim"])
+        raise RuntimeError("unreachable")
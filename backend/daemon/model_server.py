@@ -2,117 +2,863 @@
 Lightweight local HTTP model server — loads sentence-transformers once,
 serves embeddings to any local process.
 
-GET  /health       →  {"status": "ok", "model": "<name>"}
-POST /embed        →  {"text": "..."}          →  {"embedding": [...]}
-POST /embed_batch  →  {"texts": ["...", ...]}  →  {"embeddings": [[...], ...]}
+GET  /health       →  {"status": "ok", "model": "<default>", "models": {...}, ...}
+POST /embed        →  {"text": "...", "model"?: "..."}          →  {"embedding": [...]}
+POST /embed_batch  →  {"texts": ["...", ...], "model"?: "..."}  →  {"embeddings": [[...], ...]}
+
+Several models can be hosted at once (_ModelPool). A request names its model
+with X-SmartSort-Model or a "model" field, else gets the default one; names
+outside the configured set (KNOWN_MODELS unless the daemon config lists its
+own "models") are refused with 400 rather than fetched. Models
+load on first use and the least recently used idle ones are unloaded when the
+loaded set outgrows MODEL_MEMORY_BUDGET_MB. With idle_timeout_s set, models
+with no work for that long are unloaded too and reload on the next request.
+/health has per-model state (loaded / loading / unloaded) and counters.
+
+Both POST routes also take the binary framing in daemon/wire.py: send
+Content-Type: application/x-smartsort-texts and/or
+Accept: application/x-smartsort-vectors to skip JSON on either leg.
+
+Requests are accepted on a thread per connection and handed to a single
+_MicroBatcher worker, which waits up to BATCH_WINDOW_S after the first pending
+request and folds everything queued (up to MAX_BATCH texts) into one
+model.encode() call. Each caller gets back exactly its own rows. Requests
+bigger than MAX_BATCH are fed through in MAX_BATCH-sized chunks that take
+turns with everyone else's, so one huge batch cannot starve per-file calls.
+
+The same handler also listens on MODEL_SERVER_SOCKET (~/.smartsort/model.sock)
+and speaks HTTP/1.1 keep-alive, so local clients (daemon/model_client.py)
+hold one pooled connection instead of a TCP handshake per file.
+
+POST /embed_shm is the bulk path: texts and vectors stay in a client-owned
+shared-memory segment and only a descriptor crosses the socket (daemon/shm.py).
+
+Every POST may carry X-SmartSort-Priority: interactive | daemon | background.
+Each lane has its own queue and a weight (LANE_WEIGHTS); every model call is
+split between the non-empty lanes by weight and any room left over goes to the
+highest lane with work. A sort the user is watching therefore takes most of
+each batch while a background burst keeps trickling through behind it.
+
+Admission control keeps one caller from wedging the rest:
+  - bodies over MAX_BODY_BYTES and requests over MAX_TEXTS are refused (413)
+  - each lane holds at most MAX_QUEUED_TEXTS; a full lane answers 503 with a
+    Retry-After estimate instead of queueing without bound
+  - X-SmartSort-Deadline (seconds the caller will wait) turns into a 504 once
+    it passes, and the request's unsent chunks are dropped
+  - a caller that hangs up while queued is noticed and its work is dropped
+
+Before anything is queued, texts are looked up in a ResultCache keyed by
+(model, sha1(text)) (daemon/result_cache.py) shared by every client; only the
+misses reach the model, once each. Hit/miss counts are in /health.
 
 Start from daemon_runner.py before watchdog so the pipeline subprocess
 can share model weights via localhost instead of loading a second copy.
+The model itself comes from agents.model_registry, so the daemon's own
+AssignmentAgent encodes with the same resident copy.
 """
 
 from __future__ import annotations
 
 import json
+import math
+import os
+import select
+import socket
+import socketserver
 import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from typing import Optional
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from . import shm, wire
+from .result_cache import ResultCache
 
 MODEL_SERVER_PORT = 7234
 MODEL_SERVER_URL = f"http://127.0.0.1:{MODEL_SERVER_PORT}"
+MODEL_SERVER_SOCKET = Path.home() / ".smartsort" / "model.sock"
 _DEFAULT_MODEL = "all-MiniLM-L6-v2"
+KNOWN_MODELS = frozenset({
+    "all-MiniLM-L6-v2",
+    "all-MiniLM-L12-v2",
+    "all-mpnet-base-v2",
+    "multi-qa-MiniLM-L6-cos-v1",
+    "paraphrase-multilingual-MiniLM-L12-v2",
+})
+
+BATCH_WINDOW_S = 0.005   # how long the first queued request waits for company
+MAX_BATCH = 256          # texts per model.encode() call
+
+LANES = ("interactive", "daemon", "background")   # highest priority first
+LANE_WEIGHTS = {"interactive": 8, "daemon": 3, "background": 1}
+DEFAULT_LANE = "daemon"
+
+MAX_BODY_BYTES = 16 << 20    # 16 MiB of request body
+MAX_TEXTS = 4096             # texts per request; clients split bigger batches
+MAX_QUEUED_TEXTS = 16384     # per lane
+MODEL_MEMORY_BUDGET_MB = 2048  # parameters of all loaded models together
+_POLL_S = 0.05               # how often a waiting request checks its deadline / caller
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"queue full, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Cancelled(Exception):
+    pass
+
+
+class ShuttingDown(Exception):
+    pass
+
+
+class UnknownModel(ValueError):
+    pass
+
+
+# ── Micro-batching ────────────────────────────────────────────────────────────
+
+class _Pending:
+    """One caller's request: its texts, a cursor, and the rows encoded so far."""
+
+    __slots__ = ("texts", "lane", "deadline", "cursor", "chunks", "error", "done")
+
+    def __init__(self, texts: List[str], lane: str, deadline: Optional[float] = None):
+        self.texts = texts
+        self.lane = lane
+        self.deadline = deadline  # time.monotonic() value, or None
+        self.cursor = 0
+        self.chunks: List[np.ndarray] = []
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+    @property
+    def remaining(self) -> int:
+        return len(self.texts) - self.cursor
+
+
+class _MicroBatcher:
+    """Coalesces concurrent encode requests into shared model calls."""
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        window: float = BATCH_WINDOW_S,
+        max_batch: int = MAX_BATCH,
+        max_queued: int = MAX_QUEUED_TEXTS,
+    ):
+        self._encode = encode_fn
+        self.window = window
+        self.max_batch = max_batch
+        self.max_queued = max_queued
+        self._queues: Dict[str, deque] = {lane: deque() for lane in LANES}
+        self._lane_texts: Dict[str, int] = dict.fromkeys(LANES, 0)
+        self._queued_texts = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+        self.batches = 0
+        self.texts_encoded = 0
+        self.rejected = 0
+        self.expired = 0
+        self.cancelled = 0
+        self._batch_seconds = 0.05   # moving average, feeds Retry-After
+        self._thread = threading.Thread(target=self._run, daemon=True, name="model-batcher")
+        self._thread.start()
 
+    def submit(
+        self,
+        texts: List[str],
+        lane: str = DEFAULT_LANE,
+        deadline: Optional[float] = None,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+    ) -> np.ndarray:
+        """Block until every text is encoded; returns (len(texts), D) float32.
+
+        Raises QueueFull if lane is at capacity, DeadlineExceeded once the
+        monotonic deadline passes, Cancelled when is_cancelled() turns true,
+        and ShuttingDown if the batcher stops before the texts are encoded.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        if lane not in LANE_WEIGHTS:
+            raise ValueError(f"unknown priority lane: {lane}")
+        item = _Pending(list(texts), lane, deadline)
+        with self._cond:
+            if self._stopped:
+                raise ShuttingDown("model is being unloaded")
+            queued = self._lane_texts[lane]
+            if queued and queued + len(item.texts) > self.max_queued:
+                self.rejected += 1
+                raise QueueFull(self._retry_after(queued))
+            self._queues[lane].append(item)
+            self._lane_texts[lane] += len(item.texts)
+            self._queued_texts += len(item.texts)
+            self._cond.notify()
+
+        poll = _POLL_S if deadline is not None or is_cancelled is not None else None
+        while not item.done.wait(poll):
+            if deadline is not None and time.monotonic() >= deadline:
+                self._abandon(item, DeadlineExceeded("deadline passed while queued"))
+            elif is_cancelled is not None and is_cancelled():
+                self._abandon(item, Cancelled("caller disconnected"))
+        if item.error is not None:
+            raise item.error
+        return item.chunks[0] if len(item.chunks) == 1 else np.vstack(item.chunks)
+
+    def _retry_after(self, queued: int) -> float:
+        return max(1.0, queued / self.max_batch * self._batch_seconds)
+
+    def _abandon(self, item: _Pending, error: Exception) -> None:
+        with self._cond:
+            if item.done.is_set():
+                return
+            self._drop(item)
+            if isinstance(error, DeadlineExceeded):
+                self.expired += 1
+            else:
+                self.cancelled += 1
+            item.error = error
+            item.done.set()
+
+    def _drop(self, item: _Pending) -> None:
+        """Take item's unsent texts out of the queue (caller holds _cond)."""
+        queue = self._queues[item.lane]
+        if item in queue:
+            queue.remove(item)
+            self._lane_texts[item.lane] -= item.remaining
+            self._queued_texts -= item.remaining
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queued_requests": sum(len(q) for q in self._queues.values()),
+                "queued_texts": self._queued_texts,
+                "batches": self.batches,
+                "texts_encoded": self.texts_encoded,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "cancelled": self.cancelled,
+                "lanes": {
+                    lane: {"queued_requests": len(self._queues[lane]), "queued_texts": self._lane_texts[lane]}
+                    for lane in LANES
+                },
+            }
+
+    def stop(self) -> None:
+        """Stop the worker and fail every queued request with ShuttingDown.
+
+        A batch already handed to the model still completes; requests that
+        had only part of their texts in it fail with the rest.
+        """
+        with self._cond:
+            self._stopped = True
+            for lane, queue in self._queues.items():
+                while queue:
+                    item = queue.popleft()
+                    item.error = ShuttingDown("model is being unloaded")
+                    item.done.set()
+                self._lane_texts[lane] = 0
+            self._queued_texts = 0
+            self._cond.notify()
+
+    def _take_from(self, lane: str, budget: int, taken: list) -> int:
+        """Round-robin one chunk per request of lane, up to budget texts; returns texts taken."""
+        queue = self._queues[lane]
+        now = time.monotonic()
+        used = 0
+        for _ in range(len(queue)):
+            if used == budget:
+                break
+            item = queue.popleft()
+            if item.deadline is not None and item.deadline <= now:
+                # its caller has given up (or is about to); don't spend the model on it
+                self._lane_texts[lane] -= item.remaining
+                self._queued_texts -= item.remaining
+                continue
+            n = min(item.remaining, budget - used)
+            taken.append((item, item.cursor, item.cursor + n))
+            item.cursor += n
+            used += n
+            if item.remaining:
+                queue.append(item)  # unfinished giants go to the back of their lane
+        self._lane_texts[lane] -= used
+        self._queued_texts -= used
+        return used
+
+    def _take_batch(self) -> list:
+        """Pop up to max_batch texts, shared between lanes by weight (caller holds _cond)."""
+        taken = []  # (item, start, end)
+        active = [lane for lane in LANES if self._queues[lane]]
+        total_weight = sum(LANE_WEIGHTS[lane] for lane in active)
+        room = self.max_batch
+        for lane in active:
+            share = max(1, self.max_batch * LANE_WEIGHTS[lane] // total_weight)
+            room -= self._take_from(lane, min(share, room), taken)
+        for lane in active:  # leftover room, highest lane first
+            if room == 0:
+                break
+            room -= self._take_from(lane, room, taken)
+        return taken
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queued_texts and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                deadline = time.monotonic() + self.window
+                while self._queued_texts < self.max_batch:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                taken = self._take_batch()
+
+            texts = [t for item, start, end in taken for t in item.texts[start:end]]
+            if not texts:
+                continue
+            started = time.monotonic()
+            try:
+                vecs = np.asarray(self._encode(texts), dtype=np.float32).reshape(len(texts), -1)
+            except Exception as exc:
+                for item, _, _ in taken:
+                    item.error = exc
+                    item.done.set()
+                with self._cond:
+                    for item, _, _ in taken:
+                        self._drop(item)
+                continue
+
+            self._batch_seconds = 0.8 * self._batch_seconds + 0.2 * (time.monotonic() - started)
+            self.batches += 1
+            self.texts_encoded += len(texts)
+            offset = 0
+            for item, start, end in taken:
+                item.chunks.append(vecs[offset:offset + (end - start)])
+                offset += end - start
+                if item.cursor == len(item.texts) and sum(len(c) for c in item.chunks) == len(item.texts):
+                    item.done.set()
+
+
+# ── HTTP ──────────────────────────────────────────────────────────────────────
 
 class _EmbedHandler(BaseHTTPRequestHandler):
     server: "_ModelHTTPServer"
+    protocol_version = "HTTP/1.1"   # keep-alive; every response sets Content-Length
+    timeout = 300                   # reap idle pooled connections
 
     def log_message(self, format, *args):
         pass  # silence per-request access log
 
     def do_GET(self):
         if self.path == "/health":
-            self._send_json(200, {"status": "ok", "model": self.server.model_name})
+            pool = self.server.pool
+            models = pool.stats()
+            self._send_json(200, {
+                "status": "ok",
+                "model": self.server.model_name,
+                "batcher": models.get(self.server.model_name, {}).get("batcher", {}),
+                "models": models,
+                "memory": {
+                    "budget_mb": pool.budget_bytes >> 20,
+                    "resident_mb": round(pool.resident_bytes() / 2**20, 1),
+                    "evictions": pool.evictions,
+                    "idle_timeout_s": pool.idle_timeout,
+                },
+                "cache": self.server.cache.stats(),
+                "shm_segments": len(self.server.shm),
+            })
         else:
             self._send_json(404, {"error": "not found"})
 
     def do_POST(self):
-        if self.path == "/embed_batch":
+        try:
             length = int(self.headers.get("Content-Length", 0))
-            body = self.rfile.read(length)
-            try:
-                payload = json.loads(body)
-                texts = [str(t) for t in payload.get("texts", [])]
-            except Exception:
-                self._send_json(400, {"error": "invalid JSON"})
-                return
-            try:
-                with self.server.lock:
-                    vecs = self.server.model.encode(texts, convert_to_numpy=True)
-                self._send_json(200, {"embeddings": vecs.tolist()})
-            except Exception as exc:
-                self._send_json(500, {"error": str(exc)})
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_BODY_BYTES:
+            # Not worth reading; hang up afterwards rather than drain it.
+            self.close_connection = True
+            self._send_json(413, {"error": f"request body must be at most {MAX_BODY_BYTES} bytes"})
             return
+        # Always drain the body first so a kept-alive connection stays in sync.
+        body = self.rfile.read(length)
 
-        if self.path != "/embed":
+        if self.path == "/embed_shm":
+            self._embed_shm(body)
+            return
+        if self.path not in ("/embed", "/embed_batch"):
             self._send_json(404, {"error": "not found"})
             return
+        single = self.path == "/embed"
 
-        length = int(self.headers.get("Content-Length", 0))
-        body = self.rfile.read(length)
+        model = self.headers.get(wire.MODEL_HEADER)
         try:
-            payload = json.loads(body)
-            text = str(payload.get("text", ""))
+            if self.headers.get("Content-Type", "").startswith(wire.TEXTS_CONTENT_TYPE):
+                texts = wire.unpack_texts(body)
+            else:
+                payload = json.loads(body)
+                texts = [str(payload.get("text", ""))] if single else [str(t) for t in payload.get("texts", [])]
+                model = payload.get("model") or model
         except Exception:
-            self._send_json(400, {"error": "invalid JSON"})
+            self._send_json(400, {"error": "invalid request body"})
+            return
+
+        vecs = self._submit(model, texts)
+        if vecs is None:
             return
 
+        dtype = wire.accepted_dtype(self.headers.get("Accept", ""))
+        if dtype is not None:
+            self._send_bytes(200, wire.pack_vectors(vecs, dtype), wire.VECTORS_CONTENT_TYPE)
+        elif single:
+            self._send_json(200, {"embedding": vecs[0].tolist()})
+        else:
+            self._send_json(200, {"embeddings": vecs.tolist()})
+
+    def _lane(self) -> str:
+        lane = self.headers.get(wire.PRIORITY_HEADER, "").strip().lower()
+        return lane if lane in LANE_WEIGHTS else DEFAULT_LANE
+
+    def _deadline(self) -> Optional[float]:
         try:
-            with self.server.lock:
-                vec = self.server.model.encode(text, convert_to_numpy=True)
-            self._send_json(200, {"embedding": vec.tolist()})
+            return time.monotonic() + float(self.headers[wire.DEADLINE_HEADER])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _client_gone(self) -> bool:
+        """True once the caller has hung up (readable with nothing left to read)."""
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except (OSError, ValueError):
+            return True
+
+    def _submit(self, model: Optional[str], texts: List[str]) -> Optional[np.ndarray]:
+        """Encode texts with model; on failure replies with the error and returns None."""
+        if len(texts) > MAX_TEXTS:
+            self._send_json(413, {"error": f"at most {MAX_TEXTS} texts per request"})
+            return None
+        try:
+            return self.server.pool.embed(
+                model, texts, self._lane(), deadline=self._deadline(), is_cancelled=self._client_gone,
+            )
+        except QueueFull as exc:
+            self._send_json(503, {"error": str(exc)}, {"Retry-After": str(math.ceil(exc.retry_after))})
+        except DeadlineExceeded as exc:
+            self._send_json(504, {"error": str(exc)})
+        except ShuttingDown as exc:
+            self._send_json(503, {"error": str(exc)}, {"Retry-After": "1"})
+        except UnknownModel as exc:
+            self._send_json(400, {"error": str(exc)})
+        except Cancelled:
+            self.close_connection = True  # nobody is listening
         except Exception as exc:
             self._send_json(500, {"error": str(exc)})
+        return None
 
-    def _send_json(self, code: int, data: dict) -> None:
-        body = json.dumps(data).encode()
+    def _embed_shm(self, body: bytes) -> None:
+        try:
+            desc = json.loads(body)
+            seg = self.server.shm.get(str(desc["segment"]))
+            texts = shm.read_texts(seg, int(desc["texts_len"]))
+            offset = int(desc["vectors_offset"])
+            model = desc.get("model") or self.headers.get(wire.MODEL_HEADER)
+        except Exception:
+            self._send_json(400, {"error": shm.DESCRIPTOR_ERROR})
+            return
+
+        vecs = self._submit(model, texts)
+        if vecs is None:
+            return
+
+        needed = shm.write_vectors(seg, offset, vecs)
+        if needed is not None:
+            self._send_json(507, {"needed": needed})
+        else:
+            self._send_json(200, {"rows": int(vecs.shape[0]), "dim": int(vecs.shape[1])})
+
+    def _send_json(self, code: int, data: dict, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_bytes(code, json.dumps(data).encode(), "application/json", headers)
+
+    def _send_bytes(
+        self, code: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None,
+    ) -> None:
         self.send_response(code)
-        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Type", content_type)
         self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
         self.end_headers()
         self.wfile.write(body)
 
 
-class _ModelHTTPServer(HTTPServer):
-    def __init__(self, model_name: str, port: int):
+# ── Model pool ────────────────────────────────────────────────────────────────
+
+def _resident_bytes(encoder) -> int:
+    """Parameter bytes of a loaded SentenceTransformer (0 if it can't be measured)."""
+    try:
+        return int(sum(p.numel() * p.element_size() for p in encoder.model.parameters()))
+    except Exception:
+        return 0
+
+
+class _ModelSlot:
+    """One hosted model: its encoder and batcher while loaded, its counters always."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.encoder = None
+        self.batcher: Optional[_MicroBatcher] = None
+        self.resident_bytes = 0
+        self.active = 0          # requests currently using the batcher
+        self.requests = 0
+        self.texts = 0
+        self.loads = 0
+        self.unloads = 0
+        self.loading = False
+        self.last_load_s: Optional[float] = None
+        self.last_used = time.monotonic()
+        self.load_lock = threading.Lock()
+        self.load_error: Optional[Exception] = None  # set when the slot is dropped after a failed load
+
+    @property
+    def loaded(self) -> bool:
+        return self.batcher is not None
+
+    @property
+    def state(self) -> str:
+        return "loading" if self.loading else "loaded" if self.loaded else "unloaded"
+
+    def stats(self) -> dict:
+        out = {
+            "state": self.state,
+            "loaded": self.loaded,
+            "resident_mb": round(self.resident_bytes / 2**20, 1),
+            "requests": self.requests,
+            "texts": self.texts,
+            "loads": self.loads,
+            "unloads": self.unloads,
+            "last_load_s": self.last_load_s,
+            "idle_s": round(time.monotonic() - self.last_used, 1),
+        }
+        if self.batcher is not None:
+            out["batcher"] = self.batcher.stats()
+        return out
+
+
+class _ModelPool:
+    """Named models loaded on first use, each with its own batcher.
+
+    When the loaded models' parameters add up to more than budget_bytes, the
+    least recently used idle models are unloaded until they fit again. The
+    default model is never evicted: the daemon's own agents run on it.
+
+    With an idle_timeout, a reaper thread also unloads any model — the default
+    included — that has had no work for that long. Its slot and the daemon's
+    routing stay in place, so the next request simply reloads it, from the
+    memory-mapped snapshot in agents/model_weights.py.
+
+    Only the default model and those in models (KNOWN_MODELS if None) are
+    served; anything else raises UnknownModel. A slot whose load fails is
+    dropped, so the next request starts a fresh load.
+    """
+
+    def __init__(
+        self,
+        default_model: str,
+        cache: ResultCache,
+        budget_bytes: int,
+        idle_timeout: Optional[float] = None,
+        models: Optional[Iterable[str]] = None,
+    ):
+        self.default_model = default_model
+        self.models = frozenset(KNOWN_MODELS if models is None else models) | {default_model}
+        self.cache = cache
+        self.budget_bytes = budget_bytes
+        self.idle_timeout = idle_timeout
+        self.evictions = 0
+        self._slots: Dict[str, _ModelSlot] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+    def embed(
+        self,
+        model: Optional[str],
+        texts: List[str],
+        lane: str = DEFAULT_LANE,
+        deadline: Optional[float] = None,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+    ) -> np.ndarray:
+        """Cached rows straight from the ResultCache; each distinct miss encoded once."""
+        model = model or self.default_model
+        if model not in self.models:
+            raise UnknownModel(f"unknown model: {model}")
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        with self._lock:
+            slot = self._slots.setdefault(model, _ModelSlot(model))
+            slot.requests += 1
+            slot.texts += len(texts)
+            slot.last_used = time.monotonic()
+
+        found, missing = self.cache.lookup(model, texts)
+        if not missing:
+            return np.stack([found[i] for i in range(len(texts))])
+
+        unique = list(dict.fromkeys(texts[i] for i in missing))
+        self._acquire(slot)
+        try:
+            vecs = slot.batcher.submit(unique, lane, deadline=deadline, is_cancelled=is_cancelled)
+        finally:
+            self._release(slot)
+        self.cache.store(model, unique, vecs)
+
+        row = {text: r for r, text in enumerate(unique)}
+        out = np.empty((len(texts), vecs.shape[1]), dtype=np.float32)
+        out[missing] = vecs[[row[texts[i]] for i in missing]]
+        for i, vec in found.items():
+            out[i] = vec
+        return out
+
+    def preload(self, model: str) -> None:
+        if model not in self.models:
+            raise UnknownModel(f"unknown model: {model}")
+        with self._lock:
+            slot = self._slots.setdefault(model, _ModelSlot(model))
+        self._acquire(slot)
+        self._release(slot)
+
+    def slot(self, model: str) -> Optional[_ModelSlot]:
+        return self._slots.get(model)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: slot.stats() for name, slot in self._slots.items()}
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(s.resident_bytes for s in self._slots.values() if s.loaded)
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            for slot in self._slots.values():
+                if slot.loaded:
+                    self._unload(slot, forget=True)
+
+    def start_reaper(self) -> None:
+        if not self.idle_timeout:
+            return
+        interval = min(30.0, max(self.idle_timeout / 4, 0.05))
+
+        def reap():
+            while not self._closed.wait(interval):
+                self.unload_idle()
+
+        threading.Thread(target=reap, daemon=True, name="model-reaper").start()
+
+    def unload_idle(self) -> List[str]:
+        """Unload every model idle for at least idle_timeout; returns their names."""
+        if not self.idle_timeout:
+            return []
+        now = time.monotonic()
+        unloaded = []
+        with self._lock:
+            for slot in self._slots.values():
+                if (slot.loaded and slot.active == 0 and not slot.loading
+                        and now - slot.last_used >= self.idle_timeout
+                        and slot.batcher.stats()["queued_texts"] == 0):
+                    print(f"[ModelServer] {slot.name} idle for {now - slot.last_used:.0f}s — unloading.")
+                    self._unload(slot, forget=False)
+                    unloaded.append(slot.name)
+        return unloaded
+
+    def _acquire(self, slot: _ModelSlot) -> None:
+        with self._lock:
+            slot.active += 1
+        try:
+            if not slot.loaded:
+                with slot.load_lock:
+                    if slot.load_error is not None:
+                        raise slot.load_error  # waited on a load that failed
+                    if not slot.loaded:
+                        slot.loading = True
+                        try:
+                            self._load(slot)
+                        except Exception as exc:
+                            slot.load_error = exc
+                            with self._lock:
+                                if self._slots.get(slot.name) is slot:
+                                    del self._slots[slot.name]
+                            raise
+                        finally:
+                            slot.loading = False
+        except Exception:
+            self._release(slot)
+            raise
+
+    def _release(self, slot: _ModelSlot) -> None:
+        with self._lock:
+            slot.active -= 1
+
+    def _load(self, slot: _ModelSlot) -> None:
+        # Registered process-wide so in-daemon agents share this copy.
+        from ..agents.model_registry import load_local, route_local
+        print(f"[ModelServer] Loading {slot.name}…")
+        started = time.monotonic()
+        encoder = load_local(slot.name)
+        with self._lock:
+            slot.encoder = encoder
+            slot.resident_bytes = _resident_bytes(encoder)
+            slot.batcher = _MicroBatcher(encoder.encode)
+            slot.loads += 1
+            slot.last_load_s = round(time.monotonic() - started, 3)
+        route_local(slot.name, lambda texts, lane, _name=slot.name: self.embed(_name, texts, lane))
+        print(
+            f"[ModelServer] {slot.name} ready in {slot.last_load_s:.2f}s"
+            f" ({slot.resident_bytes / 2**20:.0f} MB)."
+        )
+        self._evict_over_budget()
+
+    def _evict_over_budget(self) -> None:
+        with self._lock:
+            total = sum(s.resident_bytes for s in self._slots.values() if s.loaded)
+            idle = sorted(
+                (s for s in self._slots.values()
+                 if s.loaded and s.active == 0 and s.name != self.default_model),
+                key=lambda s: s.last_used,
+            )
+            for slot in idle:
+                if total <= self.budget_bytes:
+                    break
+                total -= slot.resident_bytes
+                print(f"[ModelServer] Evicting {slot.name} to stay under the memory budget.")
+                self._unload(slot, forget=True)
+                self.evictions += 1
+
+    def _unload(self, slot: _ModelSlot, forget: bool) -> None:
+        """Drop slot's weights (caller holds _lock).
+
+        forget=True also removes the model from the registry and the daemon's
+        routing; an idle unload keeps both so in-daemon callers reload it.
+        """
+        from ..agents.model_registry import route_local, unload_local
+        slot.batcher.stop()
+        slot.batcher = None
+        if hasattr(slot.encoder, "unload"):
+            slot.encoder.unload()  # agents may still hold the encoder object itself
+        slot.encoder = None
+        slot.resident_bytes = 0
+        slot.unloads += 1
+        if forget:
+            route_local(slot.name, None)
+            unload_local(slot.name)
+
+
+# ── Servers ───────────────────────────────────────────────────────────────────
+
+class _ModelHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, pool: _ModelPool):
         super().__init__(("127.0.0.1", port), _EmbedHandler)
-        self.model_name = model_name
-        self.lock = threading.Lock()
-        from sentence_transformers import SentenceTransformer
-        print(f"[ModelServer] Loading {model_name}…")
-        self.model = SentenceTransformer(model_name)
+        self.model_name = pool.default_model
+        self.pool = pool
+        self.cache = pool.cache
+        self.shm = shm.ShmAttachments()
+        pool.preload(pool.default_model)
         print(f"[ModelServer] Model ready.")
 
 
+if hasattr(socketserver, "UnixStreamServer"):
+    class _ModelUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """Same handler on a Unix socket; shares the TCP server's model pool."""
+
+        daemon_threads = True
+
+        def __init__(self, path: str, tcp: _ModelHTTPServer):
+            super().__init__(path, _EmbedHandler)
+            os.chmod(path, 0o600)
+            self.model_name = tcp.model_name
+            self.pool = tcp.pool
+            self.cache = tcp.cache
+            self.shm = tcp.shm
+else:  # Windows
+    _ModelUnixServer = None
+
+
 class ModelServer:
-    """Manages a background-thread HTTP server for model inference."""
+    """Manages background-thread HTTP servers (TCP + Unix socket) for model inference."""
 
-    def __init__(self, model_name: str = _DEFAULT_MODEL, port: int = MODEL_SERVER_PORT):
+    def __init__(
+        self,
+        model_name: str = _DEFAULT_MODEL,
+        port: int = MODEL_SERVER_PORT,
+        socket_path: Optional[Path] = MODEL_SERVER_SOCKET,
+        cache_path: Optional[Path] = None,
+        memory_budget_mb: int = MODEL_MEMORY_BUDGET_MB,
+        idle_timeout_s: Optional[float] = None,
+        models: Optional[Iterable[str]] = None,
+    ):
         self.model_name = model_name
         self.port = port
+        self.cache = ResultCache(path=cache_path)
+        self.memory_budget_mb = memory_budget_mb
+        self.idle_timeout_s = idle_timeout_s
+        self.models = models
+        self.socket_path = Path(socket_path) if socket_path and _ModelUnixServer else None
         self._server: Optional[_ModelHTTPServer] = None
-        self._thread: Optional[threading.Thread] = None
+        self._unix_server = None
 
     def start(self) -> None:
-        self._server = _ModelHTTPServer(self.model_name, self.port)
-        self._thread = threading.Thread(
-            target=self._server.serve_forever,
-            daemon=True,
-            name="model-server",
+        self.cache.load()
+        pool = _ModelPool(
+            self.model_name, self.cache, self.memory_budget_mb << 20, self.idle_timeout_s, self.models,
         )
-        self._thread.start()
+        self._server = _ModelHTTPServer(self.port, pool)
+        pool.start_reaper()
+        self.port = self._server.server_address[1]  # resolves port=0
+        self._serve(self._server, "model-server")
         print(f"[ModelServer] Listening on 127.0.0.1:{self.port}")
 
+        if self.socket_path is not None:
+            try:
+                self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+                self.socket_path.unlink(missing_ok=True)  # stale socket from a crash
+                self._unix_server = _ModelUnixServer(str(self.socket_path), self._server)
+                self._serve(self._unix_server, "model-server-unix")
+                print(f"[ModelServer] Listening on {self.socket_path}")
+            except OSError as exc:
+                print(f"[ModelServer] Unix socket unavailable ({exc}) — TCP only.")
+                self._unix_server = None
+
+    def _serve(self, server, name: str) -> None:
+        threading.Thread(target=server.serve_forever, daemon=True, name=name).start()
+
     def stop(self) -> None:
+        if self._unix_server:
+            self._unix_server.shutdown()
+            self._unix_server.server_close()
+            self._unix_server = None
+            self.socket_path.unlink(missing_ok=True)
         if self._server:
             self._server.shutdown()
+            self._server.server_close()
+            self._server.pool.close()
+            self._server.shm.close()
             self._server = None
+            self.cache.save()
         print("[ModelServer] Stopped.")
@@ -0,0 +1,187 @@
+"""
+Incremental re-clustering of the daemon's unassigned queue.
+
+Files the AssignmentAgent could not place pile up in unassigned_queue.json.
+Rather than re-sorting the whole library, IncrementalReclusterer works on
+the queue alone:
+
+  1. extract + embed only the queued files (EmbeddingAgent.embed_table, so
+     the embedding cache is reused)
+  2. pull each queued file's k nearest indexed neighbours out of the
+     agent's faiss index
+  3. HDBSCAN over queued files + neighbours together, projected through the
+     reducer the index was clustered with (reducer.npz) if there is one, so
+     new folders are found in the same space as the existing ones
+  4. a cluster becomes a new folder only if it holds at least
+     min_cluster_size queued files and they are at least min_new_share of
+     its members; a dense group that is mostly indexed files is the fringe
+     of an existing folder, not a new topic, and stays queued
+  5. name the new clusters, move their files next to where they were
+     queued, and fold them into the index in one atomic write
+     (index_manager.update_index)
+
+Everything else stays in the queue for the next round. Neighbours only give
+the clustering context; they are never moved.
+"""
+
+from __future__ import annotations
+
+import shutil
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+import numpy as np
+
+from ..agents.index_manager import load_reducer, normalize, update_index
+from .watcher import _safe_dest
+
+if TYPE_CHECKING:
+    from ..agents.assignment_agent import AssignmentAgent
+
+NEIGHBOURS = 10
+MIN_NEW_SHARE = 0.5
+
+
+@dataclass
+class ReclusterResult:
+    folders: Dict[int, str] = field(default_factory=dict)            # new cluster_id → folder
+    moves: List[Tuple[str, str, int, float]] = field(default_factory=list)  # (src, dest, cid, sim)
+    remaining: List[str] = field(default_factory=list)               # still unassigned
+
+
+class IncrementalReclusterer:
+    def __init__(
+        self,
+        agent: "AssignmentAgent",
+        min_cluster_size: int = 3,
+        neighbours: int = NEIGHBOURS,
+        min_new_share: float = MIN_NEW_SHARE,
+    ):
+        self.agent = agent
+        self.min_cluster_size = min_cluster_size
+        self.neighbours = neighbours
+        self.min_new_share = min_new_share
+
+    def run(self, paths: List[str]) -> ReclusterResult:
+        from ..agents.assignment_agent import file_meta
+        from ..core.file_table import FileTable
+
+        result = ReclusterResult()
+        existing = [Path(p) for p in dict.fromkeys(paths) if Path(p).is_file()]
+        if len(existing) < self.min_cluster_size:
+            result.remaining = [str(p) for p in existing]
+            return result
+
+        extracted = [self.agent.extractor.route(file_meta(p)) for p in existing]
+        table = self.agent.embedder.embed_table(FileTable.from_contents(extracted))
+        rows = table.indices("embedded")
+        rows = rows[table.embedding_rows[rows] >= 0]
+        vectors = table.embedding_matrix(rows)
+
+        reducer = load_reducer(self.agent.index_dir)
+        labels = (self._cluster(normalize(vectors), reducer)
+                  if len(rows) >= self.min_cluster_size else np.array([]))
+        new_ids = self._assign_ids(labels)
+        if new_ids:
+            self._create_folders(table, rows, vectors, labels, new_ids, reducer, result)
+
+        moved = {src for src, _, _, _ in result.moves}
+        result.remaining = [str(p) for p in existing if str(p) not in moved]
+        print(f"[Recluster] {len(existing)} queued → {len(result.folders)} new folder(s), "
+              f"{len(moved)} file(s) moved, {len(result.remaining)} still queued", file=sys.stderr)
+        return result
+
+    # ── Clustering ────────────────────────────────────────────────────────────
+
+    def _cluster(self, queued: np.ndarray, reducer=None) -> np.ndarray:
+        """Labels of the queued rows from HDBSCAN over them and their neighbourhoods.
+
+        Neighbour rows are appended after the queued ones; a label only
+        survives if the queued files dominate its cluster. With the index's
+        fitted reducer, everything is projected (never refitted) first.
+        """
+        from ..agents.clustering_agent import SemanticClusterer
+
+        X = queued
+        index = self.agent.index
+        if index is not None and index.ntotal:
+            _, idx = index.search(np.ascontiguousarray(queued, dtype=np.float32),
+                                  min(self.neighbours, index.ntotal))
+            nbrs = np.unique(idx[idx >= 0])
+            if len(nbrs):
+                X = np.vstack([queued, np.vstack([index.reconstruct(int(i)) for i in nbrs])])
+        if reducer is not None and reducer.input_dim == X.shape[1]:
+            X = reducer.transform(X)
+        elif reducer is not None:
+            print(f"[Recluster] Ignoring reducer.npz: fitted on {reducer.input_dim}-d vectors, "
+                  f"embeddings are {X.shape[1]}-d", file=sys.stderr)
+
+        labels = SemanticClusterer(min_cluster_size=self.min_cluster_size)._hdbscan(X)
+        q = len(queued)
+        queued_labels = labels[:q].copy()
+        for label in np.unique(queued_labels[queued_labels != -1]):
+            n_queued = int((queued_labels == label).sum())
+            n_total = int((labels == label).sum())
+            if n_queued < self.min_cluster_size or n_queued < self.min_new_share * n_total:
+                queued_labels[queued_labels == label] = -1
+        return queued_labels
+
+    def _assign_ids(self, labels: np.ndarray) -> Dict[int, int]:
+        """{HDBSCAN label: fresh cluster_id} above every ID the index uses."""
+        agent = self.agent
+        used = [*agent.cluster_folders, *agent.centroids,
+                *(m["cluster_id"] for m in agent.index_meta), -1]
+        first = max(used) + 1
+        return {int(l): first + i for i, l in enumerate(np.unique(labels[labels != -1]))}
+
+    # ── Naming, moving, indexing ──────────────────────────────────────────────
+
+    def _create_folders(self, table, rows, vectors, labels, new_ids, reducer, result: ReclusterResult) -> None:
+        from ..agents.folder_naming_agent import FolderNamingAgent
+
+        table.labels[rows] = [new_ids.get(int(l), -1) for l in labels]
+        table.set_status(rows, "clustered")
+        members = {cid: [i for i, l in zip(rows, labels) if new_ids.get(int(l)) == cid]
+                   for cid in new_ids.values()}
+        names = FolderNamingAgent().name_clusters(
+            {cid: [table.clustered(i) for i in rows_] for cid, rows_ in members.items()})
+
+        unit = normalize(vectors)
+        position = {int(r): j for j, r in enumerate(rows)}
+        moved_vecs, moved_labels, dests, sources = [], [], [], []
+        for cid, member_rows in members.items():
+            parent = Counter(Path(table.paths[i]).parent for i in member_rows).most_common(1)[0][0]
+            folder = _safe_dest(parent, names.get(cid, f"cluster_{cid}"))
+            centroid = normalize(unit[[position[int(i)] for i in member_rows]].mean(axis=0, keepdims=True))[0]
+            try:
+                folder.mkdir(parents=True, exist_ok=False)
+            except OSError as exc:
+                print(f"[Recluster] Could not create {folder}: {exc}", file=sys.stderr)
+                continue
+            result.folders[cid] = str(folder)
+
+            for i in member_rows:
+                src = table.paths[i]
+                dest = _safe_dest(folder, Path(src).name)
+                try:
+                    shutil.move(src, str(dest))
+                except Exception as exc:
+                    print(f"[Recluster] Move failed for {Path(src).name}: {exc}", file=sys.stderr)
+                    continue
+                j = position[int(i)]
+                result.moves.append((src, str(dest), cid, float(unit[j] @ centroid)))
+                moved_vecs.append(vectors[j])
+                moved_labels.append(cid)
+                dests.append(str(dest))
+                sources.append(src)
+
+        if moved_vecs:
+            index_dir = self.agent.index_dir
+            update_index(
+                np.array(moved_vecs, dtype=np.float32), np.array(moved_labels), dests,
+                {cid: folder for cid, folder in result.folders.items() if cid in moved_labels},
+                replaced_paths=sources, output_dir=index_dir, reducer=reducer,
+            )
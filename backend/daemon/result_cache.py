@@ -0,0 +1,100 @@
+"""
+Model-server result cache: one bounded LRU of embeddings for every client.
+
+Keys are (model name, sha1 of the exact text sent), so the pipeline, the
+daemon's AssignmentAgent and reassign_cli all hit the same entries when they
+encode the same identity text, whatever per-file cache they keep themselves.
+
+With a path the cache survives daemon restarts: load() reads a snapshot at
+start-up and save() writes one (tmp file + os.replace) on shutdown.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+MAX_CACHED_VECTORS = 20000   # ~30 MB of all-MiniLM-L6-v2 vectors
+
+_Key = Tuple[str, bytes]
+
+
+def _key(model: str, text: str) -> _Key:
+    return model, hashlib.sha1(text.encode("utf-8", "surrogatepass")).digest()
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = MAX_CACHED_VECTORS, path: Optional[Path] = None):
+        self.max_entries = max_entries
+        self.path = Path(path) if path else None
+        self._entries: "OrderedDict[_Key, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, model: str, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """Split texts into cached rows {index: vector} and the indices still to encode."""
+        found: Dict[int, np.ndarray] = {}
+        missing: List[int] = []
+        with self._lock:
+            for i, text in enumerate(texts):
+                vec = self._entries.get(_key(model, text))
+                if vec is None:
+                    missing.append(i)
+                else:
+                    self._entries.move_to_end(_key(model, text))
+                    found[i] = vec
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def store(self, model: str, texts: List[str], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            for text, vec in zip(texts, vectors):
+                key = _key(model, text)
+                self._entries[key] = vec.copy()  # don't pin the whole batch array
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                items = pickle.load(f)
+        except Exception:
+            return  # missing or unreadable snapshot: start cold
+        with self._lock:
+            for key, vec in items[-self.max_entries:]:
+                self._entries[key] = vec
+        print(f"[ModelServer] Result cache: loaded {len(items)} vectors from {self.path}")
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            items = list(self._entries.items())
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump(items, f, protocol=4)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[ModelServer] Could not save result cache: {e}")
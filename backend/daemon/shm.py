@@ -0,0 +1,182 @@
+"""
+Shared-memory exchange for bulk model-server calls.
+
+A client owns one segment per thread (a ShmArena), reused call after call and
+grown when a batch outgrows it. The layout of a call is:
+
+  [0, texts_len)                    a wire.pack_texts frame written by the client
+  [vectors_offset, segment size)    rows × dim float32 written in place by the server
+
+Only a small JSON descriptor crosses the socket (POST /embed_shm):
+
+  {"segment": "<name>", "texts_len": n, "vectors_offset": o}
+      → 200 {"rows": r, "dim": d}
+      → 507 {"needed": bytes}   (vector region too small; grow and resend)
+      → 400 {"error": DESCRIPTOR_ERROR}   (segment missing or not ours)
+
+The server keeps recent segments attached (ShmAttachments) so a steady client
+costs no shm_open/mmap per call. Only segments named with SHM_PREFIX are
+attached, and attaching never registers them with this process's
+resource_tracker: the client created them, the client unlinks them.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import secrets
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from . import wire
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # pragma: no cover — stripped-down interpreters
+    shared_memory = None
+
+SHM_PREFIX = "smartsort_"
+DESCRIPTOR_ERROR = "invalid shm descriptor"
+_ALIGN = 64
+_MIN_SEGMENT = 1 << 20
+_MAX_ATTACHED = 16
+
+
+def available() -> bool:
+    return shared_memory is not None and os.environ.get("SMARTSORT_SHM") != "0"
+
+
+def vectors_offset(texts_len: int) -> int:
+    """Where the vector region starts after a texts frame of texts_len bytes."""
+    return (texts_len + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+# ── Client side ───────────────────────────────────────────────────────────────
+
+_arenas: "weakref.WeakSet[ShmArena]" = weakref.WeakSet()
+
+
+class ShmArena:
+    """One client thread's reusable segment."""
+
+    def __init__(self):
+        self._seg = None
+
+    @property
+    def name(self) -> str:
+        return self._seg.name
+
+    @property
+    def size(self) -> int:
+        return self._seg.size if self._seg is not None else 0
+
+    def ensure(self, size: int) -> None:
+        if size <= self.size:
+            return
+        self.close()
+        size = max(_MIN_SEGMENT, 1 << (size - 1).bit_length())
+        name = f"{SHM_PREFIX}{os.getpid()}_{secrets.token_hex(6)}"
+        self._seg = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _arenas.add(self)
+
+    def write(self, offset: int, data: bytes) -> None:
+        self._seg.buf[offset:offset + len(data)] = data
+
+    def read_vectors(self, offset: int, rows: int, dim: int) -> np.ndarray:
+        view = np.ndarray((rows, dim), dtype="<f4", buffer=self._seg.buf, offset=offset)
+        out = view.astype(np.float32, copy=True)  # the arena is reused by the next call
+        del view
+        return out
+
+    def close(self) -> None:
+        if self._seg is None:
+            return
+        try:
+            self._seg.close()
+        except BufferError:
+            pass  # a view is still alive; the mapping goes with it, the name must not linger
+        try:
+            self._seg.unlink()
+        except FileNotFoundError:
+            pass
+        self._seg = None
+
+
+@atexit.register
+def _unlink_arenas() -> None:
+    for arena in list(_arenas):
+        arena.close()
+
+
+# ── Server side ───────────────────────────────────────────────────────────────
+
+def _attach(name: str):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        seg = shared_memory.SharedMemory(name=name)
+        try:
+            resource_tracker.unregister(seg._name, "shared_memory")
+        except Exception:
+            pass
+        return seg
+
+
+class ShmAttachments:
+    """Small LRU of segments the server has mapped, keyed by name."""
+
+    def __init__(self, max_attached: int = _MAX_ATTACHED):
+        self.max_attached = max_attached
+        self._segments: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._segments)
+
+    def get(self, name: str):
+        if not name.startswith(SHM_PREFIX) or "/" in name:
+            raise ValueError(f"refusing to attach segment {name!r}")
+        with self._lock:
+            seg = self._segments.get(name)
+            if seg is not None:
+                self._segments.move_to_end(name)
+                return seg
+        seg = _attach(name)
+        with self._lock:
+            self._segments[name] = seg
+            while len(self._segments) > self.max_attached:
+                _, old = self._segments.popitem(last=False)
+                _close_quietly(old)
+        return seg
+
+    def close(self) -> None:
+        with self._lock:
+            for seg in self._segments.values():
+                _close_quietly(seg)
+            self._segments.clear()
+
+
+def _close_quietly(seg) -> None:
+    try:
+        seg.close()
+    except BufferError:
+        pass  # still mid-request on another thread; the mapping goes with the object
+
+
+def read_texts(seg, texts_len: int):
+    return wire.unpack_texts(seg.buf[:texts_len])
+
+
+def write_vectors(seg, offset: int, vectors: np.ndarray) -> Optional[int]:
+    """Write vectors in place; returns the bytes needed instead if they don't fit."""
+    vectors = np.asarray(vectors, dtype="<f4")
+    if offset < 0 or offset + vectors.nbytes > seg.size:
+        return offset + vectors.nbytes
+    out = np.ndarray(vectors.shape, dtype="<f4", buffer=seg.buf, offset=offset)
+    out[...] = vectors
+    del out
+    return None
@@ -3,15 +3,19 @@ Filesystem watcher for the SmartSort daemon.
 
 Monitors configured folders with watchdog. On each new file:
   - Debounces for 2 s (writes often arrive in chunks)
+  - Queues it for a single worker thread, so events keep being accepted while
+    an assignment waits (e.g. on the model reloading after an idle unload)
   - Calls AssignmentAgent.assign()
   - If assigned: moves file to cluster folder, appends to move_log.jsonl
   - If unassigned: adds to unassigned_queue.json
-  - When queue reaches recluster_queue_size: spawns background re-cluster
+  - When queue reaches recluster_queue_size: re-clusters the queue on the
+    same worker (recluster.py), so index writes never race an assignment
 """
 
 from __future__ import annotations
 
 import json
+import queue
 import shutil
 import threading
 from datetime import datetime, timezone
@@ -31,6 +35,8 @@ UNASSIGNED_QUEUE = SMARTSORT_DIR / "unassigned_queue.json"
 
 DEBOUNCE_SECONDS = 2.0
 
+_RECLUSTER = object()   # work-queue marker: re-cluster the unassigned queue
+
 
 # ── Filesystem helpers ────────────────────────────────────────────────────────
 
@@ -85,6 +91,13 @@ class _Handler(FileSystemEventHandler):
         self.recluster_size = recluster_size
         self._timers: dict[str, threading.Timer] = {}
         self._lock = threading.Lock()
+        self._recluster_pending = False
+        # Queue length that triggers the next re-cluster: files a round left
+        # behind don't count towards the next one
+        self._recluster_at = recluster_size
+        self._work: "queue.Queue[object]" = queue.Queue()
+        self._worker = threading.Thread(target=self._drain, daemon=True, name="watcher-assign")
+        self._worker.start()
 
     def on_created(self, event: FileCreatedEvent):
         if not event.is_directory:
@@ -99,14 +112,36 @@ class _Handler(FileSystemEventHandler):
             existing = self._timers.pop(path, None)
             if existing:
                 existing.cancel()
-            t = threading.Timer(DEBOUNCE_SECONDS, self._process, args=[path])
+            t = threading.Timer(DEBOUNCE_SECONDS, self._enqueue, args=[path])
             self._timers[path] = t
             t.start()
 
-    def _process(self, file_path: str) -> None:
+    def _enqueue(self, file_path: str) -> None:
         with self._lock:
             self._timers.pop(file_path, None)
+        self._work.put(file_path)
+
+    def _drain(self) -> None:
+        while True:
+            file_path = self._work.get()
+            if file_path is None:
+                return
+            if file_path is _RECLUSTER:
+                self._run_recluster(_load_queue())
+                continue
+            try:
+                self._process(file_path)
+            except Exception as exc:
+                print(f"[Watcher] Unexpected error for {Path(file_path).name}: {exc}")
 
+    def stop(self) -> None:
+        with self._lock:
+            for t in self._timers.values():
+                t.cancel()
+            self._timers.clear()
+        self._work.put(None)
+
+    def _process(self, file_path: str) -> None:
         p = Path(file_path)
         if not p.exists() or not p.is_file():
             return
@@ -137,23 +172,43 @@ class _Handler(FileSystemEventHandler):
                 queue.append(file_path)
                 _save_queue(queue)
             print(f"[Watcher] ⏳ {p.name} → unassigned queue ({len(queue)} pending)")
-            if len(queue) >= self.recluster_size:
+            if len(queue) >= self._recluster_at:
                 self._trigger_recluster(queue)
 
     def _trigger_recluster(self, queue: list) -> None:
-        print(f"[Watcher] Queue full ({len(queue)}) — triggering background re-cluster")
-        t = threading.Thread(target=self._run_recluster, args=[list(queue)], daemon=True)
-        t.start()
+        if self._recluster_pending:
+            return
+        print(f"[Watcher] Queue full ({len(queue)}) — scheduling re-cluster")
+        self._recluster_pending = True
+        self._work.put(_RECLUSTER)
 
     def _run_recluster(self, queue: list) -> None:
         """
-        Placeholder for full re-cluster.
-        Phase 3 will replace this with a proper call into TauriPipeline /
-        a headless pipeline run that rebuilds the faiss index and clears the queue.
+        Grow new folders from the unassigned queue (see recluster.py).
+
+        Runs on the worker thread between assignments. Moved files are
+        logged like assignments and leave the queue; the rest stay queued.
         """
-        print(f"[Watcher] Re-cluster triggered for {len(queue)} unassigned files.")
-        print("[Watcher] Full re-cluster not yet implemented — clear queue manually.")
-        _save_queue([])
+        from .recluster import IncrementalReclusterer
+
+        self._recluster_pending = False
+        print(f"[Watcher] Re-clustering {len(queue)} unassigned files...")
+        try:
+            result = IncrementalReclusterer(self.agent).run(queue)
+        except Exception as exc:
+            # Wait for another batch before retrying rather than failing on every file.
+            print(f"[Watcher] Re-cluster failed: {exc}")
+            self._recluster_at = len(queue) + self.recluster_size
+            return
+
+        for src, dest, cluster_id, similarity in result.moves:
+            _append_move_log(src, dest, cluster_id, similarity)
+        _save_queue(result.remaining)
+        self._recluster_at = len(result.remaining) + self.recluster_size
+        if result.folders:
+            self.agent.reload_index()
+            for folder in result.folders.values():
+                print(f"[Watcher] ✓ New folder {Path(folder).name}/")
 
 
 # ── Public watcher class ──────────────────────────────────────────────────────
@@ -188,4 +243,5 @@ class SmartSortWatcher:
     def stop(self) -> None:
         self._observer.stop()
         self._observer.join()
+        self._handler.stop()
         print("[Watcher] Observer stopped.")
@@ -0,0 +1,87 @@
+"""
+Binary framing for model-server requests and responses.
+
+JSON stays the default; a client opts in per request with content negotiation:
+
+  Content-Type: application/x-smartsort-texts     (request body)
+      b"SSTX" | uint32 count | count × uint32 byte length | UTF-8 bytes
+
+  Accept: application/x-smartsort-vectors[; dtype=float16]   (response body)
+      b"SSVC" | uint8 dtype (1 = float32, 2 = float16) | 3 pad | uint32 rows | uint32 dim
+      | rows × dim little-endian floats
+
+All integers are little-endian. Vectors are read straight into numpy with
+np.frombuffer — no per-float text formatting or parsing on either side.
+"""
+
+from __future__ import annotations
+
+import struct
+from typing import List
+
+import numpy as np
+
+TEXTS_CONTENT_TYPE = "application/x-smartsort-texts"
+VECTORS_CONTENT_TYPE = "application/x-smartsort-vectors"
+PRIORITY_HEADER = "X-SmartSort-Priority"   # interactive | daemon | background
+DEADLINE_HEADER = "X-SmartSort-Deadline"   # seconds the caller is willing to wait
+MODEL_HEADER = "X-SmartSort-Model"         # which hosted model to encode with
+
+_TEXTS_MAGIC = b"SSTX"
+_VECTORS_MAGIC = b"SSVC"
+_TEXTS_HEADER = struct.Struct("<4sI")
+_VECTORS_HEADER = struct.Struct("<4sB3xII")
+
+_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+_DTYPE_CODES = {"float32": 1, "float16": 2}
+
+
+def pack_texts(texts: List[str]) -> bytes:
+    blobs = [t.encode("utf-8") for t in texts]
+    lengths = np.fromiter((len(b) for b in blobs), dtype="<u4", count=len(blobs))
+    return _TEXTS_HEADER.pack(_TEXTS_MAGIC, len(blobs)) + lengths.tobytes() + b"".join(blobs)
+
+
+def unpack_texts(data: bytes) -> List[str]:
+    magic, count = _TEXTS_HEADER.unpack_from(data, 0)
+    if magic != _TEXTS_MAGIC:
+        raise ValueError("not a SmartSort texts frame")
+    start = _TEXTS_HEADER.size
+    lengths = np.frombuffer(data, dtype="<u4", count=count, offset=start)
+    offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64))) + start + 4 * count
+    if offsets[-1] != len(data):
+        raise ValueError("truncated texts frame")
+    view = memoryview(data)
+    return [str(view[offsets[i]:offsets[i + 1]], "utf-8") for i in range(count)]
+
+
+def pack_vectors(vectors: np.ndarray, dtype: str = "float32") -> bytes:
+    code = _DTYPE_CODES.get(dtype)
+    if code is None:
+        raise ValueError(f"unsupported dtype: {dtype}")
+    arr = np.ascontiguousarray(vectors, dtype=_DTYPES[code])
+    rows, dim = arr.shape if arr.ndim == 2 else (1, arr.shape[0])
+    return _VECTORS_HEADER.pack(_VECTORS_MAGIC, code, rows, dim) + arr.tobytes()
+
+
+def unpack_vectors(data: bytes) -> np.ndarray:
+    """Decode a vectors frame to a (rows, dim) float32 array."""
+    magic, code, rows, dim = _VECTORS_HEADER.unpack_from(data, 0)
+    if magic != _VECTORS_MAGIC or code not in _DTYPES:
+        raise ValueError("not a SmartSort vectors frame")
+    arr = np.frombuffer(data, dtype=_DTYPES[code], count=rows * dim, offset=_VECTORS_HEADER.size)
+    return arr.reshape(rows, dim).astype(np.float32, copy=code != 1)
+
+
+def accepted_dtype(accept: str) -> str | None:
+    """Parse an Accept header; returns "float32"/"float16" for binary, None for JSON."""
+    for part in (accept or "").split(","):
+        fields = [f.strip() for f in part.split(";")]
+        if fields[0] != VECTORS_CONTENT_TYPE:
+            continue
+        for param in fields[1:]:
+            key, _, value = param.partition("=")
+            if key.strip() == "dtype" and value.strip() in _DTYPE_CODES:
+                return value.strip()
+        return "float32"
+    return None
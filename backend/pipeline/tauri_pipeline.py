@@ -26,10 +26,13 @@ sys.path.insert(0, os.path.join(project_root, 'backend'))
 from backend.agents.ingestion_manager import IngestionManager
 from backend.agents.extractor_router import ExtractorRouter
 from backend.agents.embedding_agent import EmbeddingAgent
-from backend.agents.clustering_agent import ClusteringAgent
+from backend.agents.clustering_agent import BACKENDS, ClusteringAgent
+from backend.agents.reducer import reducer_from_env
 from backend.agents.folder_naming_agent import FolderNamingAgent
 from backend.agents.file_relocation_agent import FileRelocationAgent
 from backend.core.models import FileContent, ClusteredFile
+from backend.core.file_table import FileTable
+from backend.agents.model_registry import set_priority
 from backend.core.license import check_file_limit, activate, license_status
 import random
 
@@ -58,6 +61,76 @@ def _stratified_sample(file_metas, max_files: int, seed: int = 42):
     return result
 
 
+def _make_clusterer() -> ClusteringAgent:
+    """ClusteringAgent with the optional stages turned on from the environment.
+
+    SMARTSORT_REDUCE / SMARTSORT_REDUCE_DIM: see agents/reducer.py
+    SMARTSORT_PARTITION_DOCTYPE=1: cluster each doctype prefix separately
+    SMARTSORT_CLUSTER_BACKEND=knn: faiss kNN-graph clustering (agents/knn_graph.py)
+    """
+    backend = os.environ.get("SMARTSORT_CLUSTER_BACKEND", "hdbscan")
+    return ClusteringAgent(
+        fallback_k_range=(2, 10),
+        min_cluster_size=2,
+        reducer=reducer_from_env(),
+        partition_by_doctype=os.environ.get("SMARTSORT_PARTITION_DOCTYPE") == "1",
+        backend=backend if backend in BACKENDS else "hdbscan",
+    )
+
+
+def _merge_and_rename(clusterer, naming_agent, cluster_map: dict, folder_names: dict,
+                      kept=frozenset()) -> tuple:
+    """Merge similar clusters; only clusters that absorbed others get a new name.
+
+    Clusters in kept (IDs carried over from the previous sort) keep their
+    folder name even when they absorb others. Clusters that end up with the
+    same name are then folded together (_merge_same_names).
+    """
+    merged = clusterer.merge_similar_clusters(cluster_map, folder_names)
+    changed = {cid: files for cid, files in merged.items()
+               if len(files) != len(cluster_map.get(cid, ())) and cid not in kept}
+    names = {cid: folder_names[cid] for cid in merged if cid not in changed and cid in folder_names}
+    if changed:
+        names.update(naming_agent.name_clusters(changed))
+    return _merge_same_names(merged, names, kept)
+
+
+def _merge_same_names(cluster_map: dict, names: dict, kept=frozenset()) -> tuple:
+    """Fold clusters that were given the same folder name into one.
+
+    FolderNamingAgent does not dedupe, and two IDs sharing a folder would both
+    move files into it and both be indexed against it. A kept ID survives
+    over a fresh one, otherwise the smallest; names compare case-insensitively.
+    """
+    owner: dict = {}
+    for cid in sorted(names, key=lambda c: (c not in kept, c)):
+        if cid == -1 or cid not in cluster_map:
+            continue
+        keep = owner.setdefault(names[cid].strip().casefold(), cid)
+        if keep != cid:
+            for f in cluster_map[cid]:
+                f.cluster_id = keep
+            cluster_map[keep].extend(cluster_map.pop(cid))
+            del names[cid]
+    return cluster_map, names
+
+
+def _name_new_clusters(naming_agent, cluster_map: dict, kept_names: dict) -> dict:
+    """Folder names: carried over for kept clusters, generated for the rest."""
+    fresh = {cid: files for cid, files in cluster_map.items() if cid not in kept_names}
+    names = naming_agent.name_clusters(fresh) if fresh else {}
+    names.update(kept_names)
+    return names
+
+
+def _sample_rows(table: FileTable, sample_paths):
+    """Table rows of the clustering sample, or None (cluster everything)."""
+    if sample_paths is None:
+        return None
+    import numpy as np
+    return np.flatnonzero([p in sample_paths for p in table.paths])
+
+
 def _build_photo_clusters(photo_embedded: list, next_cluster_id: int) -> tuple:
     """Group photo EmbeddedFiles by year into synthetic clusters.
 
@@ -179,8 +252,13 @@ class TauriPipeline:
                 "message": f"Preview failed: {str(e)}"
             }
     
-    def run_full_pipeline(self, dry_run: bool = False, max_files: int = None) -> Dict[str, Any]:
-        """Run the complete semantic sorting pipeline."""
+    def run_full_pipeline(self, dry_run: bool = False, max_files: int = None,
+                          assign_rest: bool = False) -> Dict[str, Any]:
+        """Run the complete semantic sorting pipeline.
+
+        With max_files and assign_rest, only a stratified sample is clustered
+        and every other file is assigned to the sample's clusters.
+        """
         try:
             # 1. Ingestion
             self.log_progress(1, "Scanning and ingesting files...", 5)
@@ -195,9 +273,15 @@ class TauriPipeline:
                 })
                 return self.results
             
+            sample_paths = None
             if max_files is not None and len(ingestor.file_meta_queue) > max_files:
-                ingestor.file_meta_queue = _stratified_sample(ingestor.file_meta_queue, max_files)
-                self.log_progress(1, f"Sampled {len(ingestor.file_meta_queue)} files (max={max_files})", 8)
+                sample = _stratified_sample(ingestor.file_meta_queue, max_files)
+                if assign_rest:
+                    sample_paths = {fm.file_path for fm in sample}
+                    self.log_progress(1, f"Clustering a sample of {len(sample)} files (max={max_files}), assigning the rest", 8)
+                else:
+                    ingestor.file_meta_queue = sample
+                    self.log_progress(1, f"Sampled {len(ingestor.file_meta_queue)} files (max={max_files})", 8)
 
             # License check — trial mode caps at 500 files
             license_check = check_file_limit(len(ingestor.file_meta_queue))
@@ -242,12 +326,12 @@ class TauriPipeline:
             # 3. Embedding — single batch call
             self.log_progress(3, "Creating semantic embeddings...", 40)
             embedder = EmbeddingAgent()
-            embedded = embedder.embed_many(extracted)
-            self.log_progress(3, f"Embedded {len(embedded)} files", 60)
+            table = embedder.embed_table(FileTable.from_contents(extracted))
+            self.log_progress(3, f"Embedded {len(table)} files", 60)
             
-            embedded_count = len([e for e in embedded if e.status == "embedded"])
-            photo_embedded      = [e for e in embedded if e.status == "photo"]
-            screenshot_embedded = [e for e in embedded if e.status == "screenshot"]
+            embedded_count = int(table.status_mask("embedded").sum())
+            photo_embedded      = table.embedded_files("photo")
+            screenshot_embedded = table.embedded_files("screenshot")
 
             if embedded_count < 2 and not photo_embedded and not screenshot_embedded:
                 self.results.update({
@@ -259,9 +343,9 @@ class TauriPipeline:
 
             # 4. Clustering
             self.log_progress(4, "Clustering files by semantic similarity...", 60)
-            clusterer = ClusteringAgent(fallback_k_range=(2, 10), min_cluster_size=2)
+            clusterer = _make_clusterer()
             if embedded_count >= 2:
-                clustered = clusterer.cluster(embedded)
+                clustered = table.clustered_files() if clusterer.cluster_table(table, _sample_rows(table, sample_paths)) else []
                 if not clustered:
                     self.results.update({
                         "status": "error",
@@ -275,6 +359,7 @@ class TauriPipeline:
             cluster_map = defaultdict(list)
             for f in clustered:
                 cluster_map[f.cluster_id].append(f)
+            cluster_map, kept_names, next_free_id = self._stable_cluster_ids(cluster_map)
 
             self.results["clusters_found"] = len(cluster_map)
 
@@ -283,15 +368,19 @@ class TauriPipeline:
             naming_agent = FolderNamingAgent()
             folder_names: dict = {}
             if cluster_map:
-                folder_names = naming_agent.name_clusters(cluster_map)
+                folder_names = _name_new_clusters(naming_agent, cluster_map, kept_names)
 
                 # 5.1 Merge Similar Clusters
                 self.log_progress(5, "Optimizing cluster organization...", 85)
-                cluster_map = clusterer.merge_similar_clusters(cluster_map, folder_names)
-                folder_names = naming_agent.name_clusters(cluster_map)
+                cluster_map, folder_names = _merge_and_rename(
+                    clusterer, naming_agent, cluster_map, folder_names, kept=set(kept_names))
+
+            if sample_paths is not None:
+                self.log_progress(5, "Assigning the remaining files to the sample's folders...", 87)
+                clustered = clustered + self._assign_unsampled(table, cluster_map, folder_names)
 
             # Inject photo and screenshot synthetic clusters after merge
-            next_id = max(cluster_map.keys(), default=-1) + 1
+            next_id = max(max(cluster_map.keys(), default=-1) + 1, next_free_id)
             photo_clusters = {}
             if photo_embedded:
                 photo_clusters, photo_names = _build_photo_clusters(photo_embedded, next_id)
@@ -326,14 +415,14 @@ class TauriPipeline:
                     base_destination_dir=str(self.input_folder),
                     dry_run=False
                 )
-                relocation_results = relocation_agent.relocate_files(cluster_map)
+                relocation_results = relocation_agent.relocate_files(cluster_map, folder_names)
 
                 if relocation_results["errors"]:
                     self.results["errors"].extend(relocation_results["errors"])
 
                 # Persist faiss index so the daemon can do incremental assignment
                 self.log_progress(6, "Building incremental assignment index...", 95)
-                self._persist_index(cluster_map, folder_names)
+                self._persist_index(cluster_map, folder_names, clusterer.reducer)
             else:
                 self.log_progress(6, "Dry run complete - no files moved", 95)
 
@@ -349,6 +438,7 @@ class TauriPipeline:
                     "files_embedded": embedded_count,
                     "files_clustered": len(clustered),
                     "final_clusters": len(cluster_map),
+                    "reduction": clusterer.reducer.report() if clusterer.reducer else None,
                     "dry_run": dry_run
                 }
             })
@@ -369,7 +459,8 @@ class TauriPipeline:
         """Write a single NDJSON event line to stdout and flush immediately."""
         print(json.dumps({"event": event, "payload": payload}), flush=True)
 
-    def run_streaming_pipeline(self, dry_run: bool = False, max_files: int = None) -> None:
+    def run_streaming_pipeline(self, dry_run: bool = False, max_files: int = None,
+                               assign_rest: bool = False) -> None:
         """Run the pipeline and emit NDJSON events to stdout for Tauri to consume.
 
         Unlike run_full_pipeline(), this method does NOT return a final JSON blob.
@@ -389,8 +480,13 @@ class TauriPipeline:
                 })
                 return
 
+            sample_paths = None
             if max_files is not None and len(ingestor.file_meta_queue) > max_files:
-                ingestor.file_meta_queue = _stratified_sample(ingestor.file_meta_queue, max_files)
+                sample = _stratified_sample(ingestor.file_meta_queue, max_files)
+                if assign_rest:
+                    sample_paths = {fm.file_path for fm in sample}
+                else:
+                    ingestor.file_meta_queue = sample
 
             # License check
             license_check = check_file_limit(len(ingestor.file_meta_queue))
@@ -438,7 +534,7 @@ class TauriPipeline:
 
             # 3. Embedding — single batch call, then emit per-file events
             embedder = EmbeddingAgent()
-            embedded = embedder.embed_many(extracted)
+            table = embedder.embed_table(FileTable.from_contents(extracted))
             for extracted_file in extracted:
                 current_processed += W_EMB
                 self._emit("file-assigned", {
@@ -450,9 +546,9 @@ class TauriPipeline:
                     "stage": "embedding",
                 })
 
-            embedded_count      = len([e for e in embedded if e.status == "embedded"])
-            photo_embedded      = [e for e in embedded if e.status == "photo"]
-            screenshot_embedded = [e for e in embedded if e.status == "screenshot"]
+            embedded_count      = int(table.status_mask("embedded").sum())
+            photo_embedded      = table.embedded_files("photo")
+            screenshot_embedded = table.embedded_files("screenshot")
 
             if embedded_count < 2 and not photo_embedded and not screenshot_embedded:
                 self._emit("sort-error", {"message": "Not enough files could be embedded for clustering."})
@@ -469,9 +565,9 @@ class TauriPipeline:
             })
 
             # 4. Clustering (batch)
-            clusterer = ClusteringAgent(fallback_k_range=(2, 10), min_cluster_size=2)
+            clusterer = _make_clusterer()
             if embedded_count >= 2:
-                clustered = clusterer.cluster(embedded)
+                clustered = table.clustered_files() if clusterer.cluster_table(table, _sample_rows(table, sample_paths)) else []
                 if not clustered:
                     self._emit("sort-error", {"message": "Clustering failed."})
                     return
@@ -481,16 +577,20 @@ class TauriPipeline:
             cluster_map = defaultdict(list)
             for f in clustered:
                 cluster_map[f.cluster_id].append(f)
+            cluster_map, kept_names, next_free_id = self._stable_cluster_ids(cluster_map)
 
             # 5. Folder Naming — 10% of bar (Total so far: 90%)
             naming_agent = FolderNamingAgent()
             folder_names: dict = {}
             if cluster_map:
-                folder_names = naming_agent.name_clusters(cluster_map)
-                cluster_map = clusterer.merge_similar_clusters(cluster_map, folder_names)
-                folder_names = naming_agent.name_clusters(cluster_map)
+                folder_names = _name_new_clusters(naming_agent, cluster_map, kept_names)
+                cluster_map, folder_names = _merge_and_rename(
+                    clusterer, naming_agent, cluster_map, folder_names, kept=set(kept_names))
+
+            if sample_paths is not None:
+                clustered = clustered + self._assign_unsampled(table, cluster_map, folder_names)
 
-            next_id = max(cluster_map.keys(), default=-1) + 1
+            next_id = max(max(cluster_map.keys(), default=-1) + 1, next_free_id)
             photo_clusters = {}
             if photo_embedded:
                 photo_clusters, photo_names = _build_photo_clusters(photo_embedded, next_id)
@@ -550,7 +650,7 @@ class TauriPipeline:
             # 6. File Relocation — Final 10% of bar
             if not dry_run:
                 relocation_agent = FileRelocationAgent(base_destination_dir=str(self.input_folder), dry_run=False)
-                relocation_agent.relocate_files(cluster_map)
+                relocation_agent.relocate_files(cluster_map, folder_names)
 
             for f in all_files:
                 current_processed += W_PLC
@@ -565,7 +665,7 @@ class TauriPipeline:
                 })
 
             if not dry_run:
-                self._persist_index(cluster_map, folder_names)
+                self._persist_index(cluster_map, folder_names, clusterer.reducer)
 
             unsorted_count = sum(1 for f in clustered if f.cluster_id == -1)
             photo_sorted      = sum(len(files) for files in photo_clusters.values())
@@ -582,13 +682,96 @@ class TauriPipeline:
         except Exception as e:
             self._emit("sort-error", {"message": f"Pipeline failed: {str(e)}"})
 
-    def _persist_index(self, cluster_map: dict, folder_names: dict) -> None:
-        """Build and save the faiss index using post-relocation file paths."""
+    def _assign_unsampled(self, table: FileTable, cluster_map: dict, folder_names: dict) -> list:
+        """Assign the embedded rows left out of the clustering sample.
+
+        The sample's clusters become an in-memory faiss index (what
+        _persist_index() writes) and the remaining files go through one
+        batched k-neighbour vote. Files below the similarity threshold go to
+        Unsorted (-1). Returns the new ClusteredFiles, already in cluster_map.
+        """
+        import numpy as np
+        from backend.agents.assignment_agent import AssignmentAgent
+        from backend.agents.index_manager import normalize
+
+        rows = table.indices("embedded")
+        rows = rows[table.embedding_rows[rows] >= 0]
+        if not len(rows):
+            return []
+
+        embeddings, labels, paths, cluster_folders = [], [], [], {}
+        for cid, files in cluster_map.items():
+            if cid == -1:
+                continue
+            cluster_folders[cid] = str(self.input_folder / folder_names.get(cid, f"cluster_{cid}"))
+            for f in files:
+                if f.embedding:
+                    embeddings.append(f.embedding)
+                    labels.append(cid)
+                    paths.append(f.file_meta.file_path)
+
+        results = [None] * len(rows)
+        if embeddings:
+            agent = AssignmentAgent.from_clusters(
+                np.array(embeddings, dtype=np.float32), np.array(labels), paths, cluster_folders,
+            )
+            results = agent._query_index_batch(normalize(table.embedding_matrix(rows)))
+
+        table.labels[rows] = [r.cluster_id if r is not None else -1 for r in results]
+        table.set_status(rows, "clustered")
+        assigned = [table.clustered(i) for i in rows]
+        for f in assigned:
+            cluster_map.setdefault(f.cluster_id, []).append(f)
+
+        n_unsorted = sum(r is None for r in results)
+        print(f"[Pipeline] Assigned {len(rows) - n_unsorted} unsampled files, {n_unsorted} to Unsorted",
+              file=sys.stderr)
+        return assigned
+
+    def _stable_cluster_ids(self, cluster_map: dict) -> tuple:
+        """Renumber cluster_map so clusters of the previous sort keep their IDs.
+
+        Returns (cluster_map, kept_names, next_free_id): kept_names holds the
+        folder name of every cluster matched to the previous sort (see
+        agents/cluster_identity.py), and IDs from next_free_id up have never
+        been used by the index.
+        """
+        import numpy as np
+        from backend.agents.cluster_identity import match_clusters, previous_clusters
+
+        previous = previous_clusters(self.input_folder)
+        if not previous.folders:
+            return cluster_map, {}, previous.next_id
+
+        centroids = {
+            cid: np.mean(np.array([f.embedding for f in files], dtype=np.float32), axis=0)
+            for cid, files in cluster_map.items() if cid != -1
+        }
+        mapping = match_clusters(centroids, previous)
+        mapping[-1] = -1
+
+        stable = defaultdict(list)
+        for cid, files in cluster_map.items():
+            for f in files:
+                f.cluster_id = mapping[cid]
+            stable[mapping[cid]].extend(files)
+        kept_names = {cid: Path(previous.folders[cid]).name
+                      for cid in stable if cid in previous.folders}
+        return stable, kept_names, max(previous.next_id, max(stable, default=-1) + 1)
+
+    def _persist_index(self, cluster_map: dict, folder_names: dict, reducer=None) -> None:
+        """Fold this run into the faiss index using post-relocation file paths.
+
+        This run's files replace their own rows, and rows under input_folder
+        whose file is gone are pruned; rows of files sorted earlier and of
+        other sorted folders are left alone (update_index).
+        """
         try:
             import numpy as np
-            from backend.agents.index_manager import save_index
+            from backend.agents.index_manager import update_index
 
             embeddings, labels, new_paths, cluster_folders = [], [], [], {}
+            replaced = [f.file_meta.file_path for files in cluster_map.values() for f in files]
 
             for cid, files in cluster_map.items():
                 if cid == -1:
@@ -605,13 +788,16 @@ class TauriPipeline:
                     new_path = str(Path(folder_abs) / Path(f.file_meta.file_path).name)
                     new_paths.append(new_path)
 
-            if embeddings:
-                save_index(
-                    np.array(embeddings, dtype=np.float32),
-                    np.array(labels),
-                    new_paths,
-                    cluster_folders,
-                )
+            # Even a run with nothing to index prunes input_folder's missing files
+            update_index(
+                np.array(embeddings, dtype=np.float32),
+                np.array(labels),
+                new_paths,
+                cluster_folders,
+                replaced_paths=replaced,
+                scope=self.input_folder,
+                reducer=reducer,
+            )
         except Exception as exc:
             pass
 
@@ -738,6 +924,8 @@ def main():
                        help='Emit NDJSON events to stdout during processing (for Tauri)')
     parser.add_argument('--max-files', type=int, default=None,
                        help='Cap files with stratified sampling across file types')
+    parser.add_argument('--assign-rest', action='store_true',
+                       help='With --max-files, cluster the sample and assign every other file to its folders')
     parser.add_argument('--activate', metavar='LICENSE_KEY',
                        help='Activate FileSort Pro with a license key')
     parser.add_argument('--license-status', action='store_true',
@@ -830,17 +1018,21 @@ def main():
         sys.exit(0)
 
     # ── Pipeline ──────────────────────────────────────────────────────────────
+    # The user is watching this sort — jump ahead of the daemon's background work.
+    set_priority("interactive")
     try:
         pipeline = TauriPipeline(args.folder_path)
 
         if args.stream_events:
             # Streaming mode: emit NDJSON events to stdout, no final JSON blob
-            pipeline.run_streaming_pipeline(dry_run=args.dry_run, max_files=args.max_files)
+            pipeline.run_streaming_pipeline(dry_run=args.dry_run, max_files=args.max_files,
+                                            assign_rest=args.assign_rest)
         elif args.preview:
             result = pipeline.preview_clusters()
             print(json.dumps(result, indent=2))
         else:
-            result = pipeline.run_full_pipeline(dry_run=args.dry_run, max_files=args.max_files)
+            result = pipeline.run_full_pipeline(dry_run=args.dry_run, max_files=args.max_files,
+                                                assign_rest=args.assign_rest)
             print(json.dumps(result, indent=2))
 
     except Exception as e:
@@ -13,6 +13,9 @@ Prints per-file:
 Then prints cluster-level:
     - silhouette score (cosine, non-noise files)
     - cluster count / noise count
+
+With --reduce pca|random, clusters again after dimensionality reduction and
+compares time, silhouette (in the original space) and agreement (ARI).
 """
 
 import sys
@@ -32,6 +35,7 @@ from backend.agents.extractor_router import ExtractorRouter
 from backend.agents.embedding_agent import EmbeddingAgent
 from backend.agents.clustering_agent import ClusteringAgent
 from backend.agents.folder_naming_agent import FolderNamingAgent
+from backend.agents.reducer import DEFAULT_DIM, EmbeddingReducer
 
 
 def _stratified_sample(file_metas, max_files: int, seed: int = 42):
@@ -65,7 +69,48 @@ def _raw_word_count(file_path: str) -> int:
         return 0
 
 
-def run_benchmark(folder_path: str, max_files: int = None, show_all: bool = False) -> None:
+def _silhouette(X: np.ndarray, labels: np.ndarray):
+    from sklearn.metrics import silhouette_score
+    mask = labels != -1
+    if mask.sum() > 1 and len(set(labels[mask])) > 1:
+        return silhouette_score(X[mask], labels[mask], metric="cosine")
+    return None
+
+
+def _compare_reduction(valid_emb, base, base_secs: float, method: str, dim: int) -> None:
+    from sklearn.metrics import adjusted_rand_score
+
+    print(f"\n{'=' * 70}")
+    print(f"  Dimensionality reduction ({method}, {dim} dims)")
+    print(f"{'=' * 70}\n")
+
+    reducer = EmbeddingReducer(method, dim)
+    t = time.perf_counter()
+    clustered = ClusteringAgent(min_cluster_size=2, reducer=reducer).cluster(valid_emb)
+    t = time.perf_counter() - t
+    if not clustered:
+        print("Clustering returned no results.")
+        return
+
+    # Line both runs up by file so the scores compare the same rows
+    reduced_id = {f.file_meta.file_path: f.cluster_id for f in clustered}
+    base = [f for f in base if f.file_meta.file_path in reduced_id]
+    base_labels = np.array([f.cluster_id for f in base])
+    labels = np.array([reduced_id[f.file_meta.file_path] for f in base])
+    X = np.array([f.embedding for f in base])
+    col = "{:<10} {:>9} {:>7} {:>8} {:>11}"
+    print(col.format("", "Clusters", "Noise", "Time", "Silhouette"))
+    for name, lab, secs in (("raw", base_labels, base_secs), ("reduced", labels, t)):
+        sil = _silhouette(X, lab)
+        print(col.format(name, len(set(lab) - {-1}), int((lab == -1).sum()),
+                         f"{secs:.2f}s", "n/a" if sil is None else f"{sil:.4f}"))
+    print(f"\n{reducer.describe()}")
+    print(f"Speed-up: {base_secs / max(t, 1e-9):.1f}x   "
+          f"Agreement with raw (ARI): {adjusted_rand_score(base_labels, labels):.4f}")
+
+
+def run_benchmark(folder_path: str, max_files: int = None, show_all: bool = False,
+                  reduce: str = None, reduce_dim: int = DEFAULT_DIM) -> None:
     print(f"\n{'=' * 70}")
     print(f"  SmartSort Extraction Benchmark")
     print(f"  Folder: {folder_path}")
@@ -192,11 +237,8 @@ def run_benchmark(folder_path: str, max_files: int = None, show_all: bool = Fals
     print(f"Clusters: {n_clusters}   Noise: {noise_count}   Time: {t_clust:.1f}s\n")
 
     try:
-        from sklearn.metrics import silhouette_score
-        X = np.array([f.embedding for f in clustered])
-        mask = labels != -1
-        if mask.sum() > 1 and len(set(labels[mask])) > 1:
-            score = silhouette_score(X[mask], labels[mask], metric="cosine")
+        score = _silhouette(np.array([f.embedding for f in clustered]), labels)
+        if score is not None:
             print(f"Silhouette score (cosine, non-noise): {score:.4f}")
             if score > 0.5:
                 print("  → Excellent separation")
@@ -209,6 +251,9 @@ def run_benchmark(folder_path: str, max_files: int = None, show_all: bool = Fals
     except Exception as e:
         print(f"Silhouette score unavailable: {e}")
 
+    if reduce:
+        _compare_reduction(valid_emb, clustered, t_clust, reduce, reduce_dim)
+
     cluster_map: dict = defaultdict(list)
     for f in clustered:
         cluster_map[f.cluster_id].append(f)
@@ -298,5 +343,18 @@ if __name__ == "__main__":
         action="store_true",
         help="Print every cluster and every file in it",
     )
+    parser.add_argument(
+        "--reduce",
+        choices=("pca", "random"),
+        default=None,
+        help="Also cluster after dimensionality reduction and compare with the raw run",
+    )
+    parser.add_argument(
+        "--reduce-dim",
+        type=int,
+        default=DEFAULT_DIM,
+        help=f"Target dimensionality for --reduce (default: {DEFAULT_DIM})",
+    )
     args = parser.parse_args()
-    run_benchmark(args.folder, max_files=args.max_files, show_all=args.show_all)
+    run_benchmark(args.folder, max_files=args.max_files, show_all=args.show_all,
+                  reduce=args.reduce, reduce_dim=args.reduce_dim)
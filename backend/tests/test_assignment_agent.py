@@ -228,3 +228,47 @@ def test_no_index_returns_none():
         assert a._query_index(np.zeros((1, DIM), dtype=np.float32)) is None
     finally:
         shutil.rmtree(tmp)
+
+
+def test_batch_query_matches_single_queries_on_in_memory_index():
+    """_query_index_batch on a from_clusters() agent votes exactly like the per-file loop."""
+    from backend.agents.assignment_agent import AssignmentAgent
+
+    rng = np.random.default_rng(7)
+    centres = _make_centres()
+    labels = np.repeat(np.arange(N_CLUSTERS), 6)
+    labels[::5] = -1  # a few noise rows must never win a vote
+    X = np.array([_unit(centres[max(c, 0)] + rng.standard_normal(DIM).astype(np.float32) * 0.03)
+                  for c in labels])
+    folders = {c: f"/sorted/cluster_{c}" for c in range(N_CLUSTERS)}
+    a = AssignmentAgent.from_clusters(X, labels, [f"/f{i}" for i in range(len(X))], folders, threshold=0.5)
+
+    # Near a centre, between two centres, and nowhere near anything
+    queries = np.vstack([
+        [_unit(centres[c] + rng.standard_normal(DIM).astype(np.float32) * 0.03) for c in range(N_CLUSTERS)],
+        [_unit(centres[0] + centres[1])],
+        [_unit(rng.standard_normal(DIM).astype(np.float32))],
+    ]).astype(np.float32)
+
+    def one_by_one(q):
+        sims, idx = a.index.search(q.reshape(1, -1), a.k)
+        if sims[0][0] < a.threshold:
+            return None
+        votes = {}
+        for sim, i in zip(sims[0], idx[0]):
+            if labels[i] != -1:
+                votes.setdefault(int(labels[i]), []).append(float(sim))
+        cid = max(votes, key=lambda c: (len(votes[c]), sum(votes[c])))
+        return cid, len(votes[cid]), sum(votes[cid]) / len(votes[cid])
+
+    batch = a._query_index_batch(queries)
+    assert [r.cluster_id for r in batch[:N_CLUSTERS]] == list(range(N_CLUSTERS))
+    assert batch[-1] is None
+    for q, got in zip(queries, batch):
+        expected = one_by_one(q)
+        if expected is None:
+            assert got is None
+            continue
+        assert (got.cluster_id, got.neighbor_votes) == expected[:2]
+        assert got.similarity == pytest.approx(expected[2], abs=1e-6)
+        assert got.folder_path == folders[got.cluster_id]
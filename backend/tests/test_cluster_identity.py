@@ -0,0 +1,142 @@
+"""
+Tests for stable cluster IDs (cluster_identity) and incremental index updates.
+
+A first sort is saved with save_index(); the re-sort renumbers its clusters
+from scratch the way ClusteringAgent does, and must get the old IDs back.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from backend.agents.cluster_identity import match_clusters, previous_clusters
+from backend.agents.index_manager import load_index, save_index, update_index
+
+DIM = 32
+RNG = np.random.default_rng(7)
+
+
+def _blob(centre: np.ndarray, n: int) -> np.ndarray:
+    return (centre + 0.05 * RNG.standard_normal((n, DIM))).astype(np.float32)
+
+
+def _first_sort(tmp_path):
+    """Clusters 0 (invoices) and 1 (resumes) under root, 2 (photos) under another folder."""
+    root, other = tmp_path / "Downloads", tmp_path / "Pictures"
+    centres = RNG.standard_normal((3, DIM)).astype(np.float32)
+    embeddings, labels, paths = [], [], []
+    for cid, folder in ((0, root / "Invoices"), (1, root / "Resumes"), (2, other / "Photos")):
+        embeddings.append(_blob(centres[cid], 5))
+        labels += [cid] * 5
+        paths += [str(folder / f"{folder.name.lower()}_{i}.pdf") for i in range(5)]
+    folders = {0: str(root / "Invoices"), 1: str(root / "Resumes"), 2: str(other / "Photos")}
+    index_dir = tmp_path / "index"
+    save_index(np.vstack(embeddings), np.array(labels), paths, folders, output_dir=index_dir)
+    return root, centres, paths, index_dir
+
+
+def test_reclustered_folders_keep_their_ids_and_new_ones_get_unused_ids(tmp_path):
+    root, centres, _, index_dir = _first_sort(tmp_path)
+    previous = previous_clusters(root, index_dir)
+    assert sorted(previous.folders) == [0, 1]   # Photos lives under another root
+    assert previous.next_id == 3
+
+    new_centre = RNG.standard_normal(DIM).astype(np.float32)
+    # resumes, a brand-new topic, invoices — renumbered from scratch
+    centroids = {0: _blob(centres[1], 4).mean(axis=0), 1: new_centre, 2: _blob(centres[0], 6).mean(axis=0)}
+    mapping = match_clusters(centroids, previous)
+
+    assert mapping == {0: 1, 1: 3, 2: 0}
+
+
+def test_loose_files_join_a_matching_folder_by_centroid(tmp_path):
+    root, centres, _, index_dir = _first_sort(tmp_path)
+    previous = previous_clusters(root, index_dir)
+
+    # Only loose files are re-ingested, never the ones already in Invoices/
+    centroids = {0: _blob(centres[0], 3).mean(axis=0), 1: RNG.standard_normal(DIM)}
+
+    assert match_clusters(centroids, previous) == {0: 0, 1: 3}
+    assert match_clusters(centroids, previous, min_similarity=1.01) == {0: 3, 1: 4}
+
+
+def test_update_index_replaces_only_the_resorted_rows(tmp_path):
+    root, centres, paths, index_dir = _first_sort(tmp_path)
+    _, _, before, _ = load_index(index_dir)
+
+    # Re-sort of root: every invoice and resume is now one cluster 0,
+    # resume_4 was deleted, and one loose file was moved into Invoices.
+    moved = str(root / "Invoices" / "loose.pdf")
+    resorted = paths[:9] + [moved]
+    vectors = _blob(centres[0], len(resorted))
+    update_index(
+        vectors, np.zeros(len(resorted), dtype=np.int64), resorted,
+        {0: str(root / "Invoices")},
+        replaced_paths=[paths[9], str(root / "loose.pdf")],
+        output_dir=index_dir,
+    )
+
+    index, meta, centroids, folders = load_index(index_dir)
+    assert index.ntotal == len(meta) == 15
+    assert [m["file_path"] for m in meta[:5]] == paths[10:]          # other root untouched
+    assert {m["cluster_id"] for m in meta[5:]} == {0}
+    assert sorted(centroids) == [0, 2] and sorted(folders) == [0, 2]  # Resumes emptied
+    np.testing.assert_allclose(centroids[2], before[2], atol=1e-6)
+
+    expected = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = expected.mean(axis=0)
+    np.testing.assert_allclose(centroids[0], expected / np.linalg.norm(expected), atol=1e-5)
+
+
+def test_update_index_drops_stale_rows_under_the_sorted_folder(tmp_path):
+    root, centres, paths, index_dir = _first_sort(tmp_path)
+
+    # Only two invoices are left in root; everything else under it is gone
+    kept = paths[:2]
+    update_index(
+        _blob(centres[0], 2), np.zeros(2, dtype=np.int64), kept,
+        {0: str(root / "Invoices")}, scope=root, output_dir=index_dir,
+    )
+    index, meta, centroids, folders = load_index(index_dir)
+    assert [m["file_path"] for m in meta] == paths[10:] + kept
+    assert index.ntotal == 7
+    assert sorted(centroids) == sorted(folders) == [0, 2]
+
+    # A re-sort that indexes nothing still prunes
+    update_index(np.empty((0, DIM), dtype=np.float32), np.array([], dtype=np.int64), [], {},
+                 scope=root, output_dir=index_dir)
+    index, meta, centroids, folders = load_index(index_dir)
+    assert [m["file_path"] for m in meta] == paths[10:]
+    assert sorted(centroids) == sorted(folders) == [2]
+
+
+def test_non_recursive_resort_keeps_files_sorted_earlier(tmp_path):
+    root, centres, paths, index_dir = _first_sort(tmp_path)
+    for p in paths[:10]:  # the first sort really moved these into place
+        Path(p).parent.mkdir(parents=True, exist_ok=True)
+        Path(p).write_bytes(b"x")
+    _, _, before, _ = load_index(index_dir)
+
+    # The re-sort only ingested one loose invoice and moved it into Invoices
+    moved = root / "Invoices" / "loose.pdf"
+    moved.write_bytes(b"x")
+    update_index(
+        _blob(centres[0], 1), np.zeros(1, dtype=np.int64), [str(moved)],
+        {0: str(root / "Invoices")}, replaced_paths=[str(root / "loose.pdf")],
+        scope=root, output_dir=index_dir,
+    )
+    index, meta, centroids, folders = load_index(index_dir)
+    assert index.ntotal == len(meta) == 16
+    assert {m["file_path"] for m in meta} == set(paths) | {str(moved)}
+    assert sorted(centroids) == sorted(folders) == [0, 1, 2]
+    np.testing.assert_allclose(centroids[1], before[1], atol=1e-6)  # Resumes untouched
+
+
+def test_stable_ids_with_nothing_clustered_and_an_existing_index(tmp_path, monkeypatch):
+    from backend.pipeline.tauri_pipeline import TauriPipeline
+
+    root, _, _, index_dir = _first_sort(tmp_path)
+    monkeypatch.setattr("backend.agents.index_manager.SMARTSORT_DIR", index_dir)
+
+    cluster_map, kept_names, next_free_id = TauriPipeline(str(root))._stable_cluster_ids({})
+    assert (dict(cluster_map), kept_names, next_free_id) == ({}, {}, 3)
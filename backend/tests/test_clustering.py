@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 
 from backend.agents.clustering_agent import ClusteringAgent
 from backend.core.models import EmbeddedFile, FileMeta
@@ -30,3 +31,329 @@ def test_split_mixed_doctype_clusters_without_reclustering():
     assert labels[0] == labels[1]
     assert labels[2] == labels[3]
     assert labels[0] != labels[2]
+
+
+def test_large_n_hdbscan_matches_precomputed_cosine_partition():
+    from sklearn.metrics import adjusted_rand_score
+
+    from backend.agents.clustering_agent import SemanticClusterer
+
+    rng = np.random.default_rng(3)
+    centers = rng.standard_normal((4, 16))
+    X = np.vstack([c + 0.05 * rng.standard_normal((40, 16)) for c in centers]) * rng.uniform(0.5, 3, (160, 1))
+    X = X.astype(np.float32)  # what FileTable.embedding_matrix hands over
+
+    precomputed = SemanticClusterer(min_cluster_size=5)._hdbscan(X)
+    tree = SemanticClusterer(min_cluster_size=5, precomputed_max_n=10)._hdbscan(X)
+
+    assert len(set(tree) - {-1}) == 4
+    assert adjusted_rand_score(precomputed, tree) == 1.0
+
+
+def test_tiled_distances_match_hdbscan_precomputed_in_ram_and_spilled(tmp_path):
+    import hdbscan
+    from sklearn.metrics import adjusted_rand_score
+    from sklearn.metrics.pairwise import cosine_distances
+
+    from backend.agents.clustering_agent import SemanticClusterer
+    from backend.agents.distance_tiles import CosineDistances
+
+    rng = np.random.default_rng(11)
+    centers = rng.standard_normal((6, 24))
+    X = np.vstack([c + 0.3 * rng.standard_normal((50, 24)) for c in centers])
+    X = np.vstack([X, 2 * rng.standard_normal((20, 24))]).astype(np.float32)
+
+    reference = hdbscan.HDBSCAN(metric="precomputed", min_cluster_size=5, min_samples=1).fit_predict(
+        cosine_distances(X.astype(np.float64)))
+    in_ram = SemanticClusterer(min_cluster_size=5)._hdbscan(X)
+    spilled = SemanticClusterer(min_cluster_size=5, distance_budget_mb=0.01, scratch_dir=tmp_path)._hdbscan(X)
+
+    assert adjusted_rand_score(reference, in_ram) == 1.0
+    assert adjusted_rand_score(reference, spilled) == 1.0
+    assert list(tmp_path.iterdir()) == []
+
+    with CosineDistances(X, budget_mb=0.01, scratch_dir=tmp_path, tile_rows=7) as dist:
+        assert dist.spilled and dist.path.exists()
+        np.testing.assert_allclose(dist.row(3), cosine_distances(X[3:4], X)[0], atol=1e-5)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_fallback_scores_every_cut_of_one_tree_like_refitting_each_k():
+    from sklearn.cluster import AgglomerativeClustering
+    from sklearn.metrics import adjusted_rand_score, calinski_harabasz_score
+
+    from backend.agents.clustering_agent import SemanticClusterer, _cut_linkage, _linkage_ch_scores
+    from scipy.cluster.hierarchy import linkage
+
+    rng = np.random.default_rng(5)
+    centers = rng.standard_normal((5, 12))
+    X = np.vstack([c + 0.3 * rng.standard_normal((25, 12)) for c in centers])
+    Z = linkage(X, method='average', metric='cosine')
+    ks = np.arange(2, 11)
+
+    scores = _linkage_ch_scores(X, Z, ks)
+    for k, score in zip(ks, scores):
+        expected = AgglomerativeClustering(n_clusters=k, metric='cosine', linkage='average').fit_predict(X)
+        labels = _cut_linkage(Z, k)
+        assert adjusted_rand_score(expected, labels) == 1.0
+        assert np.isclose(score, calinski_harabasz_score(X, labels))
+
+    labels = SemanticClusterer(fallback_k_range=(2, 10))._fallback_agglomerative(X)
+    assert len(set(labels)) == int(ks[np.argmax(scores)])
+
+    # Sampled tree: every point still gets one of the sample's clusters
+    sampled = SemanticClusterer(fallback_k_range=(2, 10), fallback_max_n=60)._fallback_agglomerative(X)
+    assert len(sampled) == len(X)
+    assert adjusted_rand_score(np.repeat(np.arange(5), 25), sampled) > 0.9
+
+
+def test_fallback_on_fewer_points_than_k_never_puts_every_point_alone():
+    from sklearn.cluster import AgglomerativeClustering
+    from sklearn.metrics import calinski_harabasz_score
+
+    from backend.agents.clustering_agent import SemanticClusterer
+
+    rng = np.random.default_rng(11)
+    clusterer = SemanticClusterer(fallback_k_range=(2, 10))
+    for _ in range(200):
+        X = rng.standard_normal((int(rng.integers(3, 11)), 6))
+        # the loop the fallback replaced: sklearn refuses k = n, so it is never picked
+        best_k, best = None, -1.0
+        for k in range(2, len(X)):
+            labels = AgglomerativeClustering(n_clusters=k, metric='cosine', linkage='average').fit_predict(X)
+            score = calinski_harabasz_score(X, labels)
+            if score > best:
+                best_k, best = k, score
+        assert len(set(clusterer._fallback_agglomerative(X))) == best_k < len(X)
+
+
+def test_reducer_keeps_partition_and_is_saved_with_the_index(tmp_path):
+    from sklearn.metrics import adjusted_rand_score
+
+    from backend.agents.clustering_agent import SemanticClusterer
+    from backend.agents.index_manager import load_reducer, save_index
+    from backend.agents.reducer import EmbeddingReducer
+
+    rng = np.random.default_rng(11)
+    centers = rng.standard_normal((6, 384))
+    X = np.vstack([c + 0.2 * rng.standard_normal((30, 384)) for c in centers]).astype(np.float32)
+    truth = np.repeat(np.arange(6), 30)
+
+    for method in ("pca", "random"):
+        reducer = EmbeddingReducer(method, 32)
+        Xr = reducer.fit_transform(X)
+        assert Xr.shape == (180, 32)
+        labels = SemanticClusterer().cluster(Xr)
+        assert adjusted_rand_score(truth, labels) == 1.0
+    assert reducer.report()["explained_variance"] is None
+    assert 0 < EmbeddingReducer("pca", 32).fit(X).report()["explained_variance"] <= 1
+
+    reducer = EmbeddingReducer("pca", 32).fit(X)
+    save_index(X, truth, [f"/f{i}" for i in range(len(X))], {c: f"/c{c}" for c in range(6)},
+               output_dir=tmp_path, reducer=reducer)
+    loaded = load_reducer(tmp_path)
+    assert loaded.report() == reducer.report()
+    assert np.allclose(loaded.transform(X[:5]), reducer.transform(X[:5]))
+
+    # A later run without reduction must not leave the old reducer behind
+    save_index(X, truth, [f"/f{i}" for i in range(len(X))], {c: f"/c{c}" for c in range(6)},
+               output_dir=tmp_path)
+    assert load_reducer(tmp_path) is None
+
+
+def test_summarize_then_cluster_propagates_micro_cluster_labels():
+    from sklearn.metrics import adjusted_rand_score
+
+    from backend.agents.clustering_agent import SemanticClusterer
+
+    rng = np.random.default_rng(13)
+    centers = rng.standard_normal((5, 32))
+    X = np.vstack([c + 0.15 * rng.standard_normal((600, 32)) for c in centers]).astype(np.float32)
+    truth = np.repeat(np.arange(5), 600)
+
+    clusterer = SemanticClusterer(summarize_above_n=1000, micro_clusters=150)
+    labels = clusterer.cluster(X)
+    assert labels.shape == (3000,)
+    assert adjusted_rand_score(truth, labels) == 1.0
+
+
+def test_doctype_partitions_cluster_separately_and_untyped_clusters_merge():
+    from backend.agents.clustering_agent import PARALLEL_MIN_N
+    from backend.core.file_table import FileTable
+
+    rng = np.random.default_rng(17)
+    topics = rng.standard_normal((2, 24))
+
+    def library(per_group):
+        files = []
+        # Same two topics under both doctypes: global clustering would mix them
+        for doctype in ("resume", "invoice"):
+            for t in range(2):
+                for i in range(per_group):
+                    vec = topics[t] + 0.05 * rng.standard_normal(24)
+                    files.append(_embedded(f"{doctype}{t}_{i}.txt", f"{doctype}: topic {t}", vec.tolist()))
+        # Untyped files close to topic 1 only
+        for i in range(per_group // 2):
+            vec = topics[1] + 0.05 * rng.standard_normal(24)
+            files.append(_embedded(f"note{i}.txt", "plain note", vec.tolist()))
+        return files
+
+    for per_group in (12, PARALLEL_MIN_N // 4):  # in-process, then a process pool
+        table = FileTable.from_embedded(library(per_group))
+        agent = ClusteringAgent(partition_by_doctype=True, max_workers=2)
+        assert agent.cluster_table(table)
+        labels = table.labels
+
+        groups = [labels[k * per_group:(k + 1) * per_group] for k in range(4)]
+        assert all(len(set(g)) == 1 and g[0] != -1 for g in groups)
+        assert len({int(g[0]) for g in groups}) == 4
+        # Untyped topic-1 clusters joined typed topic-1 clusters (noise stays noise)
+        untyped = labels[4 * per_group:]
+        assert set(untyped[untyped != -1]) <= {groups[1][0], groups[3][0]}
+        assert (untyped != -1).any()
+
+
+def _clustered(name: str, identity: str, embedding, cluster_id: int):
+    from backend.core.models import ClusteredFile
+
+    e = _embedded(name, identity, list(embedding))
+    return ClusteredFile(file_meta=e.file_meta, embedding=e.embedding, raw_text=identity,
+                         cluster_id=cluster_id, status="clustered")
+
+
+def test_merge_similar_clusters_uses_centroids_and_keeps_unchanged_ids():
+    rng = np.random.default_rng(19)
+    topics = rng.standard_normal((3, 16))
+
+    def members(cid, topic, identity, n=4):
+        return [_clustered(f"{cid}_{i}.txt", identity, topics[topic] + 0.05 * rng.standard_normal(16), cid)
+                for i in range(n)]
+
+    cluster_map = {
+        3: members(3, 0, "report: quarterly"),
+        5: members(5, 0, "report: annual"),         # same topic as 3 → merges into 3
+        7: members(7, 1, "notes"),
+        9: members(9, 1, "resume: engineer"),       # same topic as 7, untyped 7 may join it
+        11: members(11, 1, "invoice: hardware"),    # same topic, but a different doctype than 9
+        -1: members(-1, 2, "noise", n=2),
+    }
+    names = {cid: f"name {cid}" for cid in cluster_map}
+
+    agent = ClusteringAgent.__new__(ClusteringAgent)
+    merged = agent.merge_similar_clusters(cluster_map, names)
+
+    assert len(merged[3]) == 8 and 5 not in merged
+    assert -1 in merged and len(merged[-1]) == 2
+    # resume and invoice clusters never share a folder, whatever their centroids say
+    assert not any({9, 11} <= {f.cluster_id for f in files} for files in merged.values())
+    assert sum(len(v) for v in merged.values()) == sum(len(v) for v in cluster_map.values())
+
+
+def test_clusters_named_alike_share_one_id():
+    from backend.pipeline.tauri_pipeline import _merge_and_rename
+
+    rng = np.random.default_rng(29)
+    topics = rng.standard_normal((3, 16))
+    cluster_map = {
+        cid: [_clustered(f"{cid}_{i}.txt", "notes", topics[cid] + 0.05 * rng.standard_normal(16), cid)
+              for i in range(3)]
+        for cid in range(3)
+    }
+    # centroids far apart, so merge_similar_clusters leaves all three alone
+    names = {0: "Tax Returns", 1: "Travel", 2: "tax returns "}
+    agent = ClusteringAgent.__new__(ClusteringAgent)
+
+    merged, merged_names = _merge_and_rename(agent, None, cluster_map, names, kept={2})
+    assert sorted(merged) == [1, 2] and merged_names == {1: "Travel", 2: "tax returns "}
+    assert len(merged[2]) == 6 and {f.cluster_id for f in merged[2]} == {2}
+
+
+def test_unsampled_files_join_their_nearest_sampled_cluster(tmp_path, monkeypatch):
+    from backend.agents.assignment_agent import AssignmentAgent
+    from backend.core.file_table import FileTable
+    from backend.pipeline.tauri_pipeline import TauriPipeline, _sample_rows
+
+    rng = np.random.default_rng(31)
+    topics = rng.standard_normal((3, 24))
+    files = [_embedded(f"t{t}_{i}.txt", "notes", (topics[t] + 0.05 * rng.standard_normal(24)).tolist())
+             for t in range(3) for i in range(20)]
+    table = FileTable.from_embedded(files)
+    sample_paths = {f.file_meta.file_path for f in files if int(f.file_meta.file_name[3:-4]) < 8}
+
+    sample = _sample_rows(table, sample_paths)
+    assert ClusteringAgent(min_cluster_size=3).cluster_table(table, sample)
+    assert len(table.indices("embedded")) == 36     # the rest waits for assignment
+    cluster_map = {}
+    for f in table.clustered_files():
+        cluster_map.setdefault(f.cluster_id, []).append(f)
+    folder_names = {cid: f"Topic {cid}" for cid in cluster_map if cid != -1}
+
+    votes = []
+    query = AssignmentAgent._query_index_batch
+    monkeypatch.setattr(AssignmentAgent, "_query_index_batch",
+                        lambda self, normed: votes.extend(query(self, normed)) or votes)
+
+    pipeline = TauriPipeline(str(tmp_path))
+    assigned = pipeline._assign_unsampled(table, cluster_map, folder_names)
+
+    assert len(assigned) == 36 and not len(table.indices("embedded"))
+    sampled = np.array([f.embedding for f in files])[sample]
+    sampled_labels = table.labels[sample]
+    for f in assigned:
+        nearest = np.argmax(sampled @ np.array(f.embedding))
+        assert f.cluster_id == sampled_labels[nearest] != -1
+        assert f in cluster_map[f.cluster_id]
+    for f, r in zip(assigned, votes):
+        # what relocation joins onto input_folder for this cluster
+        assert r.folder_path == str(tmp_path / folder_names[f.cluster_id])
+
+
+def test_knn_graph_backend_matches_exact_hdbscan():
+    from sklearn.metrics import adjusted_rand_score
+
+    from backend.agents.clustering_agent import SemanticClusterer
+    from backend.agents.knn_graph import knn_hdbscan
+
+    rng = np.random.default_rng(23)
+    centers = rng.standard_normal((6, 32))
+    X = np.vstack([c + 0.1 * rng.standard_normal((80, 32)) for c in centers]).astype(np.float32)
+    X = np.vstack([X, rng.standard_normal((3, 32)).astype(np.float32) * 5])  # a few outliers
+    truth = np.repeat(np.arange(6), 80)
+
+    exact = SemanticClusterer()._hdbscan(X)
+    # Exact flat index and HNSW both reproduce the exact partition
+    for hnsw_min_n in (10 ** 9, 0):
+        labels = knn_hdbscan(X, k=15, hnsw_min_n=hnsw_min_n)
+        assert adjusted_rand_score(truth, labels[:480]) == 1.0
+        assert adjusted_rand_score(exact, labels) > 0.99
+
+    labels = SemanticClusterer(backend="knn").cluster(X)
+    assert adjusted_rand_score(truth, labels[:480]) == 1.0
+
+
+def test_hdbscan_internals_used_by_mst_labels_are_importable():
+    # Private API: if this fails after bumping the hdbscan pin, the tiled and
+    # kNN paths are running on the ball-tree fallback below.
+    from hdbscan._hdbscan_linkage import label  # noqa: F401
+    from hdbscan.hdbscan_ import _tree_to_labels  # noqa: F401
+
+    from backend.agents.knn_graph import mst_labels_available
+    assert mst_labels_available()
+
+
+def test_missing_hdbscan_internals_fall_back_to_the_public_api(monkeypatch):
+    from sklearn.metrics import adjusted_rand_score
+
+    from backend.agents import knn_graph
+    from backend.agents.clustering_agent import SemanticClusterer
+
+    rng = np.random.default_rng(31)
+    centers = rng.standard_normal((4, 16))
+    X = np.vstack([c + 0.1 * rng.standard_normal((30, 16)) for c in centers]).astype(np.float32)
+    truth = np.repeat(np.arange(4), 30)
+
+    monkeypatch.setattr(knn_graph, "_hdbscan_internals", lambda: None)
+    with pytest.raises(ImportError):
+        knn_graph.mst_labels(np.zeros((1, 3)), 2)
+    assert adjusted_rand_score(truth, SemanticClusterer()._hdbscan(X)) == 1.0
+    assert adjusted_rand_score(truth, knn_graph.knn_hdbscan(X, k=10)) == 1.0
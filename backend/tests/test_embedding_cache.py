@@ -0,0 +1,130 @@
+import pickle
+import threading
+
+import numpy as np
+
+from backend.agents import embedding_cache
+from backend.agents.embedding_cache import EmbeddingCache
+
+
+def _vec(i: int) -> np.ndarray:
+    return np.full(4, i, dtype=np.float32)
+
+
+def test_entries_written_by_one_instance_are_seen_by_another(tmp_path):
+    a = EmbeddingCache(tmp_path, legacy_path=None)
+    b = EmbeddingCache(tmp_path, legacy_path=None)
+
+    a.put(("/x.txt", "t0"), [1.0, 2.0])
+    assert b.get(("/x.txt", "t0")) is None
+    b.refresh()
+    assert b.get(("/x.txt", "t0")).tolist() == [1.0, 2.0]
+
+
+def test_concurrent_writers_lose_nothing(tmp_path):
+    # Two "processes" (independent instances) each written to by several threads.
+    caches = [EmbeddingCache(tmp_path, legacy_path=None) for _ in range(2)]
+
+    def writer(cache, base):
+        for i in range(50):
+            cache.put_many([((f"/f{base + i}", "t"), _vec(base + i))])
+
+    threads = [
+        threading.Thread(target=writer, args=(caches[t % 2], t * 1000))
+        for t in range(6)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    fresh = EmbeddingCache(tmp_path, legacy_path=None)
+    assert len(fresh) == 300
+    assert fresh.get(("/f5049", "t"))[0] == 5049
+
+
+def test_compaction_keeps_entries_and_other_readers_follow(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "_COMPACT_MIN_ENTRIES", 4)
+    a = EmbeddingCache(tmp_path, legacy_path=None)
+    b = EmbeddingCache(tmp_path, legacy_path=None)
+    for i in range(12):
+        a.put((f"/f{i}", "t"), _vec(i))
+    inode = a._log_path.stat().st_ino
+    assert a._logged == 12  # distinct files only grow the log, never compact it
+
+    for i in range(13):     # re-embedding the same files supersedes entries
+        a.put((f"/f{i % 6}", "t"), _vec(100 + i))
+    assert a._log_path.stat().st_ino != inode
+    assert a._logged <= 2 * len(a)
+
+    b.refresh()
+    assert len(b) == 12
+    assert b.get(("/f0", "t"))[0] == 112
+
+
+def test_reader_keeps_its_old_view_until_a_compacted_log_is_replayed(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "_COMPACT_MIN_ENTRIES", 1)
+    a = EmbeddingCache(tmp_path, legacy_path=None)
+    b = EmbeddingCache(tmp_path, legacy_path=None)
+    a.put_many([((f"/f{i}", "t"), _vec(i)) for i in range(3)])
+    b.refresh()
+    for i in range(7):
+        a.put(("/f0", "t"), _vec(i))   # forces a compaction: new inode
+
+    seen = []
+    real_loads = pickle.loads
+
+    def loads(data):
+        seen.append(len(b._entries))    # what a lock-free get() sees mid-replay
+        return real_loads(data)
+
+    monkeypatch.setattr(embedding_cache.pickle, "loads", loads)
+    b.refresh()
+    assert seen and min(seen) == 3
+    assert len(b) == 3
+
+
+def test_reader_notices_a_replaced_log_that_reuses_the_inode(tmp_path):
+    a = EmbeddingCache(tmp_path / "a", legacy_path=None)
+    a.put_many([((f"/a{i}", "t"), _vec(i)) for i in range(3)])
+    b = EmbeddingCache(tmp_path / "a", legacy_path=None)
+    inode = a._log_path.stat().st_ino
+
+    # A longer log of another generation lands in the same inode, as a
+    # compaction can after the old file's inode is freed and reused.
+    other = EmbeddingCache(tmp_path / "other", legacy_path=None)
+    for i in range(5):
+        other.put((f"/o{i}", "t"), _vec(10 + i))
+    with open(a._log_path, "r+b") as f:
+        f.write(other._log_path.read_bytes())
+    assert a._log_path.stat().st_ino == inode and a._log_path.stat().st_size > b._offset
+
+    b.refresh()
+    assert sorted(k for k, _ in b._entries) == [f"/o{i}" for i in range(5)]
+    b.put(("/b", "t"), _vec(99))
+    assert len(EmbeddingCache(tmp_path / "a", legacy_path=None)) == 6  # nothing cut off
+
+
+def test_torn_tail_is_ignored_and_trimmed(tmp_path):
+    a = EmbeddingCache(tmp_path, legacy_path=None)
+    a.put(("/ok", "t"), _vec(1))
+    with open(tmp_path / "cache.log", "ab") as f:
+        f.write(b"\xff\x00\x00\x00partial")
+
+    b = EmbeddingCache(tmp_path, legacy_path=None)
+    assert len(b) == 1
+    b.put(("/next", "t"), _vec(2))
+
+    c = EmbeddingCache(tmp_path, legacy_path=None)
+    assert c.get(("/ok", "t")) is not None
+    assert c.get(("/next", "t")) is not None
+
+
+def test_legacy_pickle_is_imported_once(tmp_path):
+    legacy = tmp_path / "embedding_cache.pkl"
+    with open(legacy, "wb") as f:
+        pickle.dump({("/old.pdf", "t"): [0.5, 0.5]}, f)
+
+    cache = EmbeddingCache(tmp_path / "cache", legacy_path=legacy)
+    assert cache.get(("/old.pdf", "t")).dtype == np.float32
+    assert len(EmbeddingCache(tmp_path / "cache", legacy_path=legacy)) == 1
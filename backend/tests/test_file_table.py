@@ -0,0 +1,110 @@
+import numpy as np
+
+from backend.agents.embedding_agent import EmbeddingAgent
+from backend.agents.embedding_cache import EmbeddingCache
+from backend.core.file_table import FileTable
+from backend.core.models import EmbeddedFile, FileContent, FileMeta
+
+
+def _meta(name: str, detected_type: str = "text") -> FileMeta:
+    return FileMeta(
+        file_path=f"/tmp/{name}",
+        file_name=name,
+        extension="." + name.rsplit(".", 1)[-1],
+        detected_type=detected_type,
+        size_kb=1.5,
+        created_at="2024-01-01T00:00:00",
+        modified_at="2024-03-05T12:30:15.250000",
+    )
+
+
+def test_meta_round_trips_through_columns():
+    metas = [_meta("a.txt"), _meta("b.mp4", "video"), _meta("c.txt")]
+    table = FileTable.from_metas(metas)
+
+    assert len(table) == 3
+    assert [table.meta(i) for i in range(3)] == metas
+    assert table.type_codes.dtype == np.int8
+    assert table.mtimes.dtype == np.float64
+
+
+def test_embedded_round_trip_keeps_vectors_and_text():
+    files = [
+        EmbeddedFile(file_meta=_meta("a.txt"), embedding=[1.0, 0.0], raw_text="resume: a", status="embedded"),
+        EmbeddedFile(file_meta=_meta("b.png", "image"), embedding=None, raw_text="2023", status="photo"),
+        EmbeddedFile(file_meta=_meta("c.txt"), embedding=[0.0, 1.0], raw_text="notes: c", status="embedded"),
+    ]
+    table = FileTable.from_embedded(files)
+
+    assert table.embeddings.shape == (2, 2)
+    assert list(table.embedding_rows) == [0, -1, 1]
+    assert list(table.indices("embedded")) == [0, 2]
+    assert table.embedded_files() == files
+
+
+def test_embed_table_routes_statuses_without_encoding_skips(tmp_path):
+    agent = EmbeddingAgent.__new__(EmbeddingAgent)
+    agent._cache = EmbeddingCache(tmp_path, legacy_path=None)
+    encoded = []
+
+    def fake_batch(texts):
+        encoded.extend(texts)
+        return np.tile(np.float32([0.1, 0.2, 0.3]), (len(texts), 1))
+
+    agent._encode_batch = fake_batch
+
+    contents = [
+        FileContent(_meta("plan.txt"), "agreement: health plan coverage benefits policy", "success"),
+        FileContent(_meta("clip.mp4", "video"), "clip", "success"),
+        FileContent(_meta("IMG_1.jpg", "image"), "__PHOTO__2021", "success"),
+        FileContent(_meta("broken.txt"), "", "error"),
+        FileContent(_meta("tiny.txt"), "hi", "success"),
+    ]
+    table = agent.embed_table(FileTable.from_contents(contents))
+
+    assert [table.status(i) for i in range(len(table))] == [
+        "embedded", "skipped", "photo", "error", "too_short",
+    ]
+    assert len(encoded) == 1
+    assert table.text(2) == "2021"
+    assert table.embedding(0).tolist() == np.float32([0.1, 0.2, 0.3]).tolist()
+    assert table.embedding(1) is None
+
+
+def test_embed_table_stores_the_encoders_array_without_copying(tmp_path):
+    agent = EmbeddingAgent.__new__(EmbeddingAgent)
+    agent._cache = EmbeddingCache(tmp_path, legacy_path=None)
+    batch = np.arange(6, dtype=np.float32).reshape(2, 3)
+    agent._encoder = type("Encoder", (), {"encode": lambda self, texts: batch})()
+
+    contents = [
+        FileContent(_meta(f"note{i}.txt"), "meeting notes about the quarterly budget review", "success")
+        for i in range(2)
+    ]
+    table = agent.embed_table(FileTable.from_contents(contents))
+
+    assert np.shares_memory(table.embeddings, batch)
+    assert table.embedding(1).tolist() == [3.0, 4.0, 5.0]
+
+
+def test_hdbscan_clusters_the_tables_float32_embedding_matrix(monkeypatch):
+    from backend.agents.clustering_agent import SemanticClusterer
+
+    def no_fallback(self, X):
+        raise AssertionError("HDBSCAN did not produce the labels; the agglomerative fallback ran")
+
+    monkeypatch.setattr(SemanticClusterer, "_fallback_agglomerative", no_fallback)
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((3, 16))
+    vectors = np.vstack([c + 0.05 * rng.standard_normal((10, 16)) for c in centers])
+    files = [
+        EmbeddedFile(_meta(f"f{i}.txt"), vec.tolist(), "notes", "embedded")
+        for i, vec in enumerate(vectors)
+    ]
+    X = FileTable.from_embedded(files).embedding_matrix(np.arange(len(files)))
+    assert X.dtype == np.float32  # what ClusteringAgent.cluster_table hands over
+
+    blobs = SemanticClusterer().cluster(X).reshape(3, 10)
+    assert all(len(set(row)) == 1 for row in blobs)
+    assert len({row[0] for row in blobs}) == 3
@@ -0,0 +1,159 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+from backend.agents import model_registry
+
+
+class _FakeModel:
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts, convert_to_numpy=True):
+        self.calls += 1
+        return np.ones((len(texts), 4), dtype=np.float64)
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    monkeypatch.setattr(model_registry, "_encoders", {})
+    monkeypatch.setattr(model_registry, "_auto", {})
+    monkeypatch.setattr(model_registry, "_racing", {})
+
+
+def _no_daemon(monkeypatch):
+    monkeypatch.setattr(model_registry, "_server_healthy", lambda timeout=1.0: False)
+    monkeypatch.setattr(model_registry, "_daemon_alive", lambda: False)
+
+
+def test_same_encoder_is_shared(monkeypatch):
+    _no_daemon(monkeypatch)
+    a = model_registry.get_encoder("m")
+    b = model_registry.get_encoder("m")
+    assert a is b
+    assert a.backend == "local"
+    assert not a.loaded  # lazy: nothing loaded until first encode
+
+
+def test_auto_prefers_server_when_up(monkeypatch):
+    monkeypatch.setattr(model_registry, "_server_healthy", lambda timeout=1.0: True)
+    assert model_registry.get_encoder("m").backend == "server"
+
+
+def test_local_copy_that_loses_the_race_is_dropped(monkeypatch):
+    import threading
+
+    loading, gate = threading.Event(), threading.Event()
+    warmed = []
+
+    def slow_load(self):
+        loading.set()
+        gate.wait(5)
+        self._model = _FakeModel()
+        warmed.append(self)
+        return self._model
+
+    # the server turns healthy only once the local copy is already loading
+    monkeypatch.setattr(model_registry, "_server_healthy", lambda timeout=1.0: loading.is_set())
+    monkeypatch.setattr(model_registry, "_daemon_alive", lambda: True)
+    monkeypatch.setattr(model_registry._LocalEncoder, "model", property(slow_load))
+    racer = model_registry._RacingEncoder("m")
+    assert racer.wait().backend == "server"
+
+    gate.set()  # the local load finishes after the server has won
+    deadline = time.monotonic() + 2
+    while not (warmed and not warmed[0].loaded) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert warmed and not warmed[0].loaded
+    assert model_registry.get_encoder("m").backend == "server"
+
+
+def test_auto_prefers_resident_local_copy(monkeypatch):
+    monkeypatch.setattr(model_registry, "_server_healthy", lambda timeout=1.0: True)
+    local = model_registry.get_encoder("m", backend="local")
+    local._model = _FakeModel()
+    assert model_registry.get_encoder("m") is local
+
+
+def test_local_encode_returns_float32_matrix():
+    enc = model_registry.get_encoder("m", backend="local")
+    enc._model = _FakeModel()
+    out = enc.encode(["a", "b"])
+    assert out.dtype == np.float32
+    assert out.shape == (2, 4)
+    assert enc.encode_one("c").shape == (4,)
+
+
+def test_stale_pid_file_resolves_local_without_waiting(tmp_path, monkeypatch):
+    pid_file = tmp_path / "daemon.pid"
+    pid_file.write_text("999999999")
+    monkeypatch.setattr(model_registry, "_PID_FILE", pid_file)
+    monkeypatch.setattr(model_registry, "_server_healthy", lambda timeout=1.0: False)
+
+    start = time.monotonic()
+    enc = model_registry.get_encoder("m")
+    assert enc.backend == "local"
+    assert time.monotonic() - start < 0.5
+
+
+def test_live_daemon_races_server_against_local_warmup(monkeypatch):
+    probes = iter([False, False, True])
+    monkeypatch.setattr(model_registry, "_server_healthy", lambda timeout=1.0: next(probes, True))
+    monkeypatch.setattr(model_registry, "_daemon_alive", lambda: True)
+    # local warm-up never finishes in this test
+    monkeypatch.setattr(model_registry._LocalEncoder, "model", property(lambda self: time.sleep(5)))
+
+    enc = model_registry.get_encoder("m")
+    assert enc.backend == "pending"
+    assert enc.wait().backend == "server"
+    assert model_registry.get_encoder("m").backend == "server"
+
+
+def test_route_local_queues_calls_with_process_priority(monkeypatch):
+    local = model_registry.get_encoder("m", backend="local")
+    local._model = _FakeModel()
+    seen = []
+
+    def submit(texts, lane):
+        seen.append(lane)
+        return local.encode(texts)
+
+    model_registry.route_local("m", submit)
+    monkeypatch.setattr(model_registry, "_priority", "background")
+    routed = model_registry.get_encoder("m")
+    routed.encode(["a"])
+    routed.encode_one("b", priority="interactive")
+    assert seen == ["background", "interactive"]
+    assert model_registry.load_local("m") is local
+
+    model_registry.route_local("m", None)
+    assert model_registry.get_encoder("m", backend="local") is local
+
+
+def test_model_errors_over_shm_do_not_switch_the_transport_off(monkeypatch, capsys):
+    from backend.daemon import shm
+    from backend.daemon.model_client import ModelServerError
+
+    enc = model_registry._ServerEncoder("m")
+    enc._use_shm = True
+    texts = ["t"] * model_registry._SHM_MIN_TEXTS
+    replies = []
+
+    def embed_shm(texts, timeout, headers):
+        raise replies.pop(0)
+
+    monkeypatch.setattr(enc._client, "embed_shm", embed_shm)
+    monkeypatch.setattr(enc, "_post", lambda path, texts, timeout, priority: np.zeros((len(texts), 2)))
+
+    for status, error in ((500, "encode failed"), (400, "unknown model: m")):
+        replies.append(ModelServerError(status, json.dumps({"error": error}).encode()))
+        with pytest.raises(ModelServerError):
+            enc.encode(texts)
+        assert enc._use_shm
+
+    replies.append(ModelServerError(400, json.dumps({"error": shm.DESCRIPTOR_ERROR}).encode()))
+    assert enc.encode(texts).shape == (len(texts), 2)  # falls back to the socket
+    assert not enc._use_shm
+    assert capsys.readouterr().out == ""
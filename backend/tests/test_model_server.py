@@ -0,0 +1,490 @@
+"""
+Tests for the model server's micro-batcher and HTTP surface.
+
+A fake encoder stands in for sentence-transformers: each text maps to a
+vector derived from its length, so every caller can check it got its own rows.
+"""
+
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from backend.daemon import shm, wire
+from backend.daemon.model_client import ModelServerClient, ModelServerError, _UnixHTTPConnection
+from backend.daemon.model_server import (
+    Cancelled, DeadlineExceeded, ModelServer, QueueFull, ShuttingDown, _MicroBatcher,
+)
+from backend.daemon.result_cache import ResultCache
+
+
+class _FakeEncoder:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def encode(self, texts):
+        with self.lock:
+            self.calls.append(len(texts))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+    def encode_one(self, text):
+        return self.encode([text])[0]
+
+
+def test_concurrent_requests_are_coalesced():
+    enc = _FakeEncoder()
+    batcher = _MicroBatcher(enc.encode, window=0.05, max_batch=256)
+    results = {}
+
+    def call(i):
+        results[i] = batcher.submit(["x" * i])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(1, 41)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.stop()
+
+    assert all(results[i][0, 0] == i for i in results)
+    assert len(enc.calls) < 10
+    assert sum(enc.calls) == 40
+
+
+def test_large_request_is_chunked_in_order():
+    enc = _FakeEncoder()
+    batcher = _MicroBatcher(enc.encode, window=0.0, max_batch=4)
+    texts = ["x" * i for i in range(1, 11)]
+    out = batcher.submit(texts)
+    batcher.stop()
+
+    assert out[:, 0].tolist() == list(range(1, 11))
+    assert max(enc.calls) <= 4
+
+
+def test_encode_errors_reach_every_caller():
+    def boom(texts):
+        raise RuntimeError("model exploded")
+
+    batcher = _MicroBatcher(boom, window=0.0)
+    with pytest.raises(RuntimeError):
+        batcher.submit(["a"])
+    batcher.stop()
+
+
+def test_interactive_lane_overtakes_queued_background_work():
+    order = []
+
+    def slow_encode(texts):
+        time.sleep(0.01)
+        order.extend(texts)
+        return np.ones((len(texts), 2), dtype=np.float32)
+
+    batcher = _MicroBatcher(slow_encode, window=0.0, max_batch=4)
+    done = {}
+
+    def call(lane, texts):
+        batcher.submit(texts, lane)
+        done[lane] = time.monotonic()
+
+    bg = threading.Thread(target=call, args=("background", ["b"] * 200))
+    bg.start()
+    time.sleep(0.05)
+    lanes = batcher.stats()["lanes"]
+    assert lanes["background"]["queued_texts"] > 0
+    assert lanes["interactive"]["queued_texts"] == 0
+
+    call("interactive", ["i"] * 12)
+    bg.join()
+    batcher.stop()
+
+    assert done["interactive"] < done["background"]
+    # once queued, interactive work takes most of each batch but background still moves
+    first_i = order.index("i")
+    window = order[first_i:first_i + 12]
+    assert 0 < window.count("b") < window.count("i")
+
+
+def test_unknown_lane_is_rejected():
+    batcher = _MicroBatcher(lambda texts: np.ones((len(texts), 2)), window=0.0)
+    with pytest.raises(ValueError):
+        batcher.submit(["a"], "urgent")
+    batcher.stop()
+
+
+class _GatedEncoder:
+    """Blocks the batcher's first call until released, so later submits stay queued."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.seen = []
+
+    def encode(self, texts):
+        self.gate.wait(5)
+        self.seen.extend(texts)
+        return np.ones((len(texts), 2), dtype=np.float32)
+
+
+def _occupy(batcher):
+    t = threading.Thread(target=batcher.submit, args=(["busy"],))
+    t.start()
+    time.sleep(0.05)
+    return t
+
+
+def test_full_lane_is_refused_with_retry_hint():
+    enc = _GatedEncoder()
+    batcher = _MicroBatcher(enc.encode, window=0.0, max_queued=10)
+    busy = _occupy(batcher)
+    queued = threading.Thread(target=batcher.submit, args=(["q"] * 8, "background"))
+    queued.start()
+    time.sleep(0.05)
+
+    with pytest.raises(QueueFull) as err:
+        batcher.submit(["x"] * 5, "background")
+    assert err.value.retry_after >= 1
+    enc.gate.set()
+    busy.join()
+    queued.join()
+    assert batcher.stats()["rejected"] == 1
+    batcher.stop()
+
+
+def test_expired_and_cancelled_work_is_never_encoded():
+    enc = _GatedEncoder()
+    batcher = _MicroBatcher(enc.encode, window=0.0)
+    busy = _occupy(batcher)
+
+    with pytest.raises(DeadlineExceeded):
+        batcher.submit(["late"], deadline=time.monotonic() + 0.1)
+    with pytest.raises(Cancelled):
+        batcher.submit(["gone"], is_cancelled=lambda: True)
+
+    enc.gate.set()
+    busy.join()
+    batcher.submit(["after"])
+    batcher.stop()
+    assert enc.seen == ["busy", "after"]
+    assert batcher.stats()["expired"] == 1 and batcher.stats()["cancelled"] == 1
+
+
+def test_stop_fails_queued_work_instead_of_hanging():
+    enc = _GatedEncoder()
+    batcher = _MicroBatcher(enc.encode, window=0.0)
+    busy = _occupy(batcher)
+    errors = []
+
+    def queued():
+        try:
+            batcher.submit(["waiting"])  # no deadline: would block forever
+        except ShuttingDown as exc:
+            errors.append(exc)
+
+    waiter = threading.Thread(target=queued)
+    waiter.start()
+    time.sleep(0.05)
+    batcher.stop()
+    waiter.join(timeout=2)
+    assert not waiter.is_alive() and len(errors) == 1
+    assert batcher.stats()["queued_texts"] == 0
+    with pytest.raises(ShuttingDown):
+        batcher.submit(["late"])
+
+    enc.gate.set()
+    busy.join()  # the batch already with the model still completes
+    assert enc.seen == ["busy"]
+
+
+@pytest.fixture
+def model_server(monkeypatch, tmp_path):
+    monkeypatch.setattr("backend.agents.model_registry.load_local", lambda name, **kw: _FakeEncoder())
+    srv = ModelServer(model_name="fake", port=0, socket_path=tmp_path / "model.sock", models=["bigger"])
+    srv.start()
+    yield srv
+    srv.stop()
+
+
+@pytest.fixture
+def server(model_server):
+    return f"http://127.0.0.1:{model_server.port}"
+
+
+def _post(url, payload):
+    req = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}, method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=5) as r:
+        return json.loads(r.read())
+
+
+def test_http_embed_and_health(server):
+    assert _post(f"{server}/embed", {"text": "abc"})["embedding"] == [3.0, 1.0]
+    batch = _post(f"{server}/embed_batch", {"texts": ["a", "bb"]})["embeddings"]
+    assert batch == [[1.0, 1.0], [2.0, 1.0]]
+
+    with urllib.request.urlopen(f"{server}/health", timeout=5) as r:
+        health = json.loads(r.read())
+    assert health["model"] == "fake"
+    assert health["batcher"]["texts_encoded"] == 3
+
+
+def test_wire_round_trip():
+    texts = ["", "héllo wörld", "日本語", "x" * 5000]
+    assert wire.unpack_texts(wire.pack_texts(texts)) == texts
+
+    vecs = np.random.default_rng(0).standard_normal((3, 5)).astype(np.float32)
+    assert np.array_equal(wire.unpack_vectors(wire.pack_vectors(vecs)), vecs)
+    half = wire.unpack_vectors(wire.pack_vectors(vecs, "float16"))
+    assert half.dtype == np.float32
+    assert np.allclose(half, vecs, atol=1e-2)
+
+
+def test_accept_header_negotiation():
+    assert wire.accepted_dtype("application/json") is None
+    assert wire.accepted_dtype(wire.VECTORS_CONTENT_TYPE) == "float32"
+    assert wire.accepted_dtype(f"application/json, {wire.VECTORS_CONTENT_TYPE}; dtype=float16") == "float16"
+
+
+def test_http_binary_request_and_response(server):
+    req = urllib.request.Request(
+        f"{server}/embed_batch",
+        data=wire.pack_texts(["a", "bbb"]),
+        headers={"Content-Type": wire.TEXTS_CONTENT_TYPE, "Accept": wire.VECTORS_CONTENT_TYPE},
+        method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=5) as r:
+        assert r.headers["Content-Type"] == wire.VECTORS_CONTENT_TYPE
+        vecs = wire.unpack_vectors(r.read())
+    assert vecs.tolist() == [[1.0, 1.0], [3.0, 1.0]]
+
+
+def test_server_encoder_client_uses_binary_transport(server, monkeypatch):
+    from backend.agents import model_registry
+
+    monkeypatch.setattr(model_registry, "MODEL_SERVER_URL", server)
+    monkeypatch.setattr(model_registry, "MODEL_SERVER_SOCKET", None)
+    enc = model_registry._ServerEncoder("fake")
+    assert enc.encode(["ab", "c"]).tolist() == [[2.0, 1.0], [1.0, 1.0]]
+    assert enc.encode_one("abcd").tolist() == [4.0, 1.0]
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="no Unix sockets")
+def test_unix_socket_client_reuses_one_connection(model_server):
+    client = ModelServerClient("http://127.0.0.1:1", model_server.socket_path)
+    headers = {"Content-Type": wire.TEXTS_CONTENT_TYPE, "Accept": wire.VECTORS_CONTENT_TYPE}
+
+    status, _, body = client.request("POST", "/embed_batch", wire.pack_texts(["ab"]), headers)
+    conn = client._local.conn
+    assert status == 200 and isinstance(conn, _UnixHTTPConnection)
+    for i in range(1, 6):
+        status, _, body = client.request("POST", "/embed", wire.pack_texts(["x" * i]), headers)
+        assert wire.unpack_vectors(body).tolist() == [[float(i), 1.0]]
+    assert client._local.conn is conn
+
+    # a dropped connection is re-opened transparently
+    conn.sock.shutdown(socket.SHUT_RDWR)
+    status, _, body = client.request("GET", "/health")
+    assert status == 200 and json.loads(body)["model"] == "fake"
+    client.close()
+
+
+@pytest.mark.skipif(not shm.available(), reason="no shared memory")
+def test_shared_memory_transport_round_trip(model_server, server):
+    client = ModelServerClient(server, None)
+    client._local.dim = 1  # undersized guess: server asks for room, client grows and resends
+    texts = ["x" * (i % 50 + 1) for i in range(300)]
+
+    out = client.embed_shm(texts)
+    assert out[:, 0].tolist() == [float(len(t)) for t in texts]
+    assert client._local.dim == 2
+
+    arena = client._local.arena.name
+    assert client.embed_shm(["abc"]).tolist() == [[3.0, 1.0]]
+    assert client._local.arena.name == arena  # segment is reused, not re-created
+
+    status, _, body = client.request("GET", "/health")
+    assert json.loads(body)["shm_segments"] >= 1
+    client._local.arena.close()
+
+
+def test_shm_refuses_foreign_segment_names(server):
+    req = urllib.request.Request(
+        f"{server}/embed_shm",
+        data=json.dumps({"segment": "someone_else", "texts_len": 0, "vectors_offset": 0}).encode(),
+        method="POST",
+    )
+    with pytest.raises(urllib.error.HTTPError) as err:
+        urllib.request.urlopen(req, timeout=5)
+    assert err.value.code == 400
+
+
+def test_oversized_requests_are_refused(server, monkeypatch):
+    from backend.daemon import model_server as ms
+
+    monkeypatch.setattr(ms, "MAX_TEXTS", 3)
+    with pytest.raises(urllib.error.HTTPError) as err:
+        _post(f"{server}/embed_batch", {"texts": ["a"] * 4})
+    assert err.value.code == 413
+
+    monkeypatch.setattr(ms, "MAX_BODY_BYTES", 64)
+    with pytest.raises(urllib.error.HTTPError) as err:
+        _post(f"{server}/embed_batch", {"texts": ["a" * 100]})
+    assert err.value.code == 413
+
+
+def test_client_waits_out_a_busy_server(server, monkeypatch):
+    from backend.daemon import model_server as ms
+
+    client = ModelServerClient(server, None)
+    body = wire.pack_texts(["abc"])
+    headers = {"Content-Type": wire.TEXTS_CONTENT_TYPE, "Accept": wire.VECTORS_CONTENT_TYPE}
+    replies = iter([(503, {"Retry-After": "0"}, b'{"error": "busy"}')])
+    real = client.request
+    monkeypatch.setattr(client, "request", lambda *a, **k: next(replies, None) or real(*a, **k))
+
+    _, data = client.call("POST", "/embed_batch", body, headers, timeout=5)
+    assert wire.unpack_vectors(data).tolist() == [[3.0, 1.0]]
+
+    monkeypatch.setattr(ms, "MAX_TEXTS", 0)
+    with pytest.raises(ModelServerError) as err:
+        client.call("POST", "/embed_batch", body, headers, timeout=5)
+    assert err.value.status == 413
+    client.close()
+
+
+def test_result_cache_serves_repeats_without_encoding(server):
+    _post(f"{server}/embed_batch", {"texts": ["same", "same", "other"]})
+    batch = _post(f"{server}/embed_batch", {"texts": ["other", "new", "same"]})["embeddings"]
+    assert batch == [[5.0, 1.0], [3.0, 1.0], [4.0, 1.0]]
+
+    with urllib.request.urlopen(f"{server}/health", timeout=5) as r:
+        health = json.loads(r.read())
+    assert health["batcher"]["texts_encoded"] == 3   # "same", "other", "new" once each
+    assert health["cache"] == {"entries": 3, "hits": 2, "misses": 4}
+
+
+def test_result_cache_snapshot_round_trip(tmp_path):
+    path = tmp_path / "results.pkl"
+    cache = ResultCache(max_entries=2, path=path)
+    cache.store("m", ["a", "b", "c"], np.eye(3, dtype=np.float32))
+    cache.save()
+
+    warm = ResultCache(path=path)
+    warm.load()
+    found, missing = warm.lookup("m", ["a", "b", "c"])
+    assert missing == [0]  # "a" was evicted by the size bound
+    assert found[2].tolist() == [0.0, 0.0, 1.0]
+    assert warm.lookup("other-model", ["b"])[1] == [0]
+
+
+def test_models_are_selected_per_request_and_loaded_lazily(server):
+    with urllib.request.urlopen(f"{server}/health", timeout=5) as r:
+        assert list(json.loads(r.read())["models"]) == ["fake"]
+
+    assert _post(f"{server}/embed", {"text": "ab", "model": "bigger"})["embedding"] == [2.0, 1.0]
+    with urllib.request.urlopen(f"{server}/health", timeout=5) as r:
+        models = json.loads(r.read())["models"]
+    assert models["bigger"]["loaded"] and models["bigger"]["requests"] == 1
+    assert models["fake"]["requests"] == 0
+
+
+def test_unknown_models_are_refused_without_a_slot(server):
+    with pytest.raises(urllib.error.HTTPError) as err:
+        _post(f"{server}/embed", {"text": "ab", "model": "../../typo"})
+    assert err.value.code == 400
+    with urllib.request.urlopen(f"{server}/health", timeout=5) as r:
+        assert "../../typo" not in json.loads(r.read())["models"]
+
+
+def test_idle_models_are_evicted_under_the_memory_budget(monkeypatch):
+    from backend.daemon import model_server as ms
+
+    monkeypatch.setattr("backend.agents.model_registry.load_local", lambda name, **kw: _FakeEncoder())
+    monkeypatch.setattr(ms, "_resident_bytes", lambda encoder: 600 << 20)
+    pool = ms._ModelPool("default", ResultCache(), budget_bytes=1300 << 20, models=("a", "b"))
+    pool.preload("default")
+    pool.embed("a", ["x"])
+    pool.embed("b", ["yy"])  # default + a + b is over budget: a goes, default is pinned
+
+    stats = pool.stats()
+    assert stats["default"]["loaded"] and stats["b"]["loaded"]
+    assert not stats["a"]["loaded"]
+    assert pool.evictions == 1
+
+    assert pool.embed("a", ["zzz"]).tolist() == [[3.0, 1.0]]  # reloads on demand
+    assert pool.stats()["a"]["loads"] == 2
+    pool.close()
+
+
+def test_idle_models_unload_and_reload_on_next_request(monkeypatch):
+    from backend.daemon import model_server as ms
+
+    encoders = []
+
+    class _Unloadable(_FakeEncoder):
+        def __init__(self):
+            super().__init__()
+            self.unloaded = False
+            encoders.append(self)
+
+        def unload(self):
+            self.unloaded = True
+
+    monkeypatch.setattr("backend.agents.model_registry.load_local", lambda name, **kw: _Unloadable())
+    pool = ms._ModelPool("default", ResultCache(), budget_bytes=1 << 40, idle_timeout=0.05)
+    pool.preload("default")
+    assert pool.unload_idle() == []  # not idle long enough yet
+
+    time.sleep(0.1)
+    assert pool.unload_idle() == ["default"]
+    assert encoders[0].unloaded
+    assert pool.stats()["default"]["state"] == "unloaded"
+
+    assert pool.embed(None, ["ab"]).tolist() == [[2.0, 1.0]]
+    stats = pool.stats()["default"]
+    assert stats["state"] == "loaded" and stats["loads"] == 2 and stats["unloads"] == 1
+    pool.close()
+
+
+def test_a_failed_load_drops_the_slot_and_the_next_request_retries(monkeypatch):
+    from backend.daemon import model_server as ms
+
+    attempts = []
+
+    def flaky_load(name, **kw):
+        attempts.append(name)
+        if len(attempts) == 1:
+            raise OSError("download interrupted")
+        return _FakeEncoder()
+
+    monkeypatch.setattr("backend.agents.model_registry.load_local", flaky_load)
+    pool = ms._ModelPool("default", ResultCache(), budget_bytes=1 << 40)
+    with pytest.raises(OSError):
+        pool.embed(None, ["ab"])
+    assert "default" not in pool.stats()
+
+    assert pool.embed(None, ["ab"]).tolist() == [[2.0, 1.0]]
+    assert attempts == ["default", "default"] and pool.stats()["default"]["loads"] == 1
+    pool.close()
+
+
+@pytest.mark.skipif(not shm.available(), reason="no shared memory")
+def test_arena_close_unlinks_even_with_a_live_view():
+    from multiprocessing import shared_memory
+
+    arena = shm.ShmArena()
+    arena.ensure(1)
+    name = arena.name
+    seg = arena._seg
+    view = seg.buf[:8]  # an exported buffer makes SharedMemory.close() raise BufferError
+    arena.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+    view.release()
+    seg.close()
@@ -0,0 +1,103 @@
+import pickle
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from backend.agents import model_registry, model_weights
+
+
+class _FakeModel:
+    def __init__(self, name):
+        self.name = name
+        self.from_snapshot = False
+
+    def eval(self):
+        self.from_snapshot = True
+        return self
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    """torch / sentence_transformers stand-ins that count builds and snapshot loads."""
+    calls = {"built": [], "saved": 0, "loaded": 0}
+
+    def build(name):
+        time.sleep(0.05)  # long enough for concurrent callers to pile up on the lock
+        calls["built"].append(name)
+        return _FakeModel(name)
+
+    def save(model, path):
+        calls["saved"] += 1
+        with open(path, "wb") as f:
+            pickle.dump(model, f)
+
+    def load(path, map_location=None, mmap=False, weights_only=True):
+        calls["loaded"] += 1
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    torch = types.SimpleNamespace(__version__="2.3", save=save, load=load)
+    st = types.SimpleNamespace(__version__="3.0", SentenceTransformer=build)
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    monkeypatch.setitem(sys.modules, "sentence_transformers", st)
+    monkeypatch.delenv("SMARTSORT_MMAP_WEIGHTS", raising=False)
+    return calls
+
+
+def test_concurrent_callers_build_the_snapshot_once(fakes, tmp_path):
+    start = threading.Barrier(4)
+    models = []
+
+    def load():
+        start.wait()
+        models.append(model_weights.load_model("m", tmp_path))
+
+    threads = [threading.Thread(target=load) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert fakes["built"] == ["m"] and fakes["saved"] == 1
+    assert len(models) == 4 and all(m.from_snapshot for m in models)
+    assert [p.name for p in tmp_path.glob("*.pt")] == [model_weights.snapshot_path("m", tmp_path).name]
+
+
+@pytest.mark.parametrize("damage", ["garbage", "truncated"])
+def test_unreadable_snapshot_is_rebuilt(fakes, tmp_path, damage, capsys):
+    path = model_weights.prepare("m", tmp_path)
+    good = path.read_bytes()
+    path.write_bytes(b"not a pickle" if damage == "garbage" else good[: len(good) // 2])
+
+    model = model_weights.load_model("m", tmp_path)
+    assert model.from_snapshot
+    assert len(fakes["built"]) == 2
+    assert model_weights.load_snapshot(path) is not None  # the next process maps it directly
+    assert capsys.readouterr().out == ""  # the pipeline's stdout is its JSON channel
+
+
+def test_failed_rebuild_falls_back_to_a_private_copy(fakes, tmp_path, monkeypatch):
+    path = model_weights.prepare("m", tmp_path)
+    path.write_bytes(b"")
+    monkeypatch.setattr(model_weights, "save_snapshot", lambda model, path: None)  # disk full
+
+    model = model_weights.load_model("m", tmp_path)
+    assert isinstance(model, _FakeModel) and not model.from_snapshot
+
+
+def test_disabled_snapshots_skip_the_lock_and_torch_load(fakes, tmp_path, monkeypatch):
+    monkeypatch.setenv("SMARTSORT_MMAP_WEIGHTS", "0")
+
+    def no_lock(path):
+        raise AssertionError("flock taken with snapshots disabled")
+
+    monkeypatch.setattr(model_weights, "_flock", no_lock)
+    monkeypatch.setattr(model_weights, "SNAPSHOT_DIR", tmp_path)
+
+    assert not model_weights.load_model("m", tmp_path).from_snapshot
+    assert model_registry._LocalEncoder("m").model.name == "m"
+    assert fakes["loaded"] == 0 and fakes["saved"] == 0
+    assert not list(tmp_path.iterdir())
@@ -220,3 +220,149 @@ def test_watcher_no_overwrite_on_collision(watched_dir, cluster_dir, tmp_path, m
     renamed = cluster_dir / "report_1.txt"
     assert renamed.exists(), "Expected renamed file report_1.txt"
     assert renamed.read_text() == "new content"
+
+
+def test_handler_keeps_queuing_while_an_assignment_blocks(tmp_path):
+    """A slow assign() (e.g. the model reloading) must not stall event intake."""
+    from backend.daemon.watcher import _Handler
+
+    release = threading.Event()
+    seen = []
+
+    def slow_assign(path):
+        seen.append(Path(path).name)
+        release.wait(5)
+        return None
+
+    agent = _make_agent(None)
+    agent.assign.side_effect = slow_assign
+    handler = _Handler(agent=agent, recluster_size=100)
+
+    files = [tmp_path / f"f{i}.txt" for i in range(3)]
+    for f in files:
+        f.write_text("x")
+        handler._enqueue(str(f))  # returns immediately even though assign() is stuck
+    time.sleep(0.2)
+    assert seen == ["f0.txt"]
+    assert handler._work.qsize() == 2
+
+    release.set()
+    time.sleep(0.3)
+    handler.stop()
+    assert seen == ["f0.txt", "f1.txt", "f2.txt"]
+
+
+# ── incremental re-cluster ────────────────────────────────────────────────────
+
+class _TopicEmbedder:
+    """Stands in for EmbeddingAgent: a fixed vector per file name."""
+
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+
+    def embed_table(self, table):
+        import numpy as np
+
+        rows = [i for i, name in enumerate(table.names) if name in self.vectors]
+        table.set_embeddings(np.asarray(rows), np.array([self.vectors[table.names[i]] for i in rows]))
+        table.set_statuses(["embedded" if name in self.vectors else "error" for name in table.names])
+        return table
+
+
+def test_recluster_grows_a_folder_only_from_a_dense_queued_group(watched_dir, tmp_path, monkeypatch):
+    import numpy as np
+
+    from backend.agents.assignment_agent import AssignmentAgent
+    from backend.agents.extractor_router import ExtractorRouter
+    from backend.agents.index_manager import load_index, save_index
+    from backend.daemon.watcher import _Handler
+
+    monkeypatch.setattr("backend.agents.folder_naming_agent.CACHE_PATH", tmp_path / "names.json")
+    rng = np.random.default_rng(0)
+    centres = rng.standard_normal((3, 16))
+    near = lambda c, n: centres[c] + 0.05 * rng.standard_normal((n, 16))
+
+    # Existing sort: Invoices (0) and Resumes (1), five files each
+    index_dir = tmp_path / "index"
+    folders = {0: str(watched_dir / "Invoices"), 1: str(watched_dir / "Resumes")}
+    indexed = np.vstack([near(0, 5), near(1, 5)]).astype(np.float32)
+    paths = [f"{folders[c]}/f{c}_{i}.txt" for c in (0, 1) for i in range(5)]
+    save_index(indexed, np.repeat([0, 1], 5), paths, folders, output_dir=index_dir)
+
+    agent = AssignmentAgent.from_clusters(indexed, np.repeat([0, 1], 5), paths, folders)
+    agent.index_dir = index_dir
+    agent.extractor = ExtractorRouter()
+    agent.reload_index = MagicMock()
+
+    # Queue: four files of a new topic, two on the edge of Invoices, one stray
+    vectors = {}
+    for name, vec in zip(["tax_a.txt", "tax_b.txt", "tax_c.txt", "tax_d.txt"], near(2, 4)):
+        vectors[name] = vec
+    for name, vec in zip(["inv_x.txt", "inv_y.txt"], near(0, 2)):
+        vectors[name] = vec
+    vectors["stray.txt"] = rng.standard_normal(16)
+    agent.embedder = _TopicEmbedder(vectors)
+    queued = []
+    for name in vectors:
+        (watched_dir / name).write_text(f"{name} quarterly figures and notes")
+        queued.append(str(watched_dir / name))
+    _save_queue(queued)
+
+    handler = _Handler(agent=agent, recluster_size=len(queued))
+    handler._run_recluster(_load_queue())
+    handler.stop()
+
+    new_folders = [d for d in watched_dir.iterdir() if d.is_dir()]
+    assert len(new_folders) == 1
+    assert sorted(p.name for p in new_folders[0].iterdir()) == ["tax_a.txt", "tax_b.txt", "tax_c.txt", "tax_d.txt"]
+    assert sorted(Path(p).name for p in _load_queue()) == ["inv_x.txt", "inv_y.txt", "stray.txt"]
+    agent.reload_index.assert_called_once()
+
+    index, meta, centroids, cluster_folders = load_index(index_dir)
+    assert index.ntotal == len(meta) == 14
+    assert sorted(centroids) == [0, 1, 2]
+    assert cluster_folders[2] == str(new_folders[0])
+    assert {m["file_path"] for m in meta if m["cluster_id"] == 2} == {
+        str(new_folders[0] / n) for n in ("tax_a.txt", "tax_b.txt", "tax_c.txt", "tax_d.txt")}
+
+    log = [json.loads(line) for line in (tmp_path / "move_log.jsonl").read_text().splitlines()]
+    assert len(log) == 4 and {e["cluster_id"] for e in log} == {2}
+
+
+def test_failed_recluster_waits_for_another_batch(monkeypatch):
+    from backend.daemon.watcher import _Handler
+
+    def broken(self, paths):
+        raise RuntimeError("index unreadable")
+
+    monkeypatch.setattr("backend.daemon.recluster.IncrementalReclusterer.run", broken)
+    handler = _Handler(agent=_make_agent(None), recluster_size=20)
+    handler._run_recluster([f"/tmp/q{i}.txt" for i in range(25)])
+    handler.stop()
+    assert handler._recluster_at == 45
+
+
+def test_recluster_projects_through_the_indexs_reducer(monkeypatch):
+    import numpy as np
+
+    from backend.agents.clustering_agent import SemanticClusterer
+    from backend.agents.index_manager import normalize
+    from backend.agents.reducer import EmbeddingReducer
+    from backend.daemon.recluster import IncrementalReclusterer
+
+    rng = np.random.default_rng(1)
+    centres = rng.standard_normal((2, 16))
+    queued = normalize(np.vstack([c + 0.05 * rng.standard_normal((5, 16)) for c in centres]))
+    reducer = EmbeddingReducer("pca", 4).fit(queued)
+    seen = []
+    hdbscan = SemanticClusterer._hdbscan
+    monkeypatch.setattr(SemanticClusterer, "_hdbscan", lambda self, X: seen.append(X.shape) or hdbscan(self, X))
+
+    agent = MagicMock(index=None)
+    labels = IncrementalReclusterer(agent)._cluster(queued, reducer)
+    assert seen == [(10, 4)]  # projected, not refitted
+    assert len(set(labels[:5])) == len(set(labels[5:])) == 1 and labels[0] != labels[5] != -1
+
+    other = EmbeddingReducer("pca", 4).fit(rng.standard_normal((10, 8)))
+    IncrementalReclusterer(agent)._cluster(queued, other)  # different model: ignored
+    assert seen[-1] == (10, 16)